@@ -0,0 +1,60 @@
+"""Plays games with a small numpy MLP as the policy through run_policy, at batch size 1 (one call per decision) and
+larger, and reports decisions per second.
+
+    python -m benchmarks.bench_batched_policy
+"""
+import logging
+import time
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.batched_policy import run_policy
+from decapitate_the_spire.observation import MASK_LEN, OBSERVATION_LEN
+from decapitate_the_spire.replay import GameSpec
+
+NUM_GAMES = 64
+MAX_STEPS = 40
+BATCH_SIZES = (1, 8, 64)
+HIDDEN = 512
+
+
+class Mlp:
+    def __init__(self, seed: int):
+        rng = np.random.default_rng(seed)
+        self.w1 = rng.normal(0, 0.01, (OBSERVATION_LEN, HIDDEN)).astype(np.float32)
+        self.w2 = rng.normal(0, 0.01, (HIDDEN, HIDDEN)).astype(np.float32)
+        self.w3 = rng.normal(0, 0.01, (HIDDEN, MASK_LEN)).astype(np.float32)
+
+    def __call__(self, observations: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        h = np.maximum(observations.astype(np.float32) @ self.w1, 0)
+        h = np.maximum(h @ self.w2, 0)
+        logits = np.where(masks.reshape(len(masks), -1), h @ self.w3, -np.inf)
+        return np.stack(np.divmod(logits.argmax(axis=1), dg.ACTION_1_LEN), axis=1)
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    policy = Mlp(0)
+    for batch_size in BATCH_SIZES:
+        games = [
+            GameSpec(seed).create_game(dg.AutoResolvers.combat_only())
+            for seed in range(NUM_GAMES)
+        ]
+        calls = []
+
+        def counted(observations, masks):
+            calls.append(len(masks))
+            return policy(observations, masks)
+
+        start = time.perf_counter()
+        run_policy(games, counted, batch_size=batch_size, max_steps=MAX_STEPS)
+        elapsed = time.perf_counter() - start
+        print(
+            f"batch {batch_size:3d}: {sum(calls) / elapsed:6.0f} decisions/s, "
+            f"{len(calls)} policy calls averaging {np.mean(calls):.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compares MapGenerator/RoomTypeAssigner against MapLayout on the same seeds.
+
+    python -m benchmarks.bench_map_generation
+"""
+import logging
+import timeit
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+NUM_MAPS = 200
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    game = dg.Game(dg.TheSilent, dg.Exordium)
+    ctx = game.ctx
+    d = ctx.d
+
+    def node_map(seed: int):
+        rng = Rng(seed)
+        mapp = dg.MapGenerator.generate_dungeon(
+            dg.MAP_HEIGHT, dg.MAP_WIDTH, dg.MAP_PATH_DENSITY, rng
+        )
+        count = sum(
+            1
+            for row in mapp
+            for node in row
+            if node.has_edges() and node.y != len(mapp) - 2
+        )
+        room_list = d.generate_room_types(count)
+        dg.RoomTypeAssigner.assign_row_as_room_type(ctx, mapp[-1], dg.RestRoom)
+        dg.RoomTypeAssigner.assign_row_as_room_type(ctx, mapp[0], dg.MonsterRoom)
+        dg.RoomTypeAssigner.assign_row_as_room_type(ctx, mapp[8], dg.TreasureRoom)
+        dg.RoomTypeAssigner.distribute_rooms_across_map(ctx, rng, mapp, room_list)
+
+    def array_map(seed: int):
+        rng = Rng(seed)
+        layout = dg.MapLayout.generate(
+            dg.MAP_HEIGHT, dg.MAP_WIDTH, dg.MAP_PATH_DENSITY, rng
+        )
+        room_list = d.generate_room_types(layout.count_rooms_to_generate())
+        layout.assign_row_room_type(-1, dg.RestRoom)
+        layout.assign_row_room_type(0, dg.MonsterRoom)
+        layout.assign_row_room_type(8, dg.TreasureRoom)
+        layout.distribute_room_types(rng, [type(r) for r in room_list])
+
+    def array_map_with_nodes(seed: int):
+        array_map(seed)
+        # Dungeon#generate_map still hands the engine MapRoomNodes
+        dg.MapLayout.generate(
+            dg.MAP_HEIGHT, dg.MAP_WIDTH, dg.MAP_PATH_DENSITY, Rng(seed)
+        ).to_nodes(ctx)
+
+    def run(f):
+        return min(
+            timeit.repeat(
+                lambda: [f(seed) for seed in range(NUM_MAPS)], number=1, repeat=5
+            )
+        )
+
+    node_time = run(node_map)
+    array_time = run(array_map)
+    print(f"MapGenerator + RoomTypeAssigner: {1e6 * node_time / NUM_MAPS:8.1f} us/map")
+    print(
+        f"MapLayout:                       {1e6 * array_time / NUM_MAPS:8.1f} us/map"
+        f" ({node_time / array_time:.1f}x)"
+    )
+
+    layout = d.get_map_layout()
+    query_time = min(
+        timeit.repeat(
+            lambda: dg.MapLayout(
+                layout.room_type, layout.edges, layout.parents
+            ).mean_room_type_counts,
+            number=100,
+            repeat=5,
+        )
+    )
+    print(f"Path room type counts (uncached): {1e6 * query_time / 100:7.1f} us/map")
+
+
+if __name__ == "__main__":
+    main()
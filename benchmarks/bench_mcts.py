@@ -0,0 +1,118 @@
+"""Plays fixed encounters with CombatSearch choosing every action, and with TurnPlanner planning every turn, against
+random play as a baseline. Reports how fast each searches (simulations or nodes per second), win rate and average
+health left.
+
+    python -m benchmarks.bench_mcts
+"""
+import logging
+import os
+from typing import Callable, List, Tuple
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+from decapitate_the_spire.search import (
+    CombatSearch,
+    TurnPlanner,
+    eager_rollout,
+    is_in_combat,
+)
+
+# Returns the actions to take next, and how much searching (simulations or nodes) took how many seconds
+Decide = Callable[[dg.Game], Tuple[List[dg.ActionCoord], int, float]]
+
+ENCOUNTERS = [
+    dg.EncounterName.CULTIST,
+    dg.EncounterName.JAW_WORM,
+    dg.EncounterName.SMALL_SLIMES,
+    dg.EncounterName.GREMLIN_NOB,
+]
+NUM_GAMES = 3
+ITERATIONS = 50
+WORKERS = min(4, os.cpu_count() or 1)
+MAX_DECISIONS = 200
+
+
+def create_game(encounter: dg.EncounterName, seed: int) -> dg.Game:
+    def create_player(ctx: dg.CCG.Context):
+        return dg.TheSilent(ctx)
+
+    def create_dungeon(ctx: dg.CCG.Context):
+        return dg.SimpleDungeon(
+            ctx, lambda c: dg.MonsterHelper.get_encounter(c, encounter)
+        )
+
+    game = dg.Game(create_player, create_dungeon, seed=seed)
+    game.step(dg.ActionGenerator.pick_first_path(0))
+    return game
+
+
+def random_play(rng: Rng) -> Decide:
+    return lambda game: ([game.sample_legal_action(rng)], 0, 0.0)
+
+
+def mcts_play(search: CombatSearch) -> Decide:
+    def decide(game: dg.Game):
+        result = search.search(game, iterations=ITERATIONS, workers=WORKERS)
+        return [result.best_action], result.simulations, result.seconds
+
+    return decide
+
+
+def planner_play(planner: TurnPlanner) -> Decide:
+    def decide(game: dg.Game):
+        plan = planner.plan(game)
+        return plan.actions, plan.nodes, plan.seconds
+
+    return decide
+
+
+def play(game: dg.Game, decide: Decide):
+    """Plays the combat out, returning whether it was won, the player's health after, and the search stats (work,
+    seconds)."""
+    work = 0
+    seconds = 0.0
+    for _ in range(MAX_DECISIONS):
+        if not is_in_combat(game):
+            break
+        actions, n, s = decide(game)
+        work += n
+        seconds += s
+        game.step_many(actions)
+    won = not game.ctx.player.is_dead and not is_in_combat(game)
+    return won, game.ctx.player.current_health if won else 0, (work, seconds)
+
+
+def report(name: str, encounter: dg.EncounterName, decide: Decide, unit: str):
+    wins = 0
+    health = 0
+    work = 0
+    seconds = 0.0
+    for seed in range(NUM_GAMES):
+        won, h, (n, s) = play(create_game(encounter, seed), decide)
+        wins += won
+        health += h
+        work += n
+        seconds += s
+
+    rate = f"{work / seconds:6.0f} {unit}/s" if seconds else ""
+    print(
+        f"{encounter.name:<14} {name:<8} {wins}/{NUM_GAMES} won, {health / NUM_GAMES:4.1f} hp left  {rate}"
+    )
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    print(f"mcts: {ITERATIONS} iterations per decision, {WORKERS} workers")
+    for encounter in ENCOUNTERS:
+        report("random", encounter, random_play(Rng(0)), "")
+        report(
+            "mcts",
+            encounter,
+            mcts_play(CombatSearch(rollout_policy=eager_rollout, seed=0)),
+            "sims",
+        )
+        report("planner", encounter, planner_play(TurnPlanner(seed=0)), "nodes")
+
+
+if __name__ == "__main__":
+    main()
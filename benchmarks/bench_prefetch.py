@@ -0,0 +1,72 @@
+"""Steps a batch of games with auto-reset, sleeping between batch steps as a stand-in for policy inference, and
+reports batch step latency when new games are built on reset against taken from a GamePrefetcher.
+
+    python -m benchmarks.bench_prefetch
+"""
+import itertools
+import logging
+import time
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.prefetch import GamePrefetcher
+from decapitate_the_spire.replay import GameSpec
+from decapitate_the_spire.rng import Rng
+
+NUM_GAMES = 16
+NUM_BATCH_STEPS = 1000
+INFERENCE_SECONDS = 0.002
+PREFETCH_SIZE = 8
+
+
+def create_game(seed: int) -> dg.Game:
+    return GameSpec(seed).create_game(dg.AutoResolvers.combat_only())
+
+
+def run(reset, idle=lambda: None) -> np.ndarray:
+    seeds = itertools.count(NUM_GAMES)
+    games = [create_game(seed) for seed in range(NUM_GAMES)]
+    rng = Rng(0)
+    latencies = []
+    for _ in range(NUM_BATCH_STEPS):
+        idle()
+        time.sleep(INFERENCE_SECONDS)
+        start = time.perf_counter()
+        for i, game in enumerate(games):
+            _, is_terminal, _ = game.step(game.sample_legal_action(rng))
+            if is_terminal:
+                games[i] = reset(next(seeds))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1e3
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    direct = run(create_game)
+    with GamePrefetcher(
+        create_game, itertools.count(NUM_GAMES), size=PREFETCH_SIZE
+    ) as prefetcher:
+        prefetched = run(lambda seed: prefetcher.get())
+        hits = prefetcher.hits / (prefetcher.hits + prefetcher.misses)
+    # Filled between batch steps instead, the time it takes comes out of the inference wait here
+    with GamePrefetcher(
+        create_game, itertools.count(NUM_GAMES), size=PREFETCH_SIZE, background=False
+    ) as prefetcher:
+        filled = run(lambda seed: prefetcher.get(), prefetcher.fill)
+        fill_hits = prefetcher.hits / (prefetcher.hits + prefetcher.misses)
+
+    for name, latencies in (
+        ("built on reset", direct),
+        (f"thread ({hits:.0%} hits)", prefetched),
+        (f"fill ({fill_hits:.0%} hits)", filled),
+    ):
+        p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9])
+        print(
+            f"{name:18s} batch step ms: p50 {p50:5.2f}, p99 {p99:5.2f}, p99.9 {p999:5.2f}, "
+            f"max {latencies.max():5.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
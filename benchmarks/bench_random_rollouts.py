@@ -0,0 +1,63 @@
+"""Compares random rollouts that pick from the action mask against Game#sample_legal_action.
+
+    python -m benchmarks.bench_random_rollouts
+"""
+import logging
+import time
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+NUM_GAMES = 200
+MAX_STEPS = 500
+REPEAT = 5
+
+
+def create_game():
+    def create_player(ctx: dg.CCG.Context):
+        draw_pile = dg.CardGroup.explode_card_group_recipe_manifest(
+            {dg.DebugStrike.recipe(): 10}
+        )
+        return dg.TheSilent(ctx, 52, 3, draw_pile)
+
+    return dg.Game(create_player, dg.MiniDungeon)
+
+
+def pick_from_mask(game: dg.Game, rng: Rng) -> dg.ActionCoord:
+    legal = [
+        (i, j)
+        for i, action_1_slice in enumerate(game.generate_action_mask())
+        for j, is_legal in enumerate(action_1_slice)
+        if is_legal
+    ]
+    return legal[rng.random_from_0_to(len(legal) - 1)]
+
+
+def pick_sampled(game: dg.Game, rng: Rng) -> dg.ActionCoord:
+    return game.sample_legal_action(rng)
+
+
+def run(pick) -> float:
+    rng = Rng(0)
+    games = [create_game() for _ in range(NUM_GAMES)]
+    steps = 0
+    start = time.perf_counter()
+    for game in games:
+        for _ in range(MAX_STEPS):
+            _, is_terminal, _ = game.step(pick(game, rng))
+            steps += 1
+            if is_terminal:
+                break
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    mask = max(run(pick_from_mask) for _ in range(REPEAT))
+    sampled = max(run(pick_sampled) for _ in range(REPEAT))
+    print(f"mask:    {mask:9.0f} steps/s")
+    print(f"sampled: {sampled:9.0f} steps/s ({sampled / mask:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Steps a batch of games through a GameServer and in process, both with observations and masks for every step, and
+reports steps per second for each batch size, and bytes received per game step with and without delta frames.
+
+    python -m benchmarks.bench_server
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Tuple
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.observation import mask_many, observe_many
+from decapitate_the_spire.replay import GameSpec
+from decapitate_the_spire.server import Client, GameServer
+
+BATCH_SIZES = (1, 16, 64)
+NUM_STEPS = 2000
+
+
+def random_legal(masks: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    flat = [rng.choice(np.flatnonzero(m)) for m in masks.reshape(len(masks), -1)]
+    return np.stack(np.divmod(flat, dg.ACTION_1_LEN), axis=1)
+
+
+def in_process(batch_size: int) -> float:
+    games = [
+        GameSpec(seed).create_game(dg.AutoResolvers.combat_only())
+        for seed in range(batch_size)
+    ]
+    masks = mask_many(games).reshape(batch_size, dg.ACTION_0_LEN, dg.ACTION_1_LEN)
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(NUM_STEPS // batch_size):
+        for i, (game, action) in enumerate(
+            zip(games, random_legal(masks, rng).tolist())
+        ):
+            _, is_terminal, _ = game.step(tuple(action))
+            if is_terminal:
+                games[i] = GameSpec(i).create_game(dg.AutoResolvers.combat_only())
+        observe_many(games)
+        masks = mask_many(games).reshape(batch_size, dg.ACTION_0_LEN, dg.ACTION_1_LEN)
+    return NUM_STEPS / (time.perf_counter() - start)
+
+
+def remote(client: Client, batch_size: int) -> Tuple[float, float]:
+    ids = list(range(batch_size))
+    _, masks = client.reset(ids, ids)
+    bytes_received = client.bytes_received
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(NUM_STEPS // batch_size):
+        _, terminals, _, masks = client.step(ids, random_legal(masks, rng))
+        if terminals.any():
+            done = [i for i in ids if terminals[i]]
+            _, reset_masks = client.reset(done, done)
+            masks = masks.copy()
+            masks[done] = reset_masks
+    steps_per_second = NUM_STEPS / (time.perf_counter() - start)
+    return steps_per_second, (client.bytes_received - bytes_received) / NUM_STEPS
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = GameServer(
+            os.path.join(tmp, "dts.sock"),
+            auto_resolvers=dg.AutoResolvers.combat_only(),
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        for batch_size in BATCH_SIZES:
+            local = in_process(batch_size)
+            with Client(server.server_address) as client:
+                served, full_bytes = remote(client, batch_size)
+            with Client(server.server_address, delta=True) as client:
+                served_delta, delta_bytes = remote(client, batch_size)
+            print(
+                f"batch {batch_size:3d}: in process {local:5.0f} steps/s, "
+                f"served {served:5.0f} steps/s ({served / local:.0%}) with {full_bytes:4.0f} B/step, "
+                f"{served_delta:5.0f} steps/s with deltas at {delta_bytes:4.0f} B/step"
+            )
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
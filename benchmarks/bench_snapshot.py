@@ -0,0 +1,58 @@
+"""Times Game#dumps and Game#loads against Game#fork (deepcopy), the only other way to duplicate a game, and reports
+snapshot sizes. Plain pickle can't take a game at all, since card recipes and monster moves are closures.
+
+    python -m benchmarks.bench_snapshot
+"""
+import logging
+import time
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+NUM_GAMES = 10
+STEPS_IN = 20
+REPEAT = 50
+
+
+def create_game(seed: int) -> dg.Game:
+    game = dg.Game(
+        lambda ctx: dg.TheSilent(ctx),
+        dg.Exordium,
+        seed=seed,
+        auto_resolvers=dg.AutoResolvers.combat_only(),
+    )
+    rng = Rng(seed)
+    for _ in range(STEPS_IN):
+        _, is_terminal, _ = game.step(game.sample_legal_action(rng))
+        if is_terminal:
+            break
+    return game
+
+
+def per_call_ms(f) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        f()
+    return (time.perf_counter() - start) / REPEAT * 1e3
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    games = [create_game(seed) for seed in range(NUM_GAMES)]
+    snapshots = [g.dumps() for g in games]
+
+    fork = sum(per_call_ms(g.fork) for g in games) / NUM_GAMES
+    dumps = sum(per_call_ms(g.dumps) for g in games) / NUM_GAMES
+    loads = sum(per_call_ms(lambda: dg.Game.loads(s)) for s in snapshots) / NUM_GAMES
+    size = sum(len(s) for s in snapshots) / NUM_GAMES
+
+    print(f"fork:  {fork:6.2f} ms")
+    print(f"dumps: {dumps:6.2f} ms")
+    print(
+        f"loads: {loads:6.2f} ms ({fork / (dumps + loads):.1f}x fork for a round trip)"
+    )
+    print(f"size:  {size / 1024:6.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Times checking a planned combat action by listing every legal action, as Game#step used to, against checking just
+that action, and what Game#step_many costs per action either way.
+
+    python -m benchmarks.bench_step_many
+"""
+import logging
+import time
+from typing import List, Tuple
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+NUM_GAMES = 20
+REPEAT = 200
+
+
+def create_game(seed: int) -> dg.Game:
+    return dg.Game(
+        lambda ctx: dg.TheSilent(ctx),
+        dg.MiniDungeon,
+        seed=seed,
+        auto_resolvers=dg.AutoResolvers.combat_only(),
+    )
+
+
+def plan_turn(game: dg.Game, seed: int) -> List[dg.ActionCoord]:
+    """Random legal actions up to the end of the turn, played out on a fork."""
+    game = game.fork()
+    rng = Rng(seed)
+    plan = []
+    while isinstance(
+        game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+    ):
+        legal_actions = game.generate_legal_actions()
+        action = legal_actions[rng.random_from_0_to(len(legal_actions) - 1)]
+        plan.append(action)
+        _, is_terminal, _ = game.step(action)
+        if is_terminal or action == dg.ActionGenerator.end_turn():
+            break
+    return plan
+
+
+def to_first_combat(game: dg.Game) -> dg.Game:
+    rng = Rng(0)
+    while not isinstance(
+        game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+    ):
+        game.step(game.sample_legal_action(rng))
+    return game
+
+
+def per_call_us(f, repeat: int = REPEAT) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def time_step_many(
+    games_and_plans: List[Tuple[dg.Game, List[dg.ActionCoord]]],
+    validate_by_listing: bool,
+) -> float:
+    is_action_valid = dg.Game.is_action_valid
+    if validate_by_listing:
+        dg.Game.is_action_valid = lambda self, action: tuple(action) in self.generate_legal_actions()  # type: ignore
+    try:
+        elapsed = 0.0
+        num_actions = 0
+        for game, plan in games_and_plans:
+            forks = [game.fork() for _ in range(REPEAT // 10)]
+            start = time.perf_counter()
+            for fork in forks:
+                num_actions += fork.step_many(plan)[3]
+            elapsed += time.perf_counter() - start
+        return elapsed / num_actions * 1e6
+    finally:
+        dg.Game.is_action_valid = is_action_valid  # type: ignore
+
+
+def main():
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    games = [to_first_combat(create_game(seed)) for seed in range(NUM_GAMES)]
+    games_and_plans = [(game, plan_turn(game, seed)) for seed, game in enumerate(games)]
+
+    listing = 0.0
+    one = 0.0
+    num_actions = 0
+    for game, plan in games_and_plans:
+        for action in plan[:1]:
+            listing += per_call_us(
+                lambda: tuple(action) in game.generate_legal_actions()
+            )
+            one += per_call_us(lambda: game.is_action_valid(action))
+            num_actions += 1
+
+    print(f"check by listing:  {listing / num_actions:7.1f} us per action")
+    print(
+        f"check one action:  {one / num_actions:7.1f} us per action ({listing / one:.1f}x)"
+    )
+    before = time_step_many(games_and_plans, validate_by_listing=True)
+    after = time_step_many(games_and_plans, validate_by_listing=False)
+    print(f"step_many, listing: {before:7.1f} us per action")
+    print(f"step_many:          {after:7.1f} us per action ({before / after:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
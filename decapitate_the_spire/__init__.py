@@ -130,3 +130,17 @@ MONSTER_UNIVERSE = [
 MONSTER_TO_UNIVERSE_INDEX = {
     monster: index for index, monster in enumerate(MONSTER_UNIVERSE)
 }
+
+MAP_ROOM_UNIVERSE = [
+    decapitate_the_spire.game.MonsterRoom,
+    decapitate_the_spire.game.MonsterRoomElite,
+    decapitate_the_spire.game.MonsterRoomBoss,
+    decapitate_the_spire.game.EventRoom,
+    decapitate_the_spire.game.ShopRoom,
+    decapitate_the_spire.game.TreasureRoom,
+    decapitate_the_spire.game.RestRoom,
+]
+
+MAP_ROOM_TYPE_TO_UNIVERSE_INDEX = {
+    room_type: index for index, room_type in enumerate(MAP_ROOM_UNIVERSE)
+}
@@ -1,8 +1,11 @@
+import argparse
 import logging
 import sys
 from typing import List
 
 from decapitate_the_spire import game as dg
+from decapitate_the_spire import server
+from decapitate_the_spire.layout_cache import DungeonLayoutCache
 
 
 def without_all_false_rows_at_end(mask: List[List[bool]]):
@@ -22,7 +25,7 @@ def pretty_print_action_mask(mask: List[List[bool]]):
         print()
 
 
-def main():
+def play():
     logger = logging.getLogger("dts")
     logger.setLevel(logging.DEBUG)
     handler = logging.StreamHandler(sys.stdout)
@@ -97,5 +100,57 @@ def main():
     print("Game over")
 
 
+def serve(args: argparse.Namespace):
+    logging.getLogger("dts").setLevel(logging.WARNING)
+    print(f"Serving {args.player} in {args.dungeon} on {args.socket}")
+    try:
+        server.serve(
+            args.socket,
+            player=args.player,
+            dungeon=args.dungeon,
+            relics=args.relic,
+            auto_resolvers=dg.AutoResolvers.combat_only() if args.combat_only else None,
+            layout_cache=DungeonLayoutCache(args.layout_cache)
+            if args.layout_cache
+            else None,
+            full_frame_every=args.full_frame_every,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m decapitate_the_spire")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("play", help="Play in the console (the default)")
+    serve_parser = commands.add_parser(
+        "serve", help="Host games for another process, see server.py"
+    )
+    serve_parser.add_argument("--socket", required=True, help="Unix socket path")
+    serve_parser.add_argument("--player", default="TheSilent")
+    serve_parser.add_argument("--dungeon", default="Exordium")
+    serve_parser.add_argument(
+        "--relic", action="append", default=[], help="Starting relic, repeatable"
+    )
+    serve_parser.add_argument(
+        "--combat-only",
+        action="store_true",
+        help="Resolve requests outside of combat automatically",
+    )
+    serve_parser.add_argument("--layout-cache", help="DungeonLayoutCache file")
+    serve_parser.add_argument(
+        "--full-frame-every",
+        type=int,
+        default=64,
+        help="Delta frames a game gets between full ones",
+    )
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+    else:
+        play()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+"""Games as asyncio coroutines, so thousands can share one event loop with async inference clients.
+
+    async def play(game: AsyncGame, policy):
+        while (decision := await game.next_request()) is not None:
+            action = await policy.act(observe(game.game), decision.action_mask())
+            await decision.respond(action)
+
+The engine already stops at every PlayerRequest: Dungeon#update returns early while the outstanding request
+is_waiting_for_response, and Game#step runs it on to the next one. A Decision is that stop, handed out as an awaitable
+point instead. Running the engine between decisions is plain CPU work with nothing to wait on, so it happens inline in
+respond, which then yields to the event loop so that other games get their turn. There's no thread per game.
+"""
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+
+import decapitate_the_spire.game as dg
+
+
+class Decision:
+    """A PlayerRequest waiting on its game's response. Respond once, with respond or respond_selection."""
+
+    def __init__(self, game: "AsyncGame", request: dg.PlayerRequest):
+        self.game = game
+        self.request = request
+        self.result: Optional[Tuple[float, bool, dict]] = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.request})"
+
+    @property
+    def is_answered(self) -> bool:
+        return self.result is not None
+
+    def action_mask(self) -> List[List[bool]]:
+        return self.game.game.generate_action_mask()
+
+    def legal_actions(self) -> List[dg.ActionCoord]:
+        return self.game.game.generate_legal_actions()
+
+    async def respond(self, action: dg.ActionCoord) -> Tuple[float, bool, dict]:
+        """Steps the game with action (see Game#step) and returns what step did."""
+        return await self._answer(lambda game: game.step(action))
+
+    async def respond_selection(
+        self, selection: Sequence[bool]
+    ) -> Tuple[float, bool, dict]:
+        """Steps the game with a whole selection (see Game#step_selection)."""
+        return await self._answer(lambda game: game.step_selection(selection))
+
+    async def _answer(self, step) -> Tuple[float, bool, dict]:
+        if self.is_answered:
+            raise ValueError(f"{self} was already answered")
+        if self.game.decision is not self:
+            raise ValueError(f"{self} is no longer the game's outstanding decision")
+        self.result = step(self.game.game)
+        self.game.decision = None
+        # Let other games run before this one asks for its next decision
+        await asyncio.sleep(0)
+        return self.result
+
+
+class AsyncGame:
+    """Wraps a Game for asyncio. Only the Decision from next_request steps it, so don't step game directly meanwhile."""
+
+    def __init__(self, game: dg.Game):
+        self.game = game
+        self.decision: Optional[Decision] = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.decision})"
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Decision:
+        decision = await self.next_request()
+        if decision is None:
+            raise StopAsyncIteration
+        return decision
+
+    async def next_request(self) -> Optional[Decision]:
+        """The decision the game is waiting on, or None once it's over. Until the decision is answered, this gives
+        the same one."""
+        if self.game.game_over:
+            return None
+        if self.decision is None:
+            request = self.game.ctx.action_manager.outstanding_request
+            assert request is not None and request.is_waiting_for_response
+            self.decision = Decision(self, request)
+        return self.decision
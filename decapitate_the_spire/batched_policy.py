@@ -0,0 +1,146 @@
+"""Runs many games against one policy, calling it once per batch of decisions rather than once per decision.
+
+    def policy(observations, masks):
+        # observations: int16 (n, OBSERVATION_LEN), masks: bool (n, ACTION_0_LEN, ACTION_1_LEN)
+        return model(observations, masks)  # (n, 2) action coords
+
+    total_rewards = run_policy(games, policy, batch_size=64, timeout=0.005)
+
+Each game is an AsyncGame in one event loop. At every decision it parks in BatchedPolicy#act, and the waiting games
+are handed to the policy together once batch_size of them are waiting, every game still playing is waiting, or
+timeout seconds have passed since the first of them arrived. The policy may also be a coroutine function, so it can
+await a remote model while the loop keeps going.
+"""
+import asyncio
+import inspect
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.async_game import AsyncGame
+from decapitate_the_spire.observation import mask_many, observe_many
+
+# (observations, masks) -> action coords, or an awaitable of them
+Policy = Callable[[np.ndarray, np.ndarray], Any]
+# A game waiting in BatchedPolicy#act, and where its action goes
+_Waiting = Tuple[dg.Game, "asyncio.Future[dg.ActionCoord]"]
+
+
+class BatchedPolicy:
+    """Collects decisions from games for batched calls of policy. See the module doc.
+
+    Games that use it should join before their first act and leave when done, so that a batch isn't held up waiting
+    for games that won't come. num_batches and num_decisions count the calls made and the decisions they answered.
+    """
+
+    def __init__(
+        self, policy: Policy, batch_size: int = 64, timeout: Optional[float] = 0.005
+    ):
+        self.policy = policy
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.num_players = 0
+        self.num_batches = 0
+        self.num_decisions = 0
+        self._waiting: List[_Waiting] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: Set[asyncio.Task] = set()
+
+    def join(self, num_players: int = 1):
+        self.num_players += num_players
+
+    def leave(self, num_players: int = 1):
+        self.num_players -= num_players
+        self._flush_if_full()
+
+    async def act(self, game: dg.Game) -> dg.ActionCoord:
+        """The policy's action for game, once its batch has been run."""
+        future: "asyncio.Future[dg.ActionCoord]" = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._waiting.append((game, future))
+        if (
+            not self._flush_if_full()
+            and self._timer is None
+            and self.timeout is not None
+        ):
+            self._timer = asyncio.get_running_loop().call_later(
+                self.timeout, self._flush
+            )
+        return await future
+
+    def _flush_if_full(self) -> bool:
+        if self._waiting and len(self._waiting) >= min(
+            self.batch_size, max(self.num_players, 1)
+        ):
+            self._flush()
+            return True
+        return False
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiting:
+            batch = self._waiting[: self.batch_size]
+            self._waiting = self._waiting[self.batch_size :]
+            task = asyncio.ensure_future(self._run(batch))
+            # The loop only keeps weak references to tasks
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[_Waiting]):
+        games = [game for game, _ in batch]
+        try:
+            observations = observe_many(games)
+            masks = mask_many(games).reshape(-1, dg.ACTION_0_LEN, dg.ACTION_1_LEN)
+            actions = self.policy(observations, masks)
+            if inspect.isawaitable(actions):
+                actions = await actions
+            actions = np.asarray(actions).reshape(len(batch), 2).tolist()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.num_batches += 1
+        self.num_decisions += len(batch)
+        for (_, future), (action_0, action_1) in zip(batch, actions):
+            future.set_result((action_0, action_1))
+
+
+async def play_games(
+    games: Sequence[dg.Game], policy: BatchedPolicy, max_steps: Optional[int] = None
+) -> List[float]:
+    """Plays each game until it's over (or for max_steps decisions) with actions from policy. Returns each game's
+    total reward."""
+
+    async def play(game: dg.Game) -> float:
+        total_reward = 0.0
+        steps = 0
+        try:
+            async for decision in AsyncGame(game):
+                if max_steps is not None and steps == max_steps:
+                    break
+                reward, _, _ = await decision.respond(await policy.act(game))
+                total_reward += reward
+                steps += 1
+        finally:
+            policy.leave()
+        return total_reward
+
+    policy.join(len(games))
+    return list(await asyncio.gather(*(play(game) for game in games)))
+
+
+def run_policy(
+    games: Sequence[dg.Game],
+    policy: Policy,
+    batch_size: int = 64,
+    timeout: Optional[float] = 0.005,
+    max_steps: Optional[int] = None,
+) -> List[float]:
+    """play_games in a new event loop, for callers that aren't async themselves."""
+    return asyncio.run(
+        play_games(games, BatchedPolicy(policy, batch_size, timeout), max_steps)
+    )
@@ -2,22 +2,27 @@ from __future__ import annotations
 
 import copy
 import functools
+import hashlib
+import itertools
 import logging
+import math
 import os
 import pprint
-import random
 import uuid
 from abc import ABC, ABCMeta, abstractmethod
-from collections import deque
+from collections import Counter, deque
 from enum import Enum
 from typing import (
+    TYPE_CHECKING,
     Any,
     Callable,
     Deque,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
+    Sequence,
     Set,
     Tuple,
     Type,
@@ -26,9 +31,18 @@ from typing import (
     final,
 )
 
+import numpy as np
+
 import decapitate_the_spire as dts
-from decapitate_the_spire.rng import Rng
+from decapitate_the_spire import snapshot
+from decapitate_the_spire.rng import Rng, ScriptedRng, enumerate_scripts
+
+if TYPE_CHECKING:
+    from decapitate_the_spire.layout_cache import DungeonLayoutCache
 
+# Bump this whenever a change makes a given seed play out differently. Anything saved against an older engine (like
+# cached dungeon layouts) gets ignored.
+ENGINE_VERSION = 2
 MAX_HAND_SIZE = 10
 MAX_NUM_MONSTERS_IN_GROUP = 5
 MAX_CHARACTER_HEALTH = 1000
@@ -48,6 +62,8 @@ MONSTER_MAX_NUM_MOVES = 10
 MAP_HEIGHT = 15
 MAP_WIDTH = 7
 MAP_PATH_DENSITY = 6
+# The rngs that combat outcomes are rolled on: monster moves, shuffles, random cards and targets, and the rest.
+COMBAT_RNG_NAMES = ("ai_rng", "shuffle_rng", "card_random_rng", "misc_rng")
 
 ACTION_0_LEN = 1 + MAX_HAND_SIZE + 2 * MAX_POTION_SLOTS
 ACTION_1_LEN = 1 + MAX_NUM_MONSTERS_IN_GROUP
@@ -103,13 +119,84 @@ class GameMode(Enum):
     DUNGEON_TRANSITION = 2
 
 
+class ChanceKind(Enum):
+    SHUFFLE = 0
+    MONSTER_MOVE = 1
+    RANDOM_CARD = 2
+    RANDOM_MONSTER = 3
+
+
+class ChanceEvent:
+    """A roll the engine is about to make, passed to CCG.Context#chance_handler first. The handler can look at what
+    might happen, and force an outcome by returning it. Returning None lets the roll happen as usual. Forced outcomes
+    don't draw from the rng.
+
+    outcomes lists what can happen and probabilities how likely each one is: moves for MONSTER_MOVE, cards for
+    RANDOM_CARD and monsters for RANDOM_MONSTER. These are forced by index into outcomes. For SHUFFLE, outcomes are the
+    cards in their order before the shuffle, every order is equally likely, and probabilities is None. A shuffle is
+    forced with the new order, as indexes into outcomes from bottom to top.
+
+    Once rolled, outcome holds what happened in the same form, and probability how likely it was.
+    """
+
+    def __init__(
+        self,
+        kind: ChanceKind,
+        source: Any,
+        outcomes: Sequence[Any],
+        probabilities: Optional[Sequence[float]],
+    ):
+        self.kind = kind
+        # What's rolling: the monster, card group or action
+        self.source = source
+        self.outcomes = outcomes
+        self.probabilities = probabilities
+        self.outcome: Optional[Union[int, Tuple[int, ...]]] = None
+        self.probability: Optional[float] = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.kind.name}, {len(self.outcomes)} outcomes, outcome {self.outcome})"
+
+    def checked_outcome(self, forced: Any) -> Union[int, Tuple[int, ...]]:
+        if self.kind == ChanceKind.SHUFFLE:
+            order = tuple(forced)
+            if sorted(order) != list(range(len(self.outcomes))):
+                raise ValueError(
+                    f"{order} isn't an order of {len(self.outcomes)} cards"
+                )
+            return order
+        if not 0 <= forced < len(self.outcomes):
+            raise ValueError(
+                f"Outcome {forced} out of range for {len(self.outcomes)} outcomes"
+            )
+        return forced
+
+    def resolve(
+        self, outcome: Union[int, Tuple[int, ...]], probability: Optional[float] = None
+    ):
+        if probability is None:
+            # Only shuffles have no probabilities, and they pass theirs in
+            assert self.probabilities is not None and isinstance(outcome, int)
+            probability = self.probabilities[outcome]
+        self.outcome = outcome
+        self.probability = probability
+
+
+ChanceHandler = Callable[[ChanceEvent], Any]
+
+
 class CCG:
     """CardCrawlGame... the static-est of statics"""
 
     class Context:
-        def __init__(self):
+        def __init__(self, seed=None):
             # noinspection PyTypeChecker
             self.d: Dungeon = None
+            # Every rng is seeded from this, so a seed fixes the whole game for a given sequence of actions. None
+            # leaves them all on the module level generator.
+            self.seed = seed
+            # See DungeonLayoutCache
+            self.layout_cache: Optional[DungeonLayoutCache] = None
             self.combat_reward_screen = CombatRewardScreen(self)
             # TODO Source inits this to CHAR_SELECT and calls onEquip on starter relics under that mode
             self.mode = GameMode.CHAR_SELECT
@@ -128,21 +215,32 @@ class CCG:
             self.screen = Screen.NONE
             self.action_manager = ActionManager(self)
 
-            self.monster_hp_rng = Rng()
-            self.ai_rng = Rng()
-            self.shuffle_rng = Rng()
-            self.card_rng = Rng()
-            self.card_random_rng = Rng()
-            self.misc_rng = Rng()
-            self.map_rng = Rng()
-            self.treasure_rng = Rng()
-            self.relic_rng = Rng()
-            self.potion_rng = Rng()
-            self.monster_rng = Rng()
-            self.event_rng = Rng()
+            self.monster_hp_rng = self.create_rng("monster_hp")
+            self.ai_rng = self.create_rng("ai")
+            self.shuffle_rng = self.create_rng("shuffle")
+            self.card_rng = self.create_rng("card")
+            self.card_random_rng = self.create_rng("card_random")
+            self.misc_rng = self.create_rng("misc")
+            self.map_rng = self.create_rng("map")
+            self.treasure_rng = self.create_rng("treasure")
+            self.relic_rng = self.create_rng("relic")
+            self.potion_rng = self.create_rng("potion")
+            self.monster_rng = self.create_rng("monster")
+            self.event_rng = self.create_rng("event")
+
+            # See ChanceEvent. None skips building events, which isn't free.
+            self.chance_handler: Optional[ChanceHandler] = None
 
             # Various things that source sticks on classes statically
             self.blizzard_potion_mod = 0
+            # How likely a ? room is to be each of these rather than an event. See EventHelper#roll
+            self.event_chances = dict(EventHelper.CHANCES)
+            # See CombatStateKey
+            self.cached_combat_state_key: Optional[int] = None
+
+        def create_rng(self, name: str) -> Rng:
+            # Source keeps one seed and offsets it per rng. String seeds get us independent streams without that.
+            return Rng(None if self.seed is None else f"{self.seed}:{name}")
 
         def is_screen_up(self):
             return self.action_manager.outstanding_request is not None
@@ -158,6 +256,9 @@ class CCG:
         def update(self) -> bool:
             # TODO woefully incomplete
 
+            # Everything the engine does to the state happens in here
+            self.cached_combat_state_key = None
+
             # This is not source
             # if self.ctx.is_very_beginning:
             #     self.ctx.is_very_beginning = False
@@ -174,7 +275,6 @@ class CCG:
                 self.mode = GameMode.GAMEPLAY
 
             elif self.mode == GameMode.GAMEPLAY:
-
                 if self.is_transitioning_dungeon:
                     did_something = True
                     # create dungeon, set on CCG
@@ -1191,7 +1291,9 @@ Map = List[List[MapRoomNode]]
 MapCoord = Tuple[int, int]
 ActionCoord = Tuple[int, int]
 ActionCoordConsumer = Callable[[ActionCoord], None]
+AutoResolver = Callable[["PlayerRequest"], ActionCoord]
 ActionMaskSlices = List[List[bool]]
+Selection = Tuple[bool, ...]
 
 
 class ActionMask:
@@ -1257,7 +1359,6 @@ class ActionDispatcher:
         use_potion_handler: ActionCoordConsumer,
         discard_potion_handler: ActionCoordConsumer,
     ):
-
         # target_index = action[1] if action[1] < MAX_NUM_MONSTERS_IN_GROUP else None
 
         action_dim_0 = action[0]
@@ -1370,6 +1471,15 @@ class ActionGenerator:
             raise Exception()
         return cls.play_card(i, None)
 
+    @classmethod
+    def pick_analyzed_path(
+        cls,
+        request: Union[FirstPathChoiceRequest, PathChoiceRequest],
+        analyzer: MapAnalyzer,
+        worst: bool = False,
+    ):
+        return cls.play_card(analyzer.path_choice_index(request, worst), None)
+
     @classmethod
     def pick_simple_combat_reward(cls, reward_index: int):
         return cls.play_card(reward_index, None)
@@ -1424,10 +1534,103 @@ class ActionGenerator:
         return cls.play_card(relic_index, None)
 
 
+class AutoResolvers:
+    """Built-in resolvers for Game#auto_resolvers. Each method returns a resolver: a callable that takes the
+    outstanding request and returns the action to answer it with."""
+
+    @classmethod
+    def combat_only(cls) -> Dict[Type[PlayerRequest], AutoResolver]:
+        """Resolvers for every request outside of combat, for agents that only learn to fight."""
+        return {
+            SimpleChoiceEventRequest: cls.first_legal_action(),
+            FirstPathChoiceRequest: cls.leftmost_path(),
+            PathChoiceRequest: cls.leftmost_path(),
+            BossPathChoiceRequest: cls.leftmost_path(),
+            CombatRewardRequest: cls.take_rewards(),
+            CampfireRequest: cls.rest_below(0.5),
+            GridSelectRequest: cls.first_legal_action(),
+        }
+
+    @classmethod
+    def first_legal_action(cls) -> AutoResolver:
+        def resolve(request: PlayerRequest):
+            return request.generate_legal_actions()[0]
+
+        return resolve
+
+    @classmethod
+    def leftmost_path(cls) -> AutoResolver:
+        # Legal actions list left before center before right, and first path choices by column.
+        return cls.first_legal_action()
+
+    @classmethod
+    def best_path(
+        cls, weights: Optional[Dict[Type[Room], float]] = None, worst: bool = False
+    ) -> AutoResolver:
+        def resolve(request: PlayerRequest):
+            if isinstance(request, BossPathChoiceRequest):
+                return ActionGenerator.go_to_boss()
+            assert isinstance(request, (FirstPathChoiceRequest, PathChoiceRequest))
+            analyzer = request.ctx.d.get_map_analyzer(weights)
+            return ActionGenerator.pick_analyzed_path(request, analyzer, worst)
+
+        return resolve
+
+    @classmethod
+    def random_legal_action(cls, rng: Rng) -> AutoResolver:
+        def resolve(request: PlayerRequest):
+            return request.sample_legal_action(rng)
+
+        return resolve
+
+    @classmethod
+    def take_rewards(
+        cls, reward_types: Tuple[Type[RewardItem], ...] = (GoldRewardItem,)
+    ) -> AutoResolver:
+        """Claims every reward of the given types (the first card, for card rewards), then leaves."""
+
+        def resolve(request: PlayerRequest):
+            assert isinstance(request, CombatRewardRequest)
+            for reward_index, reward in enumerate(request.rewards):
+                if not isinstance(reward, reward_types):
+                    continue
+                action_1 = next(
+                    (i for i, legal in enumerate(reward.to_mask_slice()) if legal),
+                    None,
+                )
+                if action_1 is not None:
+                    return ActionGenerator.play_card(reward_index, action_1)
+            return ActionGenerator.end_combat_reward()
+
+        return resolve
+
+    @classmethod
+    def rest_below(cls, health_fraction: float) -> AutoResolver:
+        """Rests if the player's health is below health_fraction of max, otherwise smiths. Falls back to whichever
+        option is usable."""
+
+        def resolve(request: PlayerRequest):
+            assert isinstance(request, CampfireRequest)
+            player = request.ctx.player
+            preferred: Tuple[Type[CampfireOption], ...]
+            if player.current_health < health_fraction * player.max_health:
+                preferred = (RestOption, SmithOption)
+            else:
+                preferred = (SmithOption, RestOption)
+            for option_type in preferred:
+                for i, op in enumerate(request.options):
+                    if isinstance(op, option_type) and op.usable:
+                        return ActionGenerator.play_card(i, None)
+            return request.generate_legal_actions()[0]
+
+        return resolve
+
+
 class PlayerRequest(ABC):
     def __init__(self, ctx: CCG.Context):
         self.ctx = ctx
         self._action_response: Optional[ActionCoord] = None
+        self._selection_response: Optional[Selection] = None
 
     def __repr__(self):
         return f"{self.__class__.__name__}"
@@ -1440,13 +1643,24 @@ class PlayerRequest(ABC):
         logger.debug(f"Recorded response {action} for {self}")
         self._action_response = action
 
+    def set_selection_response(self, selection: Selection):
+        logger.debug(f"Recorded selection {selection} for {self}")
+        self._selection_response = selection
+
     @property
     def is_waiting_for_response(self) -> bool:
-        return self._action_response is None
+        return self._action_response is None and self._selection_response is None
 
     @final
     # def execute(self, action: ActionCoord):
     def execute(self):
+        if self._selection_response is not None:
+            selection = self._selection_response
+            # Selections always finish the request, nothing responds to it afterwards.
+            self._selection_response = None
+            self.handle_selection(selection)
+            return
+
         assert self._action_response is not None
         ActionDispatcher.dispatch(
             self._action_response,
@@ -1468,10 +1682,46 @@ class PlayerRequest(ABC):
     def handle_destroy_potion_action(self, action: ActionCoord):
         raise Exception()
 
+    def is_selection_valid(self, selection: Selection) -> bool:
+        """Whether selection is a legal answer to this request in one go, see Game#step_selection. Only requests that
+        pick several things from a list accept selections."""
+        return False
+
+    def handle_selection(self, selection: Selection):
+        raise Exception()
+
+    @staticmethod
+    def _selected_indexes(
+        selection: Selection, num_items: int, max_items: int
+    ) -> Optional[List[int]]:
+        # Selections cover either the items on offer or the most there can be. Anything past the items must be unset.
+        if len(selection) not in (num_items, max_items) or any(selection[num_items:]):
+            return None
+        return [i for i, selected in enumerate(selection) if selected]
+
     @abstractmethod
     def generate_action_mask(self) -> ActionMask:
         ...
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        """Every action the mask allows, in mask order. Requests override this to list them without building the
+        mask."""
+        return [
+            (i, j)
+            for i, action_1_slice in enumerate(self.generate_action_mask().to_raw())
+            for j, legal in enumerate(action_1_slice)
+            if legal
+        ]
+
+    def is_action_legal(self, action: ActionCoord) -> bool:
+        """Whether generate_legal_actions would list action. Requests override this to check just the one action."""
+        return tuple(action) in self.generate_legal_actions()
+
+    def sample_legal_action(self, rng: Rng) -> ActionCoord:
+        actions = self.generate_legal_actions()
+        assert actions, f"No legal actions for {self}"
+        return actions[rng.random_from_0_to(len(actions) - 1)]
+
     def throwing_handler(self, _):
         raise Exception()
 
@@ -1498,11 +1748,19 @@ class Game:
         self,
         create_player: Callable[[CCG.Context], Player],
         create_dungeon: Callable[[CCG.Context], Dungeon],
-        relics: Callable[[CCG.Context], List[Relic]] = None,
+        relics: Optional[Callable[[CCG.Context], List[Relic]]] = None,
+        seed: Optional[int] = None,
+        layout_cache: Optional[DungeonLayoutCache] = None,
+        auto_resolvers: Optional[Dict[Type[PlayerRequest], AutoResolver]] = None,
     ):
         self.logger = logging.getLogger("dts.Game")
+        # Requests of these types are answered by the engine instead of being returned from step. See AutoResolvers.
+        self.auto_resolvers: Dict[Type[PlayerRequest], AutoResolver] = {}
+        for request_type, resolver in (auto_resolvers or {}).items():
+            self.set_auto_resolver(request_type, resolver)
         self.step_has_been_called = False
-        self.ctx = CCG.Context()
+        self.ctx = CCG.Context(seed)
+        self.ctx.layout_cache = layout_cache
         # CCG.ctx = self.ctx
 
         player = create_player(self.ctx)
@@ -1532,6 +1790,7 @@ class Game:
         # room" methods in ProceedButton.
         # self.dungeon = CCG.ctx.d
         self.history = []
+        self._auto_resolve()
 
     def __repr__(self):
         if self.game_over_and_won is None:
@@ -1548,6 +1807,34 @@ class Game:
             return "Game over: loss"
 
     def step(self, action: ActionCoord) -> Tuple[float, bool, dict]:
+        return self._step(
+            action,
+            self.is_action_valid(action),
+            lambda request: request.set_response(action),
+        )
+
+    def step_selection(self, selection: Sequence[bool]) -> Tuple[float, bool, dict]:
+        """Answers a DiscardRequest or GridSelectRequest with every pick at once, instead of one step per card.
+
+        selection flags the chosen cards by index into the hand (DiscardRequest) or the offered cards
+        (GridSelectRequest), and may be padded with False up to the most there can be. It has to satisfy the request
+        on its own: the remaining num_cards exactly, or any number (at least one unless zero is allowed). Otherwise
+        it's pinched like an illegal step. A valid selection is applied as a whole, including stopping.
+        """
+        selection = tuple(bool(s) for s in selection)
+        request = self.ctx.action_manager.outstanding_request
+        return self._step(
+            selection,
+            request is not None and request.is_selection_valid(selection),
+            lambda r: r.set_selection_response(selection),
+        )
+
+    def _step(
+        self,
+        action: Union[ActionCoord, Selection],
+        is_valid: bool,
+        respond: Callable[[PlayerRequest], None],
+    ) -> Tuple[float, bool, dict]:
         self.step_has_been_called = True
         reward = 0.0
         is_terminal = False
@@ -1564,7 +1851,7 @@ class Game:
         start_player_health = self.ctx.player.current_health
 
         # Ensure action is valid
-        if not self.is_action_valid(action):
+        if not is_valid:
             # reward, is_terminal, info = self._pinch(action)
             # logger.debug(f'Rewarding {reward} for illegal move, now {reward}')
             # assert False
@@ -1574,33 +1861,39 @@ class Game:
             # reward += 0.001
             # Only set response if action is valid, right?
             if self.ctx.action_manager.outstanding_request:
-                self.ctx.action_manager.outstanding_request.set_response(action)
+                respond(self.ctx.action_manager.outstanding_request)
 
             logger.debug("Before dungeon update")
             while self.ctx.update() and not self.ctx.player.is_dead:
                 ...
-            logger.debug(f"After dungeon update:{os.linesep}{self}")
+            # Auto resolved actions come after this one, so it goes in history ahead of them
+            history_index = len(self.history)
+            self._auto_resolve()
+            if logger.isEnabledFor(logging.DEBUG):
+                # Game's repr walks the whole player and monster state, so skip it unless it'll be logged.
+                logger.debug(f"After dungeon update:{os.linesep}{self}")
 
             # assert CCG.d is self.ctx.d
             # assert CCG.player is self.ctx.player
             if self.ctx.player.is_dead:
                 logger.debug("Player is dead, returning loss")
-                self.history.append(
-                    (action, self.ctx.action_manager.outstanding_request)
+                self.history.insert(
+                    history_index, (action, self.ctx.action_manager.outstanding_request)
                 )
                 return self._loss()
             elif isinstance(
                 self.ctx.action_manager.outstanding_request, BossChestRequest
             ):
                 logger.debug("Boss beat, returning win")
-                self.history.append(
-                    (action, self.ctx.action_manager.outstanding_request)
+                self.history.insert(
+                    history_index, (action, self.ctx.action_manager.outstanding_request)
                 )
                 return self._win()
             else:
                 if self.ctx.action_manager.outstanding_request is None:
-                    self.history.append(
-                        (action, self.ctx.action_manager.outstanding_request)
+                    self.history.insert(
+                        history_index,
+                        (action, self.ctx.action_manager.outstanding_request),
                     )
                     print(self.ctx.d)
                     assert False
@@ -1620,9 +1913,77 @@ class Game:
             health_change_reward_multiplier = 1
             reward += player_health_change * health_change_reward_multiplier
 
-        self.history.append((action, self.ctx.action_manager.outstanding_request))
+        self.history.insert(
+            history_index, (action, self.ctx.action_manager.outstanding_request)
+        )
         return reward, is_terminal, info
 
+    def step_many(
+        self, actions: Iterable[ActionCoord]
+    ) -> Tuple[float, bool, dict, int]:
+        """Steps through actions in order until one is illegal, the game ends, or the outstanding request changes type
+        (say combat ends, or a card asks for discards). Later actions were planned for a state that no longer holds, so
+        they're left unplayed.
+
+        Returns the summed reward (including the pinch for an illegal action), whether the game is over, the last
+        step's info, and how many actions were applied. If that count is short of len(actions) and info has "illegal",
+        the action at that index was the illegal one.
+
+        Each action goes through Game#step, which checks just that action against the outstanding request rather than
+        listing every legal one; benchmarks/bench_step_many.py measures what that saves a plan, like TurnPlanner's.
+        """
+        reward = 0.0
+        is_terminal = False
+        info: dict = {}
+        num_applied = 0
+        request_type = type(self.ctx.action_manager.outstanding_request)
+
+        for action in actions:
+            step_reward, is_terminal, info = self.step(action)
+            reward += step_reward
+            if info.get("illegal"):
+                break
+            num_applied += 1
+            if (
+                is_terminal
+                or type(self.ctx.action_manager.outstanding_request) is not request_type
+            ):
+                break
+
+        return reward, is_terminal, info, num_applied
+
+    def set_auto_resolver(
+        self, request_type: Type[PlayerRequest], resolver: Optional[AutoResolver]
+    ):
+        """Have the engine answer requests of exactly request_type with resolver, or stop doing so if it's None."""
+        if request_type is BossChestRequest:
+            # Reaching the boss chest is how step reports a win, so it always goes back to the caller.
+            raise ValueError("BossChestRequest can't be auto resolved")
+        if resolver is None:
+            self.auto_resolvers.pop(request_type, None)
+        else:
+            self.auto_resolvers[request_type] = resolver
+
+    def _auto_resolve(self):
+        # Fast forward through requests that have a resolver. Health changes along the way still count towards the
+        # reward of the step that got us here.
+        while not self.ctx.player.is_dead:
+            request = self.ctx.action_manager.outstanding_request
+            resolver = self.auto_resolvers.get(type(request))
+            if resolver is None:
+                return
+
+            action = tuple(resolver(request))
+            if action not in request.generate_legal_actions():
+                raise ValueError(
+                    f"Auto resolver for {type(request).__name__} chose illegal action {action}"
+                )
+            logger.debug(f"Auto resolving {request} with {action}")
+            request.set_response(action)
+            while self.ctx.update() and not self.ctx.player.is_dead:
+                ...
+            self.history.append((action, self.ctx.action_manager.outstanding_request))
+
     def _win(self):
         self.logger.debug("Game over: WIN")
         self.game_over_and_won = True
@@ -1651,13 +2012,438 @@ class Game:
         return action_mask.to_raw()
 
     def is_action_valid(self, action: ActionCoord) -> bool:
-        mask = self.generate_action_mask()
-        return mask[action[0]][action[1]]
+        # Same answer as checking generate_action_mask, without building it or listing every legal action.
+        request = self.ctx.action_manager.outstanding_request
+        if not request:
+            assert self.game_over or not self.step_has_been_called
+            return False
+        return request.is_action_legal(action)
+
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        request = self.ctx.action_manager.outstanding_request
+        if not request:
+            assert self.game_over or not self.step_has_been_called
+            return []
+
+        return request.generate_legal_actions()
+
+    def sample_legal_action(self, rng: Rng) -> ActionCoord:
+        """A uniformly random legal action for the outstanding request. Unlike picking from generate_action_mask, this
+        doesn't build the mask."""
+        request = self.ctx.action_manager.outstanding_request
+        assert request, "No outstanding request to act on"
+        return request.sample_legal_action(rng)
 
     @property
     def game_over(self):
         return self.game_over_and_won is not None
 
+    def fork(self) -> "Game":
+        """An independent copy of this game that can be stepped without affecting it, like for search. The layout
+        cache is shared rather than copied."""
+        memo = {}
+        if self.ctx.layout_cache is not None:
+            memo[id(self.ctx.layout_cache)] = self.ctx.layout_cache
+        return copy.deepcopy(self, memo)
+
+    def dumps(self) -> bytes:
+        """The whole game as a compact binary snapshot (see decapitate_the_spire.snapshot), for Game#loads in this or
+        another process. The layout cache and chance handler are left out, since they belong to this process.
+
+        It's about as fast as Game#fork and a few dozen KB, so it's for moving games between processes, not for copying
+        them within one.
+        """
+        ctx = self.ctx
+        layout_cache, chance_handler = ctx.layout_cache, ctx.chance_handler
+        ctx.layout_cache = ctx.chance_handler = None
+        try:
+            return snapshot.dumps(self, ENGINE_VERSION)
+        finally:
+            ctx.layout_cache, ctx.chance_handler = layout_cache, chance_handler
+
+    @staticmethod
+    def loads(
+        data: Union[bytes, memoryview],
+        layout_cache: Optional[DungeonLayoutCache] = None,
+    ) -> "Game":
+        """The game from Game#dumps. Raises ValueError for snapshots from another engine version.
+
+        WARNING: snapshots are pickles, so loading one can call anything importable that it names. Only load data from
+        a trusted source, such as Game#dumps in a process of your own.
+        """
+        game = snapshot.loads(data, ENGINE_VERSION)
+        assert isinstance(game, Game)
+        game.ctx.layout_cache = layout_cache
+        return game
+
+    def determinize(self, rng: Rng) -> "Game":
+        """A fork where what the player can't know is redrawn from rng: the order of the draw pile, the order relics
+        will be handed out in, and every roll still to come (every rng is reseeded, so monster moves, shuffles, card
+        and potion rewards, and so on). What's already been shown, like monster intents and rewards on screen, stays.
+        The same rng state always gives the same fork, for sampling hidden information in search.
+
+        Cards put on top of the draw pile by something the player saw get shuffled in like the rest.
+        """
+        game = self.fork()
+        ctx = game.ctx
+        for name, value in list(vars(ctx).items()):
+            if isinstance(value, Rng):
+                setattr(ctx, name, Rng(rng.random(0, 2**32 - 1)))
+
+        # Straight on the rng rather than CardGroup#shuffle, which would tell any chance handler about it
+        ctx.shuffle_rng.shuffle(ctx.player.draw_pile._ordered_cards)
+        d = ctx.d
+        for pool in (
+            d.common_relic_pool,
+            d.uncommon_relic_pool,
+            d.rare_relic_pool,
+            d.shop_relic_pool,
+            d.boss_relic_pool,
+        ):
+            ctx.relic_rng.shuffle(pool)
+        return game
+
+    def combat_state_key(self, include_rng: bool = True) -> int:
+        """64 bit key for the decision relevant state of the current combat, for transposition tables. See
+        CombatStateKey."""
+        return CombatStateKey.of(self.ctx, include_rng)
+
+    def preview_play(
+        self, card_index: int, target_index: Optional[int] = None
+    ) -> "Preview":
+        """What playing the card in hand would do, without doing it. See Game#preview."""
+        return self.preview(ActionGenerator.play_card(card_index, target_index))
+
+    def preview_end_turn(self) -> "Preview":
+        """What ending the turn would do, through the monsters' turn and the start of the next one. See
+        Game#preview."""
+        return self.preview(ActionGenerator.end_turn())
+
+    def preview(self, action: ActionCoord) -> "Preview":
+        """The health, block and power changes a legal action would make, evaluated on a throwaway overlay so this
+        game, its action queue and its rngs are left alone. Nothing is reported to the chance handler or auto
+        resolved, so the preview stops where the player would next be asked something (like which card to discard).
+        """
+        if not self.is_action_valid(action):
+            raise ValueError(f"Can't preview illegal action {action}")
+        monsters = list(getattr(self.ctx.d.get_curr_room(), "monster_group", []))
+        before = PreviewSnapshot.of(self.ctx, monsters)
+        memo: dict = {}
+        overlay = self._overlay(memo)
+        overlay.step(action)
+
+        # Follow the monsters to their copies, since spawning can put new ones anywhere in the group
+        copies = [memo[id(m)] for m in monsters]
+        overlay_group = getattr(overlay.ctx.d.get_curr_room(), "monster_group", [])
+        spawned = [m for m in overlay_group if all(m is not c for c in copies)]
+        return Preview.between(
+            before, PreviewSnapshot.of(overlay.ctx, copies + spawned)
+        )
+
+    def _overlay(self, memo: dict) -> "Game":
+        """A fork that's only good for one step and throwing away. A step of combat doesn't read history, touch map
+        nodes other than the current one, or change the master deck (combat plays copies), so history starts out
+        empty and the rest is shared instead of copied. That's most of the cost of Game#fork on a real dungeon.
+
+        memo is the deepcopy memo, and ends up mapping the id of everything copied to its copy.
+        """
+        master_deck = self.ctx.player.master_deck
+        memo[id(self.history)] = []
+        memo[id(self.auto_resolvers)] = {}
+        memo[id(master_deck)] = master_deck
+        if self.ctx.layout_cache is not None:
+            memo[id(self.ctx.layout_cache)] = self.ctx.layout_cache
+        d = self.ctx.d
+        for row in getattr(d, "mapp", None) or []:
+            memo[id(row)] = row
+            for node in row:
+                if node is not d.curr_map_node:
+                    memo[id(node)] = node
+        overlay = copy.deepcopy(self, memo)
+        overlay.ctx.chance_handler = None
+        return overlay
+
+
+class CombatStateKey:
+    """Zobrist style hashing of a combat: every feature of the state maps to a fixed random 64 bit value, and the key
+    is the XOR of them all. XOR doesn't care about order, so piles whose order the player can't act on (hand, draw,
+    discard and exhaust piles, potions, relics) hash as multisets of card/potion/relic states, and which instance of
+    a card is which doesn't matter. Monsters keep their positions since targets are picked by index.
+
+    Covered: player health, block, energy, powers, potions and relic counters; each monster's health, block, powers,
+    intent and recent moves; the four piles; turn and discard counts; the outstanding request type; and, unless
+    include_rng is False, the state of the rngs combat draws from.
+
+    Feature values are derived from the feature itself, so keys agree across processes. The most recently used are
+    memoized (up to VALUE_CACHE_SIZE of them, shared by every thread), which makes most features a dict lookup and an
+    XOR.
+
+    Walking the whole combat isn't free, so the key (less energy and rngs, which are cheap to mix in) is cached on the
+    context until something changes. Context#update drops it, which covers everything the engine does. Setting a
+    tracked attribute (see tracks) or moving cards between piles drops it too, so direct edits like a test setting
+    health are seen. Editing a list in place outside a step, like removing a power, isn't; call invalidate after.
+    """
+
+    VALUE_CACHE_SIZE = 1 << 16
+    _MASK = (1 << 64) - 1
+
+    @staticmethod
+    @functools.lru_cache(maxsize=VALUE_CACHE_SIZE)
+    def value(feature: Tuple) -> int:
+        digest = hashlib.blake2b(repr(feature).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    @staticmethod
+    def card_signature(card: Card) -> Tuple:
+        return (
+            type(card).__name__,
+            card.times_upgraded,
+            card.cost,
+            card.cost_for_turn,
+            card.free_to_play_once,
+            card.retain,
+            card.base_damage,
+            card.base_block,
+            card.base_magic_number,
+        )
+
+    @classmethod
+    def _character_key(cls, owner: Tuple, character: Character) -> int:
+        key = cls.value(
+            owner
+            + (
+                character.current_health,
+                character.max_health,
+                character.current_block,
+            )
+        )
+        for power_counts in Counter(
+            (type(p).__name__, p.amount) for p in character.powers
+        ).items():
+            key ^= cls.value(owner + ("power",) + power_counts)
+        return key
+
+    @staticmethod
+    def tracks(*names: str) -> Callable[[_C], _C]:
+        """Class decorator for the attributes of a class with a ctx that go into the key, so setting one drops its
+        context's cached key."""
+
+        def decorate(cls: _C) -> _C:
+            for name in names:
+                setattr(cls, name, _KeyedAttribute(name))
+            return cls
+
+        return decorate
+
+    @staticmethod
+    def invalidate(ctx: CCG.Context):
+        ctx.cached_combat_state_key = None
+
+    @classmethod
+    def of(cls, ctx: CCG.Context, include_rng: bool = True) -> int:
+        key = ctx.cached_combat_state_key
+        if key is None:
+            key = ctx.cached_combat_state_key = cls._uncached(ctx)
+        key ^= cls.value(("energy", ctx.player.energy_manager.player_current_energy))
+
+        if include_rng:
+            for name in COMBAT_RNG_NAMES:
+                # States are too many to memoize, so mix each one with its rng's value instead. Multiplying by an odd
+                # constant keeps it a bijection.
+                state_hash = hash(getattr(ctx, name).get_state()) ^ cls.value(
+                    ("rng", name)
+                )
+                key ^= (state_hash * 0x9E3779B97F4A7C15) & cls._MASK
+
+        return key
+
+    @classmethod
+    def _uncached(cls, ctx: CCG.Context) -> int:
+        value = cls.value
+        player = ctx.player
+        key = cls._character_key(("player",), player)
+
+        for group in (
+            player.hand,
+            player.draw_pile,
+            player.discard_pile,
+            player.exhaust_pile,
+        ):
+            pile = group.type.name
+            for card_counts in Counter(cls.card_signature(c) for c in group).items():
+                key ^= value((pile,) + card_counts)
+
+        for potion_counts in Counter(type(p).__name__ for p in player.potions).items():
+            key ^= value(("potion",) + potion_counts)
+        for relic_counts in Counter(
+            (type(r).__name__, r.counter) for r in player.relics
+        ).items():
+            key ^= value(("relic",) + relic_counts)
+
+        room = ctx.d.get_curr_room()
+        monster_group = getattr(room, "monster_group", None)
+        for i, m in enumerate(monster_group or []):
+            owner = ("monster", i, type(m).__name__)
+            key ^= cls._character_key(owner, m)
+            key ^= value(
+                owner
+                + (m.is_dead, m.escaped, m.next_move_name, tuple(m.move_history[-2:]))
+            )
+
+        action_manager = ctx.action_manager
+        key ^= value(
+            (
+                "turn",
+                action_manager.turn_count,
+                action_manager.total_discarded_this_turn,
+                type(action_manager.outstanding_request).__name__,
+            )
+        )
+        return key
+
+
+_C = TypeVar("_C", bound=type)
+
+
+class _KeyedAttribute:
+    """See CombatStateKey#tracks. There's no __get__, so reads find the value in the instance dict like any attribute
+    and only sets cost a call."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __set__(self, instance, value):
+        attributes = instance.__dict__
+        attributes[self.name] = value
+        ctx = attributes.get("ctx")
+        if ctx is not None:
+            ctx.cached_combat_state_key = None
+
+
+class PreviewSnapshot:
+    """The parts of a combat a Preview compares: health, block and power amounts of the player and the given monsters,
+    and the incoming damage forecast."""
+
+    # (health, block, power amounts by power name)
+    CharacterState = Tuple[int, int, Dict[str, int]]
+    NOTHING: CharacterState = (0, 0, {})
+
+    def __init__(
+        self,
+        player: CharacterState,
+        monsters: List[CharacterState],
+        incoming_damage: int,
+    ):
+        self.player = player
+        self.monsters = monsters
+        self.incoming_damage = incoming_damage
+
+    @staticmethod
+    def character(character: Character) -> "PreviewSnapshot.CharacterState":
+        powers: Counter[str] = Counter()
+        for p in character.powers:
+            # Powers without stacks count as one when present
+            powers[type(p).__name__] += 1 if p.amount is None else p.amount
+        return character.current_health, character.current_block, dict(powers)
+
+    @classmethod
+    def of(cls, ctx: CCG.Context, monsters: Sequence[Monster]) -> "PreviewSnapshot":
+        monster_group = getattr(ctx.d.get_curr_room(), "monster_group", None)
+        incoming_damage = (
+            monster_group.incoming_damage_forecast().total if monster_group else 0
+        )
+        return cls(
+            cls.character(ctx.player),
+            [cls.character(m) for m in monsters],
+            incoming_damage,
+        )
+
+
+class CharacterDelta:
+    """How much a character's health and block change, and power amounts by power name (only ones that change;
+    gaining a power without stacks is +1, losing it -1)."""
+
+    def __init__(self, health: int, block: int, powers: Dict[str, int]):
+        self.health = health
+        self.block = block
+        self.powers = powers
+
+    def __repr__(self):
+        return f"{type(self).__name__}(health {self.health:+}, block {self.block:+}, powers {self.powers})"
+
+    def __eq__(self, other):
+        return isinstance(other, CharacterDelta) and vars(self) == vars(other)
+
+    @classmethod
+    def between(
+        cls,
+        before: PreviewSnapshot.CharacterState,
+        after: PreviewSnapshot.CharacterState,
+    ) -> "CharacterDelta":
+        powers = {
+            name: after[2].get(name, 0) - before[2].get(name, 0)
+            for name in {**before[2], **after[2]}
+        }
+        return cls(
+            after[0] - before[0],
+            after[1] - before[1],
+            {name: amount for name, amount in powers.items() if amount},
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.health or self.block or self.powers)
+
+
+class Preview:
+    """What an action would do, from Game#preview. monsters lines up with the monster group as it was; spawned are
+    monsters the action adds, changed from nothing. incoming_damage is the change in
+    DamageForecast#total: what the monsters' intents will get through the player's block.
+    """
+
+    def __init__(
+        self,
+        player: CharacterDelta,
+        monsters: List[CharacterDelta],
+        spawned: Optional[List[CharacterDelta]] = None,
+        incoming_damage: int = 0,
+    ):
+        self.player = player
+        self.monsters = monsters
+        self.spawned = spawned or []
+        self.incoming_damage = incoming_damage
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(player {self.player}, monsters {self.monsters}, spawned {self.spawned}, "
+            f"incoming damage {self.incoming_damage:+})"
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Preview) and vars(self) == vars(other)
+
+    @classmethod
+    def between(cls, before: PreviewSnapshot, after: PreviewSnapshot) -> "Preview":
+        """after has the monsters in before first, in the same order, then any spawned."""
+        deltas = [
+            CharacterDelta.between(b, a)
+            for b, a in itertools.zip_longest(
+                before.monsters, after.monsters, fillvalue=PreviewSnapshot.NOTHING
+            )
+        ]
+        n = len(before.monsters)
+        return cls(
+            CharacterDelta.between(before.player, after.player),
+            deltas[:n],
+            deltas[n:],
+            after.incoming_damage - before.incoming_damage,
+        )
+
+    @property
+    def damage_dealt(self) -> int:
+        """Total health the monsters lose."""
+        return -sum(m.health for m in self.monsters if m.health < 0)
+
 
 # Source appears to only use this once, to check for DAMAGE. Original is more expressive.
 class ActionType(Enum):
@@ -1993,7 +2779,9 @@ class DiscardAtEndOfTurnAction(Action):
         )
 
         # Iterate over hand in random order
-        for c in sorted(self.ctx.player.hand, key=lambda _: random.random()):
+        hand = list(self.ctx.player.hand)
+        self.ctx.card_random_rng.shuffle(hand)
+        for c in hand:
             c.trigger_on_end_of_player_turn()
 
 
@@ -2562,9 +3350,21 @@ class GainBlockRandomMonsterAction(Action):
         ]
 
         if len(valid_monsters) > 0:
-            target = valid_monsters[
-                self.ctx.ai_rng.random_from_0_to(len(valid_monsters) - 1)
-            ]
+            handler = self.ctx.chance_handler
+            if handler is None:
+                i = self.ctx.ai_rng.random_from_0_to(len(valid_monsters) - 1)
+            else:
+                n = len(valid_monsters)
+                event = ChanceEvent(
+                    ChanceKind.RANDOM_MONSTER, self, valid_monsters, [1.0 / n] * n
+                )
+                forced = handler(event)
+                if forced is None:
+                    i = self.ctx.ai_rng.random_from_0_to(n - 1)
+                else:
+                    i = event.checked_outcome(forced)
+                event.resolve(i)
+            target = valid_monsters[i]
         else:
             target = self.source
 
@@ -2914,7 +3714,7 @@ class SplitDifferentMove(Move):
         self,
         ctx: CCG.Context,
         owner: Monster,
-        spawn_funcs: List[Callable[[int], Monster]],
+        spawn_funcs: List[Callable[[CCG.Context, int], Monster]],
         is_minion=False,
     ):
         super().__init__(ctx, owner)
@@ -2929,7 +3729,7 @@ class SplitDifferentMove(Move):
         self.add_to_bottom(SuicideAction(self.ctx, self.owner, trigger_relics=False))
         hp = self.owner.current_health
         for f in self.spawn_funcs:
-            m = f(hp)
+            m = f(self.ctx, hp)
             self.add_to_bottom(
                 SpawnMonsterAction(self.ctx, m, is_minion=self.is_minion)
             )
@@ -2942,7 +3742,7 @@ class SplitMove(SplitDifferentMove):
         ctx: CCG.Context,
         owner: Monster,
         num_to_spawn: int,
-        spawn_func: Callable[[int], Monster],
+        spawn_func: Callable[[CCG.Context, int], Monster],
         is_minion=False,
     ):
         super().__init__(ctx, owner, [spawn_func] * num_to_spawn, is_minion)
@@ -2974,6 +3774,7 @@ class NoOpMove(Move):
         pass
 
 
+@CombatStateKey.tracks("current_health", "max_health", "current_block", "is_dead")
 class Character(ABC):
     def __init__(self, ctx: CCG.Context, name: str, max_health: int):
         self.ctx = ctx
@@ -2999,7 +3800,8 @@ class Character(ABC):
     @abstractmethod
     def update(self):
         """This isn't 'update' in the same 'gets called in an event loop and has timers' sense as in source. I'm
-        going to try putting death detection here, see if anything else naturally fits."""
+        going to try putting death detection here, see if anything else naturally fits.
+        """
         ...
 
     def add_to_top(self, action: Action):
@@ -3564,6 +4366,7 @@ class Player(Character):
             r.at_pre_battle()
 
 
+@CombatStateKey.tracks("escaped", "next_move_name")
 class Monster(Character):
     enqueue_roll_move_after_acting = True
 
@@ -3580,8 +4383,8 @@ class Monster(Character):
         resolved_max_health_max = ADV.resolve_adv_or_int(max_health_max)
 
         assert resolved_max_health_min <= resolved_max_health_max
-        max_health = random.randrange(
-            resolved_max_health_min, resolved_max_health_max + 1
+        max_health = ctx.monster_hp_rng.random(
+            resolved_max_health_min, resolved_max_health_max
         )
 
         super().__init__(ctx, self.__class__.__name__, max_health)
@@ -3753,7 +4556,7 @@ class Monster(Character):
             r.on_block_broken(self)
 
     @final
-    def get_move(self, num: int):
+    def get_move(self, num: int, ai_rng: Optional[Rng] = None):
         if self.move_rng_overrides and len(self.move_rng_overrides) > 0:
             rng_override = self.move_rng_overrides.popleft()
             if rng_override is None:
@@ -3762,16 +4565,12 @@ class Monster(Character):
                 num = rng_override
                 logger.warning(f"Overriding {self.name} next move RNG to {num}")
 
-        if (
-            self.move_overrides is not None
-            and self.move_overrides_index < len(self.move_overrides)
-            and self.move_overrides[self.move_overrides_index] is not None
-        ):
+        if self._is_move_override_active():
             logger.info("Move override active!")
             next_move_name = self.move_overrides[self.move_overrides_index]
         else:
             next_move_name = self._get_move_impl(
-                num, self._is_first_move, self.ctx.ai_rng, self._turns_taken
+                num, self._is_first_move, ai_rng or self.ctx.ai_rng, self._turns_taken
             )
         self.move_overrides_index += 1
 
@@ -3794,9 +4593,83 @@ class Monster(Character):
             raise NotImplementedError()
 
     def roll_move(self):
-        num = self.ctx.ai_rng.random_from_0_to(99)
-        logger.debug(f"{self.name} rolled {num} for move")
-        self.get_move(num)
+        handler = self.ctx.chance_handler
+        if handler is None:
+            num = self.ctx.ai_rng.random_from_0_to(99)
+            logger.debug(f"{self.name} rolled {num} for move")
+            self.get_move(num)
+            return
+
+        distribution = self.move_distribution()
+        names = list(distribution.keys())
+        event = ChanceEvent(
+            ChanceKind.MONSTER_MOVE, self, names, list(distribution.values())
+        )
+        forced = handler(event)
+        if forced is None:
+            num = self.ctx.ai_rng.random_from_0_to(99)
+            logger.debug(f"{self.name} rolled {num} for move")
+            self.get_move(num)
+            event.resolve(names.index(self.next_move_name))
+        else:
+            i = event.checked_outcome(forced)
+            logger.debug(f"{self.name} forced to {names[i]}")
+            # Take the move the way a roll would, so that whatever _get_move_impl keeps track of (like
+            # GremlinWizard's charge) is kept track of for forced moves too
+            num, script = next(
+                (num, script)
+                for name, _, num, script in self._move_outcomes()
+                if name == names[i]
+            )
+            self.get_move(num, ScriptedRng(script))
+            assert self.next_move_name == names[i]
+            event.resolve(i)
+
+    def move_distribution(self) -> Dict[MoveName, float]:
+        """How likely each move is to come out of the next roll_move, from the monster's state now."""
+        distribution: Dict[MoveName, float] = {}
+        for name, probability, _, _ in self._move_outcomes():
+            distribution[name] = distribution.get(name, 0.0) + probability
+        return distribution
+
+    def _move_outcomes(self) -> Iterator[Tuple[MoveName, float, int, List[int]]]:
+        """Every way the next roll_move can come out: the move, how likely that way is, and the roll and the ai_rng
+        script (see enumerate_scripts) that get_move comes to it with."""
+        if self._is_move_override_active():
+            name = self.move_overrides[self.move_overrides_index]
+            assert name is not None
+            yield name, 1.0, 0, []
+            return
+        nums: Sequence[int]
+        if self.move_rng_overrides and self.move_rng_overrides[0] is not None:
+            nums = [self.move_rng_overrides[0]]
+        else:
+            nums = range(100)
+
+        # Some monsters keep track of things in _get_move_impl, so put everything back after each call.
+        state = dict(vars(self))
+
+        def get_move_impl(num: int, ai_rng: Rng) -> MoveName:
+            try:
+                return self._get_move_impl(
+                    num, self._is_first_move, ai_rng, self._turns_taken
+                )
+            finally:
+                vars(self).clear()
+                vars(self).update(state)
+
+        for num in nums:
+            for name, probability, script in enumerate_scripts(
+                functools.partial(get_move_impl, num)
+            ):
+                yield name, probability / len(nums), num, script
+
+    def _is_move_override_active(self) -> bool:
+        return (
+            self.move_overrides is not None
+            and self.move_overrides_index < len(self.move_overrides)
+            and self.move_overrides[self.move_overrides_index] is not None
+        )
 
     def apply_powers(self):
         # This ends up setting output in DamageInfo.
@@ -3847,7 +4720,7 @@ class AcidSlimeS(Monster):
         tackle_damage = ADV.of(3).with_asc(2, 4)
         moves = {
             MoveName.LICK: DebuffMove(
-                ctx, self, lambda pl: [WeakPower(ctx, pl, 1, True)]
+                ctx, self, lambda pl: [WeakPower(pl.ctx, pl, 1, True)]
             ),
             MoveName.TACKLE: AttackMove(ctx, self, tackle_damage),
         }
@@ -3888,7 +4761,7 @@ class AcidSlimeM(Monster):
         corrosive_spit_damage = ADV.of(7).with_asc(2, 8)
         moves = {
             MoveName.LICK: DebuffMove(
-                ctx, self, lambda pl: [WeakPower(ctx, pl, 1, True)]
+                ctx, self, lambda pl: [WeakPower(pl.ctx, pl, 1, True)]
             ),
             MoveName.TACKLE: AttackMove(ctx, self, tackle_damage),
             MoveName.CORROSIVE_SPIT: AttackTrashDiscardMove(
@@ -3969,7 +4842,7 @@ class AcidSlimeL(Monster):
         corrosive_spit_damage = ADV.of(11).with_asc(2, 12)
         moves = {
             MoveName.LICK: DebuffMove(
-                ctx, self, lambda pl: [WeakPower(ctx, pl, 2, True)]
+                ctx, self, lambda pl: [WeakPower(pl.ctx, pl, 2, True)]
             ),
             MoveName.TACKLE: AttackMove(ctx, self, tackle_damage),
             MoveName.CORROSIVE_SPIT: AttackTrashDiscardMove(
@@ -3981,9 +4854,7 @@ class AcidSlimeL(Monster):
                 ),
                 2,
             ),
-            MoveName.SPLIT: SplitMove(
-                ctx, self, 2, lambda health: AcidSlimeM(ctx, health)
-            ),
+            MoveName.SPLIT: SplitMove(ctx, self, 2, AcidSlimeM),
         }
         max_health_min = (
             ADV.of(65).with_asc(7, 68)
@@ -4106,7 +4977,7 @@ class SpikeSlimeM(Monster):
         flame_tackle_damage = ADV.of(8).with_asc(2, 10)
         moves = {
             MoveName.LICK: DebuffMove(
-                ctx, self, lambda pl: [FrailPower(ctx, pl, 1, True)]
+                ctx, self, lambda pl: [FrailPower(pl.ctx, pl, 1, True)]
             ),
             MoveName.FLAME_TACKLE: AttackTrashDiscardMove(
                 ctx,
@@ -4172,7 +5043,7 @@ class SpikeSlimeL(Monster):
         frail_amount = ADV.of(2).with_asc(17, 3).resolve()
         moves = {
             MoveName.LICK: DebuffMove(
-                ctx, self, lambda pl: [FrailPower(ctx, pl, frail_amount, True)]
+                ctx, self, lambda pl: [FrailPower(pl.ctx, pl, frail_amount, True)]
             ),
             MoveName.FLAME_TACKLE: AttackTrashDiscardMove(
                 ctx,
@@ -4183,9 +5054,7 @@ class SpikeSlimeL(Monster):
                 ),
                 2,
             ),
-            MoveName.SPLIT: SplitMove(
-                ctx, self, 2, lambda health: SpikeSlimeM(ctx, health)
-            ),
+            MoveName.SPLIT: SplitMove(ctx, self, 2, SpikeSlimeM),
         }
         max_health_min = (
             ADV.of(64).with_asc(7, 67)
@@ -4325,7 +5194,7 @@ class Cultist(Monster):
                 self,
                 lambda m: [
                     RitualPower(
-                        ctx,
+                        m.ctx,
                         m,
                         AscensionDependentValue.of(3)
                         .with_asc(2, 4)
@@ -4357,9 +5226,10 @@ class Cultist(Monster):
 
 class JawWorm(Monster):
     def __init__(self, ctx: CCG.Context, hard_mode=False):
-        self.bellow_strength = (
+        bellow_strength = (
             AscensionDependentValue.of(3).with_asc(2, 4).with_asc(17, 5).resolve()
         )
+        self.bellow_strength = bellow_strength
         self.bellow_block = AscensionDependentValue.of(6).with_asc(17, 9).resolve()
         moves = {
             MoveName.CHOMP: AttackMove(
@@ -4369,7 +5239,7 @@ class JawWorm(Monster):
             MoveName.BELLOW: DefendBuffMove(
                 ctx,
                 self,
-                lambda m: [StrengthPower(ctx, m, self.bellow_strength)],
+                lambda m: [StrengthPower(m.ctx, m, bellow_strength)],
                 self.bellow_block,
             ),
         }
@@ -4456,7 +5326,7 @@ class AlwaysWeakenMonster(Monster):
     def __init__(self, ctx: CCG.Context, max_health):
         moves = {
             MoveName.LICK: DebuffMove(
-                ctx, self, lambda pl: [WeakPower(ctx, pl, 2, True)]
+                ctx, self, lambda pl: [WeakPower(pl.ctx, pl, 2, True)]
             )
         }
         super().__init__(ctx, max_health, max_health, moves)
@@ -4509,7 +5379,7 @@ class Reptomancer(Monster):
             MoveName.SNAKE_STRIKE: AttackDebuffMove(
                 ctx,
                 self,
-                lambda pl: [WeakPower(ctx, pl, 1, True)],
+                lambda pl: [WeakPower(pl.ctx, pl, 1, True)],
                 snake_strike_damage,
                 snake_strike_multiplier,
             ),
@@ -4638,7 +5508,7 @@ class LouseDefensive(Monster):
         moves = {
             MoveName.BITE: AttackMove(ctx, self, bite_damage),
             MoveName.SPIT_WEB: DebuffMove(
-                ctx, self, lambda pl: [WeakPower(ctx, pl, 2, is_source_monster=True)]
+                ctx, self, lambda pl: [WeakPower(pl.ctx, pl, 2, is_source_monster=True)]
             ),
         }
         super().__init__(
@@ -4694,7 +5564,7 @@ class LouseNormal(Monster):
         moves = {
             MoveName.BITE: AttackMove(ctx, self, bite_damage),
             MoveName.GROW: BuffMove(
-                ctx, self, lambda m: [StrengthPower(ctx, m, strength_gain)]
+                ctx, self, lambda m: [StrengthPower(m.ctx, m, strength_gain)]
             ),
         }
         super().__init__(
@@ -4748,7 +5618,7 @@ class FungiBeast(Monster):
         moves = {
             MoveName.BITE: AttackMove(ctx, self, bite_damage),
             MoveName.GROW: BuffMove(
-                ctx, self, lambda m: [StrengthPower(ctx, m, strength_gain)]
+                ctx, self, lambda m: [StrengthPower(m.ctx, m, strength_gain)]
             ),
         }
         super().__init__(ctx, ADV.of(22).with_asc(7, 24), 28, moves, *args, **kwargs)
@@ -4779,9 +5649,9 @@ class GremlinFat(Monster):
         smash_damage = ADV.of(4).with_asc(2, 5)
 
         def gen_debuffs(pl: Player):
-            powers = [WeakPower(ctx, pl, 1, True)]
-            if AscensionManager.get_ascension(self) >= 17:
-                powers.append(FrailPower(ctx, pl, 1, True))
+            powers = [WeakPower(pl.ctx, pl, 1, True)]
+            if AscensionManager.get_ascension(pl) >= 17:
+                powers.append(FrailPower(pl.ctx, pl, 1, True))
             return powers
 
         moves = {
@@ -4964,8 +5834,8 @@ class Lagavulin(Monster):
                 ctx,
                 self,
                 lambda pl: [
-                    StrengthPower(ctx, ctx.player, siphon_amount),
-                    DexterityPower(ctx, ctx.player, siphon_amount),
+                    StrengthPower(pl.ctx, pl, siphon_amount),
+                    DexterityPower(pl.ctx, pl, siphon_amount),
                 ],
             ),
             MoveName.STUNNED: self.StunnedMove(ctx, self),
@@ -5134,7 +6004,7 @@ class SlaverBlue(Monster):
             MoveName.RAKE: AttackDebuffMove(
                 ctx,
                 self,
-                lambda pl: [WeakPower(ctx, pl, weak_amount, True)],
+                lambda pl: [WeakPower(pl.ctx, pl, weak_amount, True)],
                 rake_damage,
             ),
         }
@@ -5174,11 +6044,11 @@ class SlaverRed(Monster):
             MoveName.SCRAPE: AttackDebuffMove(
                 ctx,
                 self,
-                lambda pl: [VulnerablePower(ctx, pl, vulnerable_amount, True)],
+                lambda pl: [VulnerablePower(pl.ctx, pl, vulnerable_amount, True)],
                 scrape_damage,
             ),
             MoveName.ENTANGLE: DebuffMove(
-                ctx, self, lambda pl: [EntangledPower(ctx, pl, None)]
+                ctx, self, lambda pl: [EntangledPower(pl.ctx, pl, None)]
             ),
         }
         super().__init__(
@@ -5232,7 +6102,7 @@ class SlimeBoss(Monster):
             MoveName.SPLIT: SplitDifferentMove(
                 ctx,
                 self,
-                [lambda hp: SpikeSlimeL(ctx, hp), lambda hp: AcidSlimeL(ctx, hp)],
+                [SpikeSlimeL, AcidSlimeL],
             ),
         }
         health = ADV.of(140).with_asc(9, 150)
@@ -5325,7 +6195,6 @@ class TheGuardian(Monster):
             self.owner.damage_taken = 0
 
     class TwinSlamMove(AttackMove):
-
         # noinspection PyFinal
         def get_intent(self):
             return Intent.ATTACK_BUFF
@@ -5349,13 +6218,13 @@ class TheGuardian(Monster):
                 ctx,
                 self,
                 lambda pl: [
-                    VulnerablePower(ctx, pl, 2, True),
-                    WeakPower(ctx, pl, 2, True),
+                    VulnerablePower(pl.ctx, pl, 2, True),
+                    WeakPower(pl.ctx, pl, 2, True),
                 ],
             ),
             MoveName.WHIRLWIND: AttackMove(ctx, self, 5, multiplier=4),
             MoveName.DEFENSIVE_MODE: BuffMove(
-                ctx, self, lambda m: [SharpHidePower(ctx, m, sharp_hide_amount)]
+                ctx, self, lambda m: [SharpHidePower(m.ctx, m, sharp_hide_amount)]
             ),
             MoveName.ROLL_ATTACK: AttackMove(ctx, self, roll_damage),
             MoveName.TWIN_SLAM: self.TwinSlamMove(ctx, self, 8, multiplier=2),
@@ -5442,11 +6311,11 @@ class GremlinNob(Monster):
         bellow_amount = ADV.of(2).with_asc(18, 3).resolve()
         moves = {
             MoveName.BELLOW: BuffMove(
-                ctx, self, lambda m: [AngerPower(ctx, m, bellow_amount)]
+                ctx, self, lambda m: [AngerPower(m.ctx, m, bellow_amount)]
             ),
             MoveName.RUSH: AttackMove(ctx, self, rush_damage),
             MoveName.SKULL_BASH: AttackDebuffMove(
-                ctx, self, lambda p: [VulnerablePower(ctx, p, 2, True)], bash_damage
+                ctx, self, lambda p: [VulnerablePower(p.ctx, p, 2, True)], bash_damage
             ),
         }
         super().__init__(
@@ -5530,7 +6399,7 @@ class Hexaghost(Monster):
             ),
             MoveName.TACKLE: AttackMove(ctx, self, tackle_damage, multiplier=2),
             MoveName.INFLAME: DefendBuffMove(
-                ctx, self, lambda m: [StrengthPower(ctx, m, inflame_strength)], 12
+                ctx, self, lambda m: [StrengthPower(m.ctx, m, inflame_strength)], 12
             ),
         }
         health = ADV.of(250).with_asc(9, 264)
@@ -5567,6 +6436,8 @@ class MonsterGroup:
     def __init__(self, ctx: CCG.Context, monsters: List[Monster]):
         self.ctx = ctx
         self.monsters: List[Monster] = monsters
+        # (key, forecast) from the last incoming_damage_forecast
+        self._damage_forecast: Optional[Tuple[Tuple, DamageForecast]] = None
 
     def __repr__(self):
         return os.linesep.join([m.__repr__() for m in self.monsters])
@@ -5649,6 +6520,101 @@ class MonsterGroup:
     def have_monsters_escaped(self):
         return all((m.escaped for m in self.monsters))
 
+    def incoming_damage_forecast(self) -> DamageForecast:
+        """What the monsters' intents will do to the player. It's cached until an intent, a power on either side or
+        the player's block changes, so it's cheap to ask for every decision."""
+        player = self.ctx.player
+        key = (
+            tuple(DamageForecast.monster_key(m) for m in self.monsters),
+            DamageForecast.powers_key(player),
+            player.current_block,
+        )
+        if self._damage_forecast is None or self._damage_forecast[0] != key:
+            self._damage_forecast = (key, DamageForecast.of(self.monsters, player))
+        return self._damage_forecast[1]
+
+
+class DamageForecast:
+    """Damage the monsters' intents will do to the player on the coming monster turn, as arrays indexed like the
+    monster group. Dead or escaped monsters and intents without an attack forecast 0.
+
+    damage has the monster's and the player's powers applied (Strength, Weak, Vulnerable and so on) across all of
+    the attack's hits. unblocked is what's left after the player's block, plus what Metallicize will add at the end of
+    the turn, is used up by the monsters in the order they act. per_attack_played is Sharp Hide's damage for each
+    attack the player plays first, which isn't in the other two. The arrays are shared by everyone asking, so they're
+    read only.
+    """
+
+    def __init__(
+        self, damage: np.ndarray, unblocked: np.ndarray, per_attack_played: np.ndarray
+    ):
+        for a in (damage, unblocked, per_attack_played):
+            a.flags.writeable = False
+        self.damage = damage
+        self.unblocked = unblocked
+        self.per_attack_played = per_attack_played
+
+    def __repr__(self):
+        return f"{type(self).__name__}(damage {self.damage}, unblocked {self.unblocked}, per attack played {self.per_attack_played})"
+
+    @property
+    def total(self) -> int:
+        return int(self.unblocked.sum())
+
+    @property
+    def total_before_block(self) -> int:
+        return int(self.damage.sum())
+
+    @staticmethod
+    def powers_key(character: Character) -> Tuple:
+        return tuple((type(p), p.amount) for p in character.powers)
+
+    @classmethod
+    def monster_key(cls, monster: Monster) -> Tuple:
+        move = monster.next_move
+        damage_key = (
+            (move.damage_info.base, move.multiplier)
+            if isinstance(move, DamageMove)
+            else None
+        )
+        return (
+            monster.next_move_name,
+            damage_key,
+            monster.is_dead_or_escaped(),
+            cls.powers_key(monster),
+        )
+
+    @staticmethod
+    def hits(monster: Monster, player: Player) -> List[int]:
+        """Damage of each hit of the monster's intended attack, worked out fresh rather than read off the move,
+        which is only updated when something calls apply_powers."""
+        move = monster.next_move
+        if monster.is_dead_or_escaped() or not isinstance(move, DamageMove):
+            return []
+        info = DamageInfo(monster, move.damage_info.base, move.damage_info.damage_type)
+        info.apply_powers(monster, player)
+        return [info.output] * (1 if move.multiplier is None else move.multiplier)
+
+    @classmethod
+    def of(cls, monsters: Sequence[Monster], player: Player) -> "DamageForecast":
+        damage = np.zeros(len(monsters), dtype=np.int32)
+        unblocked = np.zeros(len(monsters), dtype=np.int32)
+        per_attack_played = np.zeros(len(monsters), dtype=np.int32)
+        block = player.current_block + sum(
+            p.amount for p in player.powers if isinstance(p, MetallicizePower)
+        )
+        for i, m in enumerate(monsters):
+            for hit in cls.hits(m, player):
+                blocked = min(block, hit)
+                block -= blocked
+                damage[i] += hit
+                unblocked[i] += hit - blocked
+            if not m.is_dead_or_escaped():
+                per_attack_played[i] = sum(
+                    p.amount for p in m.powers if isinstance(p, SharpHidePower)
+                )
+        return cls(damage, unblocked, per_attack_played)
+
 
 class EnemyMoveInfo:
     def __init__(
@@ -5713,6 +6679,12 @@ class SimpleChoiceEventRequest(PlayerRequest):
         ]
         return ActionMask(play_card_slices)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        return [
+            ActionGenerator.pick_simple_event_choice(i)
+            for i in range(min(self.event.num_choices, MAX_HAND_SIZE))
+        ]
+
 
 class DiscardRequest(PlayerRequest):
     def __init__(
@@ -5776,6 +6748,37 @@ class DiscardRequest(PlayerRequest):
 
         self.clear_response()
 
+    def is_selection_valid(self, selection: Selection) -> bool:
+        hand = self.ctx.player.hand
+        indexes = self._selected_indexes(selection, len(hand), MAX_HAND_SIZE)
+        if indexes is None:
+            return False
+
+        chosen = {c.uuid for c in self.chosen_cards}
+        if any(hand[i].uuid in chosen for i in indexes):
+            return False
+        if self.num_cards is not None:
+            return len(indexes) == self.num_cards
+        return self.any_number and (len(indexes) > 0 or self.can_pick_zero)
+
+    def handle_selection(self, selection: Selection):
+        # Same as picking each card, then stopping if the request allows it
+        hand = self.ctx.player.hand
+        indexes = self._selected_indexes(selection, len(hand), MAX_HAND_SIZE)
+        assert indexes is not None
+        picked = [hand[i] for i in indexes]
+        logger.debug(f"{self} picked {picked} at once")
+        self.chosen_cards.extend(picked)
+
+        if self.num_cards is not None:
+            self.num_cards = 0
+        elif self.is_gambling_chip:
+            num_to_draw = len(self.chosen_cards)
+            logger.debug(f"Gambling set, enqueueing draw {num_to_draw}")
+            self.ctx.action_manager.add_to_top(DrawCardAction(self.ctx, num_to_draw))
+
+        self._do_requested_discards()
+
     def _do_requested_discards(self):
         # Ensure the request is complete
         assert self.num_cards is None or self.num_cards == 0
@@ -5812,6 +6815,16 @@ class DiscardRequest(PlayerRequest):
 
         return ActionMask(play_card_slices, end_turn_slice)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        actions = []
+        if self.can_pick_zero and self.any_number:
+            actions.append(ActionGenerator.done_picking_discards())
+        chosen = {c.uuid for c in self.chosen_cards}
+        for card_index, card in enumerate(self.ctx.player.hand):
+            if card.uuid not in chosen:
+                actions.append(ActionGenerator.pick_discard_from_hand(card_index))
+        return actions
+
 
 class PathChoiceRequest(PlayerRequest):
     def __init__(
@@ -5860,6 +6873,12 @@ class PathChoiceRequest(PlayerRequest):
 
         return ActionMask(play_card_slices)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        available = (self.left_available, self.center_available, self.right_available)
+        return [
+            ActionGenerator.play_card(i, None) for i, a in enumerate(available) if a
+        ]
+
     def handle_play_card_action(self, action: ActionCoord):
         if action[0] == 0:
             edge = self.left_edge
@@ -5914,6 +6933,13 @@ class FirstPathChoiceRequest(PlayerRequest):
 
         return ActionMask(play_card_slices)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        return [
+            ActionGenerator.pick_first_path(i)
+            for i, available in enumerate(self.rooms_available)
+            if available
+        ]
+
 
 class BossPathChoiceRequest(PlayerRequest):
     def generate_action_mask(self) -> ActionMask:
@@ -5921,6 +6947,9 @@ class BossPathChoiceRequest(PlayerRequest):
         play_card_slices = [ACTION_1_ALL_FALSE_SLICE] * MAX_HAND_SIZE
         return ActionMask(play_card_slices, end_turn_slice)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        return [ActionGenerator.go_to_boss()]
+
     def handle_end_turn_action(self, action: ActionCoord):
         boss_node = MapRoomNode(-1, 15)
         boss_node.room = MonsterRoomBoss(
@@ -5957,6 +6986,14 @@ class CombatRewardRequest(PlayerRequest):
 
         return ActionMask(play_card_slices, end_turn_slice)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        actions = [ActionGenerator.end_combat_reward()]
+        for reward_index, reward in enumerate(self.rewards):
+            for action_1, legal in enumerate(reward.to_mask_slice()):
+                if legal:
+                    actions.append(ActionGenerator.play_card(reward_index, action_1))
+        return actions
+
     def handle_end_turn_action(self, action: ActionCoord):
         left_repr = f", left {len(self.rewards)}" if len(self.rewards) > 0 else ""
         logger.debug(f"Done picking combat rewards{left_repr}")
@@ -6002,6 +7039,14 @@ class BossChestRequest(PlayerRequest):
 
         return ActionMask(play_card_slices, end_turn_slice)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        actions = [ActionGenerator.end_combat_reward()]
+        for reward_index, reward in enumerate(self.rewards):
+            for action_1, legal in enumerate(reward.to_mask_slice()):
+                if legal:
+                    actions.append(ActionGenerator.play_card(reward_index, action_1))
+        return actions
+
     def handle_end_turn_action(self, action: ActionCoord):
         # Skip chest
         raise NotImplementedError()
@@ -6039,6 +7084,13 @@ class CampfireRequest(PlayerRequest):
         ]
         return ActionMask(play_card_slices)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        return [
+            ActionGenerator.play_card(i, None)
+            for i, op in enumerate(self.options[:MAX_HAND_SIZE])
+            if op.usable
+        ]
+
 
 class GridSelectRequest(PlayerRequest):
     def __init__(self, ctx: CCG.Context, cards: List[Card]):
@@ -6059,6 +7111,18 @@ class GridSelectRequest(PlayerRequest):
 
         return ActionMask(play_card_slices)
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        return [
+            ActionGenerator.pick_grid_select_index(i) for i in range(len(self.cards))
+        ]
+
+    def sample_legal_action(self, rng: Rng) -> ActionCoord:
+        # Every index below len(cards) is legal, so there's no need to list them.
+        assert self.cards
+        return ActionGenerator.pick_grid_select_index(
+            rng.random_from_0_to(len(self.cards) - 1)
+        )
+
     def handle_play_card_action(self, action: ActionCoord):
         # Pick card to update
         card_i = self.translate_action_to_index(action)
@@ -6069,6 +7133,21 @@ class GridSelectRequest(PlayerRequest):
         self.ctx.action_manager.outstanding_request = None
         self.ctx.d.get_curr_room().phase = RoomPhase.COMPLETE
 
+    def is_selection_valid(self, selection: Selection) -> bool:
+        indexes = self._selected_indexes(
+            selection, len(self.cards), MAX_HAND_SIZE * ACTION_1_LEN
+        )
+        # The only grid select so far is smithing, which upgrades exactly one card
+        return indexes is not None and len(indexes) == 1
+
+    def handle_selection(self, selection: Selection):
+        indexes = self._selected_indexes(
+            selection, len(self.cards), MAX_HAND_SIZE * ACTION_1_LEN
+        )
+        assert indexes is not None
+        (card_i,) = indexes
+        self.handle_play_card_action(self.translate_index_to_action(card_i))
+
     @staticmethod
     def translate_action_to_index(action: ActionCoord):
         # Because this request uses play card action, action[0] ranges [0, MAX_HAND_SIZE) and action[1] ranges
@@ -6134,6 +7213,71 @@ class CombatActionRequest(PlayerRequest):
             play_card_slices, end_turn_slice, use_potion_slices, discard_potion_slices
         )
 
+    def generate_legal_actions(self) -> List[ActionCoord]:
+        # Same order and checks as generate_action_mask
+        actions = [ActionGenerator.end_turn()]
+        monsters = list(self.ctx.d.get_curr_room().monster_group)[
+            :MAX_NUM_MONSTERS_IN_GROUP
+        ]
+        for card_index, card in enumerate(self.ctx.player.hand):
+            for monster_index, monster in enumerate(monsters):
+                if card.can_use(monster):
+                    actions.append(ActionGenerator.play_card(card_index, monster_index))
+            if card.can_use(None):
+                actions.append(ActionGenerator.play_card(card_index, None))
+
+        # TODO unusable potions like fairy bottle
+        potions = self.ctx.player.potions[:MAX_POTION_SLOTS]
+        for potion_index, potion in enumerate(potions):
+            if potion.target_required:
+                actions.extend(
+                    ActionGenerator.use_potion(potion_index, monster_index)
+                    for monster_index in range(len(monsters))
+                )
+            else:
+                actions.append(ActionGenerator.use_potion(potion_index, None))
+        for potion_index, potion in enumerate(potions):
+            if potion.can_discard():
+                actions.append(ActionGenerator.discard_potion(potion_index))
+        return actions
+
+    def is_action_legal(self, action: ActionCoord) -> bool:
+        # Same checks as generate_legal_actions, for the one card or potion the action names
+        if len(action) != 2:
+            return False
+        action_0, action_1 = action
+        if action_0 == 0:
+            return action_1 == MAX_NUM_MONSTERS_IN_GROUP
+        monsters = list(self.ctx.d.get_curr_room().monster_group)[
+            :MAX_NUM_MONSTERS_IN_GROUP
+        ]
+        if action_1 == MAX_NUM_MONSTERS_IN_GROUP:
+            target = None
+        elif 0 <= action_1 < len(monsters):
+            target = monsters[action_1]
+        else:
+            return False
+
+        card_index = action_0 - 1
+        if 0 <= card_index < MAX_HAND_SIZE:
+            hand = self.ctx.player.hand
+            return card_index < len(hand) and hand[card_index].can_use(target)
+
+        potions = self.ctx.player.potions[:MAX_POTION_SLOTS]
+        potion_index = card_index - MAX_HAND_SIZE
+        if 0 <= potion_index < MAX_POTION_SLOTS:
+            return potion_index < len(potions) and potions[
+                potion_index
+            ].target_required == (target is not None)
+        potion_index -= MAX_POTION_SLOTS
+        if 0 <= potion_index < MAX_POTION_SLOTS:
+            return (
+                target is None
+                and potion_index < len(potions)
+                and potions[potion_index].can_discard()
+            )
+        return False
+
     def handle_end_turn_action(self, action: ActionCoord):
         # request = self.ctx.action_manager.outstanding_request
         # assert not request
@@ -6199,6 +7343,7 @@ class CombatActionRequest(PlayerRequest):
         self.ctx.action_manager.outstanding_request = None
 
 
+@CombatStateKey.tracks("turn_count", "total_discarded_this_turn", "outstanding_request")
 class ActionManager:
     def __init__(self, ctx: CCG.Context):
         self.ctx = ctx
@@ -6268,7 +7413,6 @@ class ActionManager:
         return did_something
 
     def _get_next_action(self) -> bool:  # noqa: C901
-
         if len(self.actions) > 0:
             action = self.actions.pop()
             logger.debug(f"Popped action ({len(self.actions)} remain): {action}")
@@ -6559,6 +7703,16 @@ class CardColor(Enum):
     CURSE = 5
 
 
+@CombatStateKey.tracks(
+    "times_upgraded",
+    "cost",
+    "cost_for_turn",
+    "free_to_play_once",
+    "retain",
+    "base_damage",
+    "base_block",
+    "base_magic_number",
+)
 class Card(ABC):
     base_damage_master = None
     base_block_master = None
@@ -8009,10 +9163,12 @@ class CardGroup:
     def add_to_top(self, card: Card):
         logger.debug(f"Adding {card} to {self.type}")
         self._ordered_cards.append(card)
+        CombatStateKey.invalidate(self.ctx)
 
     def add_to_bottom(self, card: Card):
         logger.debug(f"Adding {card} to bottom of {self.type}")
         self._ordered_cards.appendleft(card)
+        CombatStateKey.invalidate(self.ctx)
 
     def count_by_card(self) -> List[int]:
         counts = [0] * len(dts.SILENT_CARD_UNIVERSE)
@@ -8021,9 +9177,32 @@ class CardGroup:
         return counts
 
     def shuffle(self):
-        random.shuffle(self._ordered_cards)
+        handler = self.ctx.chance_handler
+        if handler is None:
+            self.ctx.shuffle_rng.shuffle(self._ordered_cards)
+            return
+
+        cards = list(self._ordered_cards)
+        event = ChanceEvent(ChanceKind.SHUFFLE, self, cards, None)
+        forced = handler(event)
+        if forced is None:
+            # Same rolls as shuffling the cards themselves
+            order = list(range(len(cards)))
+            self.ctx.shuffle_rng.shuffle(order)
+            order = tuple(order)
+        else:
+            order = event.checked_outcome(forced)
+        self._ordered_cards.clear()
+        self._ordered_cards.extend(cards[i] for i in order)
+
+        # Copies of the same card can trade places without changing anything, so count distinct orders.
+        num_orders = math.factorial(len(cards))
+        for count in Counter(CombatStateKey.card_signature(c) for c in cards).values():
+            num_orders //= math.factorial(count)
+        event.resolve(order, 1.0 / num_orders)
 
     def pop_top_card(self):
+        CombatStateKey.invalidate(self.ctx)
         return self._ordered_cards.pop()
 
     def peek_top_card(self):
@@ -8039,6 +9218,7 @@ class CardGroup:
         # when no element to remove is found.
         try:
             self._ordered_cards.remove(card)
+            CombatStateKey.invalidate(self.ctx)
         except ValueError:
             logger.debug(
                 f"Card {card.uuid} not found for removal (this isn't necessarily an error)"
@@ -8141,9 +9321,23 @@ class CardGroup:
 
     def get_random_card(self, card_random_rng: Rng):
         # TODO Source has more options for RNG use
-        return self._ordered_cards[
-            card_random_rng.random_from_0_to(len(self._ordered_cards) - 1)
-        ]
+        handler = self.ctx.chance_handler
+        if handler is None:
+            return self._ordered_cards[
+                card_random_rng.random_from_0_to(len(self._ordered_cards) - 1)
+            ]
+
+        cards = list(self._ordered_cards)
+        event = ChanceEvent(
+            ChanceKind.RANDOM_CARD, self, cards, [1.0 / len(cards)] * len(cards)
+        )
+        forced = handler(event)
+        if forced is None:
+            i = card_random_rng.random_from_0_to(len(cards) - 1)
+        else:
+            i = event.checked_outcome(forced)
+        event.resolve(i)
+        return cards[i]
 
     def empower(self, card: Card):
         self.reset_card_before_moving(card)
@@ -8151,6 +9345,7 @@ class CardGroup:
 
     def clear(self):
         self._ordered_cards.clear()
+        CombatStateKey.invalidate(self.ctx)
 
     def get_upgradable_cards(self):
         return [c for c in self._ordered_cards if c.can_upgrade()]
@@ -8204,6 +9399,8 @@ class Power(ABC):
         self.ctx = ctx
         self.owner: Character = owner
         self._amount: Optional[int] = amount
+        # Powers are made to be added to someone, which changes the combat's key
+        CombatStateKey.invalidate(ctx)
 
     def __repr__(self):
         amount_repr = f" {self.amount}" if self.amount is not None else ""
@@ -8224,6 +9421,7 @@ class Power(ABC):
 
         logger.debug(f"Changed stack amount {self} -> {value}")
         self._amount = value
+        CombatStateKey.invalidate(self.ctx)
 
         # Source does this with lots of overrides in particular powers. I think this is equivalent and easier.
         if self.remove_self_at_zero_stacks and value == 0:
@@ -8675,6 +9873,7 @@ class RelicTier(Enum):
     SHOP = 6
 
 
+@CombatStateKey.tracks("counter")
 class Relic(ABC):
     def __init__(self, ctx: CCG.Context, counter=-1):
         # As best I can tell, counter at -1 means the relic doesn't show a count and is disarmed (if it can be armed),
@@ -9177,15 +10376,12 @@ class MonsterInfo:
         self.weight = weight
 
     @classmethod
-    def roll(cls, monster_infos: List[MonsterInfo]):
+    def roll(cls, monster_infos: List[MonsterInfo], rng: Rng):
         # This differs from source, but it lets us get away with skipping lots of silly manual work.
-        chosen = random.choices(
+        return rng.random_weighted_choice(
             [mi.name for mi in monster_infos],
-            weights=[mi.weight for mi in monster_infos],
+            [mi.weight for mi in monster_infos],
         )
-        # random.choices returns a list, by default of len 1
-        assert len(chosen) == 1
-        return chosen[0]
 
 
 class MonsterHelperHelper:
@@ -9428,6 +10624,9 @@ class Dungeon(ABC):
         self.act_num = 0
         self.relics_to_remove_on_start = []
         self.mapp: List[List[MapRoomNode]] = None
+        self.map_layout: Optional[MapLayout] = None
+        self._map_tensor: Optional[np.ndarray] = None
+        self._map_tensor_coord: Optional[MapCoord] = None
         self.special_one_time_event_list: List[EventName] = []
         assert isinstance(boss_y, int)
         self.boss_y = boss_y
@@ -9481,16 +10680,23 @@ class Dungeon(ABC):
         self.boss_relic_pool = [
             r for r in dts.SILENT_RELIC_UNIVERSE if r.get_tier() == RelicTier.BOSS
         ]
-        random.shuffle(self.common_relic_pool)
-        random.shuffle(self.uncommon_relic_pool)
-        random.shuffle(self.rare_relic_pool)
-        random.shuffle(self.shop_relic_pool)
-        random.shuffle(self.boss_relic_pool)
+        self.ctx.relic_rng.shuffle(self.common_relic_pool)
+        self.ctx.relic_rng.shuffle(self.uncommon_relic_pool)
+        self.ctx.relic_rng.shuffle(self.rare_relic_pool)
+        self.ctx.relic_rng.shuffle(self.shop_relic_pool)
+        self.ctx.relic_rng.shuffle(self.boss_relic_pool)
 
         # self.player = player
         self.dungeon_transition_setup()
-        self.generate_monsters()
-        self.initialize_boss()
+        self.cached_layout = self.load_cached_layout()
+        if self.cached_layout:
+            self.monster_list = list(self.cached_layout.monster_list)
+            self.elite_monster_list = list(self.cached_layout.elite_monster_list)
+            self.boss_list = list(self.cached_layout.boss_list)
+            self.ctx.monster_rng.set_state(self.cached_layout.monster_rng_state)
+        else:
+            self.generate_monsters()
+            self.initialize_boss()
         self.set_boss(self.boss_list[0])
         self.initialize_event_list()
         self.initialize_shrine_list()
@@ -9709,27 +10915,113 @@ class Dungeon(ABC):
 
     # @classmethod
     def generate_map(self) -> Map:
-        mapp = MapGenerator.generate_dungeon(
+        # The cached layout is only needed to build the dungeon, so don't keep it around for forks to copy.
+        cached_layout, self.cached_layout = self.cached_layout, None
+        if cached_layout:
+            self.map_layout = cached_layout.map_layout
+            self.ctx.map_rng.set_state(cached_layout.map_rng_state)
+            mapp = self.map_layout.to_nodes(self.ctx)
+            x, y = cached_layout.emerald_key
+            mapp[y][x].has_emerald_key = True
+            logger.debug(f"Loaded {self.map_layout} from layout cache")
+            return mapp
+
+        # This makes the same draws as MapGenerator and RoomTypeAssigner, but on arrays. See MapLayout.
+        layout = MapLayout.generate(
             MAP_HEIGHT, MAP_WIDTH, MAP_PATH_DENSITY, self.ctx.map_rng
         )
 
-        count = 0
-        for row in mapp:
-            for node in row:
-                if node.has_edges() and node.y != (len(mapp) - 2):
-                    count += 1
-
-        room_list = self.generate_room_types(count)
-        RoomTypeAssigner.assign_row_as_room_type(self.ctx, mapp[-1], RestRoom)
-        RoomTypeAssigner.assign_row_as_room_type(self.ctx, mapp[0], MonsterRoom)
-        RoomTypeAssigner.assign_row_as_room_type(self.ctx, mapp[8], TreasureRoom)
-        RoomTypeAssigner.distribute_rooms_across_map(
-            self.ctx, self.ctx.map_rng, mapp, room_list
-        )
-        logger.debug(f"Map:{os.linesep}{MapGenerator.to_string(mapp, True)}")
-        self.set_emerald_elite(mapp)
+        room_list = self.generate_room_types(layout.count_rooms_to_generate())
+        layout.assign_row_room_type(-1, RestRoom)
+        layout.assign_row_room_type(0, MonsterRoom)
+        layout.assign_row_room_type(8, TreasureRoom)
+        layout.distribute_room_types(
+            self.ctx.map_rng, [type(room) for room in room_list]
+        )
+        self.map_layout = layout
+
+        mapp = layout.to_nodes(self.ctx)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Map:{os.linesep}{MapGenerator.to_string(mapp, True)}")
+        emerald_node = self.set_emerald_elite(mapp)
+
+        if self.ctx.layout_cache is not None and self.ctx.seed is not None:
+            self.ctx.layout_cache.store(
+                type(self),
+                self.ctx.seed,
+                DungeonLayout(
+                    layout,
+                    (emerald_node.x, emerald_node.y),
+                    self.monster_list,
+                    self.elite_monster_list,
+                    self.boss_list,
+                    self.ctx.map_rng.get_state(),
+                    self.ctx.monster_rng.get_state(),
+                ),
+            )
         return mapp
 
+    def __getstate__(self):
+        # The map tensor is updated in place as the player moves, so copies and snapshots build their own when asked.
+        state = dict(vars(self))
+        state["cached_layout"] = None
+        state["_map_tensor"] = None
+        state["_map_tensor_coord"] = None
+        return state
+
+    def load_cached_layout(self) -> Optional[DungeonLayout]:
+        if self.ctx.layout_cache is None or self.ctx.seed is None:
+            return None
+        return self.ctx.layout_cache.load(type(self), self.ctx.seed)
+
+    def get_map_layout(self) -> MapLayout:
+        # Generated maps come with a layout. Hand-built ones get theirs on first request.
+        if self.map_layout is None:
+            self.map_layout = MapLayout.from_nodes(self.mapp)
+        return self.map_layout
+
+    def get_map_analyzer(
+        self, weights: Optional[Dict[Type[Room], float]] = None
+    ) -> MapAnalyzer:
+        return self.get_map_layout().analyze(weights)
+
+    def map_tensor(self) -> np.ndarray:
+        """(channels, MAP_HEIGHT, MAP_WIDTH) float32 encoding of the map for observations.
+
+        Channels are MapLayout#structure_tensor's (room types, edge directions), then the current node, then the nodes
+        reachable from it. The array is cached and updated in place, and only the last two channels change, when
+        curr_map_node does. Copy it to keep a snapshot.
+        """
+        node = self.curr_map_node
+        coord = None if node is None else (node.x, node.y)
+        if self._map_tensor is None:
+            structure = self.get_map_layout().structure_tensor
+            self._map_tensor = np.zeros(
+                (structure.shape[0] + 2,) + structure.shape[1:], dtype=np.float32
+            )
+            self._map_tensor[:-2] = structure
+            self._set_map_tensor_position(coord)
+        elif coord != self._map_tensor_coord:
+            self._set_map_tensor_position(coord)
+        return self._map_tensor
+
+    def _set_map_tensor_position(self, coord: Optional[MapCoord]):
+        assert self._map_tensor is not None
+        layout = self.get_map_layout()
+        current = self._map_tensor[-2]
+        reachable = self._map_tensor[-1]
+        current[:] = 0.0
+        reachable[:] = 0.0
+        if coord is not None:
+            x, y = coord
+            if 0 <= y < layout.height and 0 <= x < layout.width:
+                current[y, x] = 1.0
+                reachable[:] = layout.reachable[y, x]
+            elif y < 0:
+                # Before the first path choice, everything the first row leads to is reachable.
+                reachable[:] = layout.reachable[0, layout.edges[0] != 0].any(axis=0)
+        self._map_tensor_coord = coord
+
     # @staticmethod
     # def on_modify_power():
     #     self.ctx.player.hand.apply_powers()
@@ -9779,7 +11071,7 @@ class Dungeon(ABC):
     def dungeon_transition_setup(self):
         self.act_num += 1
         # Source sets card rng counter here
-        EventHelper.reset_probabilities()
+        EventHelper.reset_probabilities(self.ctx)
         self.event_list.clear()
         self.shrine_list.clear()
         self.monster_list.clear()
@@ -9952,7 +11244,7 @@ class Dungeon(ABC):
             i = 0
             while i < num_monsters:
                 i += 1
-                to_add = MonsterInfo.roll(monster_infos)
+                to_add = MonsterInfo.roll(monster_infos, self.ctx.monster_rng)
                 if len(self.elite_monster_list) == 0:
                     self.elite_monster_list.append(to_add)
                 else:
@@ -9965,7 +11257,7 @@ class Dungeon(ABC):
             i = 0
             while i < num_monsters:
                 i += 1
-                to_add = MonsterInfo.roll(monster_infos)
+                to_add = MonsterInfo.roll(monster_infos, self.ctx.monster_rng)
                 if len(self.monster_list) == 0:
                     self.monster_list.append(to_add)
                 else:
@@ -10237,6 +11529,7 @@ class Dungeon(ABC):
         chosen_node = elite_nodes[self.ctx.map_rng.random(0, len(elite_nodes) - 1)]
         chosen_node.has_emerald_key = True
         logger.debug(f"Put emerald key in {chosen_node}")
+        return chosen_node
 
 
 class SimpleDungeon(Dungeon):
@@ -10482,7 +11775,7 @@ class Exordium(Dungeon):
             EncounterName.HEXAGHOST,
             EncounterName.SLIME_BOSS,
         ]
-        random.shuffle(bosses)
+        self.ctx.monster_rng.shuffle(bosses)
         self.boss_list = bosses
 
     def initialize_event_list(self):
@@ -10849,7 +12142,7 @@ class RoomTypeAssigner:
         # Source only warns on this
         assert len(room_list) == node_count
 
-        random.shuffle(room_list, rng.random_float)
+        rng.shuffle(room_list)
         cls.assign_rooms_to_nodes(mapp, room_list)
         logger.debug(f"{len(room_list)} unassigned rooms")
 
@@ -10965,6 +12258,634 @@ class RoomTypeAssigner:
                     node.room = MonsterRoom(ctx)
 
 
+MAP_NO_ROOM = -1
+# Bit k of an edge mask is an edge to column k of the next row. The boss edge out of the top row gets its own bit.
+MAP_EDGE_BOSS = 1 << MAP_WIDTH
+
+
+# Positions of the set bits for every possible map bitmask, so hot loops can skip testing each bit.
+_SET_BITS = [
+    [i for i in range(MAP_WIDTH + 1) if mask & (1 << i)]
+    for mask in range(1 << (MAP_WIDTH + 1))
+]
+
+
+class MapLayout:
+    """A dungeon map held as (height, width) arrays instead of a graph of MapRoomNodes.
+
+    room_type holds indexes into dts.MAP_ROOM_UNIVERSE (MAP_NO_ROOM if unassigned), edges holds a bitmask of the
+    columns each node leads to in the next row (plus MAP_EDGE_BOSS), and parents holds a bitmask of the columns in the
+    previous row that lead to each node. generate and distribute_room_types make the same map_rng draws as
+    MapGenerator and RoomTypeAssigner, so a given rng state yields the same map either way.
+    """
+
+    def __init__(self, room_type: np.ndarray, edges: np.ndarray, parents: np.ndarray):
+        assert room_type.shape == edges.shape == parents.shape
+        self.room_type = room_type
+        self.edges = edges
+        self.parents = parents
+        self._analyzers: Dict[Tuple[float, ...], MapAnalyzer] = {}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__} {self.height}x{self.width}"
+
+    def __deepcopy__(self, memo):
+        # A layout doesn't change once its dungeon has it, so forks share it, path queries and all, rather than copy
+        # its arrays.
+        return self
+
+    def __getstate__(self):
+        # Path queries (the cached properties and analyzers) are worked out again when asked rather than pickled.
+        return {
+            "room_type": self.room_type,
+            "edges": self.edges,
+            "parents": self.parents,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def height(self) -> int:
+        return self.room_type.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.room_type.shape[1]
+
+    @classmethod
+    def generate(cls, height: int, width: int, path_density: int, rng: Rng):
+        # Generation is a long chain of dependent rng draws, so it runs on plain int lists (numpy scalar access is
+        # slower than list access) and only becomes arrays at the end.
+        edges = [[0] * width for _ in range(height)]
+        parents = [[0] * width for _ in range(height)]
+        parent_counts = [[[0] * width for _ in range(width)] for _ in range(height)]
+        first_edge_dst = [[0] * width for _ in range(height)]
+        last_edge_dst = [[0] * width for _ in range(height)]
+
+        first_starting_node = -1
+        for i in range(path_density):
+            starting_node = rng.random(0, width - 1)
+            if i == 0:
+                first_starting_node = starting_node
+
+            while starting_node == first_starting_node and i == 1:
+                starting_node = rng.random(0, width - 1)
+
+            cls._create_path(
+                edges,
+                parents,
+                parent_counts,
+                first_edge_dst,
+                last_edge_dst,
+                starting_node,
+                rng,
+            )
+
+        cls._filter_redundant_edges_from_first_row(edges)
+
+        return cls(
+            np.full((height, width), MAP_NO_ROOM, dtype=np.int8),
+            np.array(edges, dtype=np.uint8),
+            np.array(parents, dtype=np.uint8),
+        )
+
+    @classmethod
+    def _create_path(  # noqa: C901
+        cls,
+        edges: List[List[int]],
+        parents: List[List[int]],
+        parent_counts: List[List[List[int]]],
+        first_edge_dst: List[List[int]],
+        last_edge_dst: List[List[int]],
+        x: int,
+        rng: Rng,
+    ):
+        # This is MapGenerator#_create_paths unrolled into a loop. It keeps that method's quirks (see the comments
+        # there) because they change which draws get made.
+        height = len(edges)
+        row_end_node = len(edges[0]) - 1
+        min_ancestor_gap = 3
+        max_ancestor_gap = 5
+        y = 0
+
+        while y + 1 < height:
+            if x == 0:
+                lo, hi = 0, 1
+            elif x == row_end_node:
+                lo, hi = -1, 0
+            else:
+                lo, hi = -1, 1
+
+            new_x = x + rng.random(lo, hi)
+            new_y = y + 1
+            target_x = new_x
+
+            # Every recorded parent gets a look, duplicates included, since each one can cost a draw.
+            target_parent_counts = parent_counts[new_y][target_x]
+            for parent_x in _SET_BITS[parents[new_y][target_x]]:
+                if parent_x == x:
+                    continue
+                ancestor_y = cls._get_common_ancestor_y(
+                    parents, parent_x, x, y, max_ancestor_gap
+                )
+                if ancestor_y is None or new_y - ancestor_y >= min_ancestor_gap:
+                    continue
+                for _ in range(target_parent_counts[parent_x]):
+                    if target_x > x:
+                        new_x = x + rng.random(-1, 0)
+                        if new_x < 0:
+                            new_x = x
+                    elif target_x == x:
+                        new_x = x + rng.random(-1, 1)
+                        if new_x > row_end_node:
+                            new_x = x - 1
+                        elif new_x < 0:
+                            new_x = x + 1
+                    else:
+                        new_x = x + rng.random(0, 1)
+                        if new_x > row_end_node:
+                            new_x = x
+                    target_x = new_x
+
+            # Source's "max edge" of the left neighbor is really its most recently added edge, and its "min edge" of
+            # the right neighbor is really its first.
+            if x != 0 and edges[y][x - 1]:
+                if last_edge_dst[y][x - 1] > new_x:
+                    new_x = last_edge_dst[y][x - 1]
+
+            if x < row_end_node and edges[y][x + 1]:
+                if first_edge_dst[y][x + 1] < new_x:
+                    new_x = first_edge_dst[y][x + 1]
+
+            edge_bit = 1 << new_x
+            if not edges[y][x] & edge_bit:
+                if not edges[y][x]:
+                    first_edge_dst[y][x] = new_x
+                last_edge_dst[y][x] = new_x
+                edges[y][x] |= edge_bit
+            parents[new_y][new_x] |= 1 << x
+            parent_counts[new_y][new_x][x] += 1
+
+            x = new_x
+            y = new_y
+
+        edges[y][x] |= MAP_EDGE_BOSS
+
+    @classmethod
+    def _get_common_ancestor_y(
+        cls,
+        parents: List[List[int]],
+        a_x: int,
+        b_x: int,
+        y: int,
+        max_depth: int,
+    ) -> Optional[int]:
+        # Same as MapGenerator#get_common_ancestor, including comparing a's x to b's y.
+        if a_x < y:
+            left, right = a_x, b_x
+        else:
+            left, right = b_x, a_x
+
+        current_y = y
+        while current_y >= 0 and current_y >= y - max_depth:
+            left_parents = parents[current_y][left]
+            right_parents = parents[current_y][right]
+            if not left_parents or not right_parents:
+                return None
+            # Highest and lowest set bits
+            left = left_parents.bit_length() - 1
+            right = (right_parents & -right_parents).bit_length() - 1
+            if left == right:
+                return current_y - 1
+            current_y -= 1
+
+        return None
+
+    @classmethod
+    def _filter_redundant_edges_from_first_row(cls, edges: List[List[int]]):
+        # Like MapGenerator#filter_redundant_edges_from_row, this leaves the parents of the dropped edges alone.
+        seen = 0
+        for x, node_edges in enumerate(edges[0]):
+            edges[0][x] = node_edges & ~seen
+            seen |= node_edges
+
+    @classmethod
+    def from_nodes(cls, mapp: Map, height: int = MAP_HEIGHT, width: int = MAP_WIDTH):
+        # For hand-built maps. Rows past the end of mapp are left empty so every layout has the same shape.
+        assert len(mapp) <= height
+        room_type = np.full((height, width), MAP_NO_ROOM, dtype=np.int8)
+        edges = np.zeros((height, width), dtype=np.uint8)
+        parents = np.zeros((height, width), dtype=np.uint8)
+        for row in mapp:
+            for node in row:
+                if node.room is not None:
+                    room_type[node.y, node.x] = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[
+                        type(node.room)
+                    ]
+                for e in node.edges:
+                    if e.dst_y == node.y + 1:
+                        edges[node.y, node.x] |= 1 << e.dst_x
+                        parents[e.dst_y, e.dst_x] |= 1 << node.x
+                    else:
+                        edges[node.y, node.x] |= MAP_EDGE_BOSS
+
+        return cls(room_type, edges, parents)
+
+    def to_nodes(self, ctx: CCG.Context) -> Map:
+        mapp = MapGenerator.create_nodes(self.height, self.width)
+        room_universe = dts.MAP_ROOM_UNIVERSE
+        for y, x in zip(*np.nonzero(self.room_type != MAP_NO_ROOM)):
+            mapp[y][x].room = room_universe[self.room_type[y, x]](ctx)
+        for y, x in zip(*np.nonzero(self.edges)):
+            node = mapp[y][x]
+            for dst_x in _SET_BITS[self.edges[y, x]]:
+                if dst_x == MAP_WIDTH:
+                    # Source points the top row at a boss node two rows up.
+                    node.edges.append(MapEdge(x, y, 3, y + 2))
+                else:
+                    node.edges.append(MapEdge(x, y, dst_x, y + 1))
+        for y, x in zip(*np.nonzero(self.parents)):
+            for parent_x in _SET_BITS[self.parents[y, x]]:
+                mapp[y][x].add_parent(mapp[y - 1][parent_x])
+
+        return mapp
+
+    def count_rooms_to_generate(self) -> int:
+        # Source counts every node with edges, except the row under the top row.
+        has_edges = self.edges != 0
+        return int(np.count_nonzero(has_edges)) - int(
+            np.count_nonzero(has_edges[self.height - 2])
+        )
+
+    def assign_row_room_type(self, y: int, room_type: Type[Room]):
+        row = self.room_type[y]
+        # Source checks this with if
+        assert np.all(row == MAP_NO_ROOM)
+        row[:] = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[room_type]
+
+    def distribute_room_types(self, rng: Rng, room_types: List[Type[Room]]):
+        # Array version of RoomTypeAssigner#distribute_rooms_across_map.
+        type_to_index = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX
+        room_list = [type_to_index[t] for t in room_types]
+        unassigned = (self.edges != 0) & (self.room_type == MAP_NO_ROOM)
+        node_count = int(np.count_nonzero(unassigned))
+
+        monster = type_to_index[MonsterRoom]
+        while len(room_list) < node_count:
+            room_list.append(monster)
+
+        # Source only warns on this
+        assert len(room_list) == node_count
+
+        rng.shuffle(room_list)
+        self._assign_room_types_to_nodes(room_list)
+        logger.debug(f"{len(room_list)} unassigned rooms")
+
+        # Last minute node checker
+        self.room_type[(self.edges != 0) & (self.room_type == MAP_NO_ROOM)] = monster
+
+    def _assign_room_types_to_nodes(self, room_list: List[int]):
+        type_to_index = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX
+        rest = type_to_index[RestRoom]
+        elite = type_to_index[MonsterRoomElite]
+        # These mirror RoomTypeAssigner#rule_parent_matches and #rule_sibling_matches
+        parent_rule_types = {
+            type_to_index[t]
+            for t in (RestRoom, TreasureRoom, ShopRoom, MonsterRoomElite)
+        }
+        sibling_rule_types = {
+            type_to_index[t]
+            for t in (RestRoom, MonsterRoom, EventRoom, MonsterRoomElite, ShopRoom)
+        }
+
+        room_type = self.room_type.tolist()
+        edges = self.edges.tolist()
+        parents = self.parents.tolist()
+        width = self.width
+
+        for y, row in enumerate(room_type):
+            for x in range(width):
+                if not edges[y][x] or row[x] != MAP_NO_ROOM:
+                    continue
+
+                parent_rooms = set()
+                sibling_rooms = set()
+                if y > 0:
+                    parent_row = room_type[y - 1]
+                    parent_edges = edges[y - 1]
+                    for px in _SET_BITS[parents[y][x]]:
+                        parent_rooms.add(parent_row[px])
+                        for sx in _SET_BITS[parent_edges[px] & ~(1 << x)]:
+                            sibling_rooms.add(row[sx])
+
+                for i, candidate in enumerate(room_list):
+                    if y <= 4 and candidate in (rest, elite):
+                        continue
+                    if y >= 13 and candidate == rest:
+                        continue
+                    if y == 0 or not (
+                        (candidate in parent_rule_types and candidate in parent_rooms)
+                        or (
+                            candidate in sibling_rule_types
+                            and candidate in sibling_rooms
+                        )
+                    ):
+                        row[x] = candidate
+                        del room_list[i]
+                        break
+
+        self.room_type[:] = room_type
+
+    @functools.cached_property
+    def adjacency(self) -> np.ndarray:
+        """(height, width, width) bools, True at [y, x, k] if (x, y) leads to (k, y + 1)."""
+        bits = 1 << np.arange(self.width, dtype=np.uint8)
+        return (self.edges[:, :, None] & bits) != 0
+
+    @functools.cached_property
+    def on_map(self) -> np.ndarray:
+        """(height, width) bools for nodes that have an edge in or out."""
+        return (self.edges != 0) | (self.parents != 0)
+
+    @functools.cached_property
+    def _path_ends(self) -> np.ndarray:
+        # Paths end at the top row's boss edge, or at a node with nowhere left to go (like a hand-built boss room).
+        return self.on_map & ~self.adjacency.any(axis=2)
+
+    @functools.cached_property
+    def path_counts(self) -> np.ndarray:
+        """(height, width) number of distinct paths from each node to the end of the map."""
+        counts = np.zeros((self.height, self.width), dtype=np.int64)
+        adjacency = self.adjacency.astype(np.int64)
+        for y in reversed(range(self.height)):
+            if y + 1 < self.height:
+                counts[y] = adjacency[y] @ counts[y + 1]
+            counts[y][self._path_ends[y]] = 1
+        return counts
+
+    @functools.cached_property
+    def reachable(self) -> np.ndarray:
+        """(height, width, height, width) bools, where reachable[y, x] masks every node reachable from (x, y).
+
+        A node reaches itself if it's on the map.
+        """
+        reach = np.zeros((self.height, self.width, self.height, self.width), dtype=bool)
+        adjacency = self.adjacency.astype(np.uint8)
+        for y in reversed(range(self.height)):
+            if y + 1 < self.height:
+                # uint8 products can't overflow here; any nonzero sum means at least one child reaches the node.
+                reach[y] = np.tensordot(adjacency[y], reach[y + 1], axes=1) != 0
+            on_row = np.nonzero(self.on_map[y])[0]
+            reach[y, on_row, y, on_row] = True
+        return reach
+
+    @functools.cached_property
+    def room_type_one_hot(self) -> np.ndarray:
+        """(height, width, len(MAP_ROOM_UNIVERSE)) ints, 1 at each node's room type."""
+        one_hot = np.zeros(
+            (self.height, self.width, len(dts.MAP_ROOM_UNIVERSE)), dtype=np.int64
+        )
+        ys, xs = np.nonzero(self.on_map & (self.room_type != MAP_NO_ROOM))
+        one_hot[ys, xs, self.room_type[ys, xs]] = 1
+        return one_hot
+
+    @functools.cached_property
+    def structure_tensor(self) -> np.ndarray:
+        """(len(MAP_ROOM_UNIVERSE) + 4, height, width) float32 room type one-hots, then whether each node has an edge
+        going left, straight up, right, and to the boss."""
+        x = np.arange(self.width)[:, None]
+        k = np.arange(self.width)[None, :]
+        directions = [
+            (self.adjacency & (k < x)).any(axis=2),
+            (self.adjacency & (k == x)).any(axis=2),
+            (self.adjacency & (k > x)).any(axis=2),
+            (self.edges & MAP_EDGE_BOSS) != 0,
+        ]
+        return np.concatenate(
+            [np.moveaxis(self.room_type_one_hot, 2, 0), np.stack(directions)]
+        ).astype(np.float32)
+
+    def _extreme_room_type_counts(self, reduce: Callable, fill: int) -> np.ndarray:
+        counts = np.zeros_like(self.room_type_one_hot)
+        for y in reversed(range(self.height)):
+            if y + 1 < self.height:
+                children = np.where(
+                    self.adjacency[y][:, :, None], counts[y + 1][None, :, :], fill
+                )
+                best_child = reduce(children, axis=1)
+                best_child[~self.adjacency[y].any(axis=1)] = 0
+                counts[y] = best_child
+            counts[y] += self.room_type_one_hot[y]
+        counts[self.path_counts == 0] = 0
+        return counts
+
+    @functools.cached_property
+    def min_room_type_counts(self) -> np.ndarray:
+        """(height, width, len(MAP_ROOM_UNIVERSE)) fewest of each room type on any path from each node."""
+        return self._extreme_room_type_counts(np.min, np.iinfo(np.int64).max)
+
+    @functools.cached_property
+    def max_room_type_counts(self) -> np.ndarray:
+        """(height, width, len(MAP_ROOM_UNIVERSE)) most of each room type on any path from each node."""
+        return self._extreme_room_type_counts(np.max, -1)
+
+    @functools.cached_property
+    def mean_room_type_counts(self) -> np.ndarray:
+        """(height, width, len(MAP_ROOM_UNIVERSE)) average of each room type over all paths from each node."""
+        totals = np.zeros_like(self.room_type_one_hot)
+        counts = self.path_counts
+        adjacency = self.adjacency.astype(np.int64)
+        for y in reversed(range(self.height)):
+            totals[y] = self.room_type_one_hot[y] * counts[y][:, None]
+            if y + 1 < self.height:
+                totals[y] += adjacency[y] @ totals[y + 1]
+        return np.divide(
+            totals,
+            counts[:, :, None],
+            out=np.zeros(totals.shape, dtype=np.float64),
+            where=counts[:, :, None] != 0,
+        )
+
+    def analyze(self, weights: Optional[Dict[Type[Room], float]] = None) -> MapAnalyzer:
+        """The MapAnalyzer for these weights, built the first time they're asked for.
+
+        The analysis assumes the layout doesn't change afterwards, like the cached properties above.
+        """
+        key = MapAnalyzer.weights_key(weights)
+        analyzer = self._analyzers.get(key)
+        if analyzer is None:
+            analyzer = MapAnalyzer(self, key)
+            self._analyzers[key] = analyzer
+        return analyzer
+
+
+class MapAnalyzer:
+    """Best, worst and average paths from every node of a MapLayout to the end of the map.
+
+    A path scores the sum of its rooms' weights. best_score/worst_score hold the highest/lowest score of any path from
+    each node, and best_next_x/worst_next_x the column of the next row that path goes through (-1 where the path ends
+    or the node isn't on the map). Ties go to the leftmost column. The *_room_type_counts arrays count each room type
+    along those paths, indexed like dts.MAP_ROOM_UNIVERSE; the mean ones average over every path from the node.
+
+    Everything is computed up front, so answering a path choice is a lookup. Get one from MapLayout#analyze or
+    Dungeon#get_map_analyzer, which reuse analyzers for the same weights.
+    """
+
+    # Somewhere to start: elites and campfires matter most, then ? rooms and shops.
+    DEFAULT_WEIGHTS: Dict[Type[Room], float] = {
+        MonsterRoomElite: 1.0,
+        RestRoom: 1.0,
+        EventRoom: 0.5,
+        ShopRoom: 0.5,
+        MonsterRoom: 0.25,
+    }
+
+    def __init__(self, layout: MapLayout, weights: Tuple[float, ...]):
+        assert len(weights) == len(dts.MAP_ROOM_UNIVERSE)
+        self.layout = layout
+        self.weights = np.array(weights, dtype=np.float64)
+
+        (
+            self.best_score,
+            self.best_next_x,
+            self.best_room_type_counts,
+        ) = self._extreme_paths(np.argmax)
+        (
+            self.worst_score,
+            self.worst_next_x,
+            self.worst_room_type_counts,
+        ) = self._extreme_paths(np.argmin)
+        self.mean_room_type_counts = layout.mean_room_type_counts
+        self.mean_score = self.mean_room_type_counts @ self.weights
+
+        self.best_path_choice = self._to_path_choices(self.best_next_x)
+        self.worst_path_choice = self._to_path_choices(self.worst_next_x)
+        self.best_first_x = self._first_x(self.best_score, np.argmax)
+        self.worst_first_x = self._first_x(self.worst_score, np.argmin)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__} weights={self.weights.tolist()}"
+
+    @classmethod
+    def weights_key(
+        cls, weights: Optional[Dict[Type[Room], float]]
+    ) -> Tuple[float, ...]:
+        # Weights in MAP_ROOM_UNIVERSE order, with 0 for room types that aren't mentioned.
+        if weights is None:
+            weights = cls.DEFAULT_WEIGHTS
+        key = [0.0] * len(dts.MAP_ROOM_UNIVERSE)
+        for room_type, weight in weights.items():
+            key[dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[room_type]] = float(weight)
+        return tuple(key)
+
+    def _extreme_paths(
+        self, arg_reduce: Callable
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        layout = self.layout
+        one_hot = layout.room_type_one_hot
+        node_scores = one_hot @ self.weights
+        scores = np.zeros((layout.height, layout.width), dtype=np.float64)
+        next_x = np.full((layout.height, layout.width), -1, dtype=np.int8)
+        counts = np.zeros_like(one_hot)
+        # Masked out children have to lose to every real one.
+        fill = -np.inf if arg_reduce is np.argmax else np.inf
+
+        for y in reversed(range(layout.height)):
+            scores[y] = node_scores[y]
+            counts[y] = one_hot[y]
+            if y + 1 < layout.height:
+                adjacency = layout.adjacency[y]
+                has_child = adjacency.any(axis=1)
+                children = np.where(adjacency, scores[y + 1][None, :], fill)
+                chosen = arg_reduce(children, axis=1)
+                scores[y][has_child] += scores[y + 1][chosen[has_child]]
+                counts[y][has_child] += counts[y + 1][chosen[has_child]]
+                next_x[y][has_child] = chosen[has_child]
+
+        off_path = layout.path_counts == 0
+        scores[off_path] = 0.0
+        next_x[off_path] = -1
+        counts[off_path] = 0
+        return scores, next_x, counts
+
+    @staticmethod
+    def _to_path_choices(next_x: np.ndarray) -> np.ndarray:
+        # PathChoiceRequest's left/center/right are 0/1/2, by which way the edge goes.
+        x = np.arange(next_x.shape[1])[None, :]
+        choices = np.sign(next_x - x).astype(np.int8) + 1
+        choices[next_x < 0] = -1
+        return choices
+
+    def _first_x(self, scores: np.ndarray, arg_reduce: Callable) -> int:
+        fill = -np.inf if arg_reduce is np.argmax else np.inf
+        # Same rooms FirstPathChoiceRequest offers
+        available = self.layout.edges[0] != 0
+        return int(arg_reduce(np.where(available, scores[0], fill)))
+
+    def path_choice_index(self, request: PlayerRequest, worst: bool = False) -> int:
+        """Index to pass to ActionGenerator#pick_first_path (FirstPathChoiceRequest) or to play for a
+        PathChoiceRequest (0 left, 1 center, 2 right)."""
+        if isinstance(request, FirstPathChoiceRequest):
+            x = self.worst_first_x if worst else self.best_first_x
+            assert request.rooms_available[x]
+            return x
+
+        assert isinstance(request, PathChoiceRequest)
+        node = request.ctx.d.curr_map_node
+        choices = self.worst_path_choice if worst else self.best_path_choice
+        i = int(choices[node.y, node.x])
+        assert i >= 0
+        return i
+
+    @functools.cached_property
+    def features(self) -> np.ndarray:
+        """(channels, height, width) float32 stack of the scores and room type counts, for observations.
+
+        Channels are best, worst and mean score, then best, worst and mean counts for each room type.
+        """
+        counts = np.concatenate(
+            [
+                self.best_room_type_counts,
+                self.worst_room_type_counts,
+                self.mean_room_type_counts,
+            ],
+            axis=2,
+        )
+        return np.concatenate(
+            [
+                np.stack([self.best_score, self.worst_score, self.mean_score]),
+                np.moveaxis(counts, 2, 0),
+            ]
+        ).astype(np.float32)
+
+
+class DungeonLayout:
+    """What a dungeon generates from its seed before the player gets a say: the map and the encounter lists.
+
+    The rng states are taken after generation, so a dungeon built from a layout carries on drawing exactly where a
+    freshly generated one would.
+    """
+
+    def __init__(
+        self,
+        map_layout: MapLayout,
+        emerald_key: MapCoord,
+        monster_list: List[EncounterName],
+        elite_monster_list: List[EncounterName],
+        boss_list: List[EncounterName],
+        map_rng_state: Any,
+        monster_rng_state: Any,
+    ):
+        self.map_layout = map_layout
+        self.emerald_key = emerald_key
+        self.monster_list = monster_list
+        self.elite_monster_list = elite_monster_list
+        self.boss_list = boss_list
+        self.map_rng_state = map_rng_state
+        self.monster_rng_state = monster_rng_state
+
+
 class RoomResult(Enum):
     EVENT = 0
     # ELITE
@@ -10983,6 +12904,8 @@ class EventHelper:
         event_type = cls._NAME_TO_EVENT.get(name, DebugThrowOnEnterEvent)
         return event_type(ctx)
 
+    # What CCG.Context#event_chances starts out as and resets to. Each game keeps its own copy, since they change as
+    # ? rooms are rolled.
     CHANCES = {
         RoomResult.TREASURE: 0.02,
         RoomResult.SHOP: 0.03,
@@ -10991,12 +12914,11 @@ class EventHelper:
 
     @staticmethod
     def roll(ctx: CCG.Context):
+        chances = ctx.event_chances
         roll = ctx.event_rng.random_float()
-        cumul_treasure_chance = EventHelper.CHANCES[RoomResult.TREASURE]
-        cumul_shop_chance = EventHelper.CHANCES[RoomResult.SHOP] + cumul_treasure_chance
-        cumul_monster_chance = (
-            EventHelper.CHANCES[RoomResult.MONSTER] + cumul_shop_chance
-        )
+        cumul_treasure_chance = chances[RoomResult.TREASURE]
+        cumul_shop_chance = chances[RoomResult.SHOP] + cumul_treasure_chance
+        cumul_monster_chance = chances[RoomResult.MONSTER] + cumul_shop_chance
 
         if roll < cumul_treasure_chance:
             rolled_room_result = RoomResult.TREASURE
@@ -11010,32 +12932,30 @@ class EventHelper:
         # TODO tiny chest, juzu
 
         if rolled_room_result == RoomResult.MONSTER:
-            EventHelper.CHANCES[RoomResult.MONSTER] = 0.1
+            chances[RoomResult.MONSTER] = 0.1
         else:
-            EventHelper.CHANCES[RoomResult.MONSTER] += 0.1
+            chances[RoomResult.MONSTER] += 0.1
 
         if rolled_room_result == RoomResult.SHOP:
-            EventHelper.CHANCES[RoomResult.SHOP] = 0.03
+            chances[RoomResult.SHOP] = 0.03
         else:
-            EventHelper.CHANCES[RoomResult.SHOP] += 0.03
+            chances[RoomResult.SHOP] += 0.03
 
         if rolled_room_result == RoomResult.TREASURE:
-            EventHelper.CHANCES[RoomResult.TREASURE] = 0.02
+            chances[RoomResult.TREASURE] = 0.02
         else:
-            EventHelper.CHANCES[RoomResult.TREASURE] += 0.02
+            chances[RoomResult.TREASURE] += 0.02
 
-        chances_repr = pprint.pformat(EventHelper.CHANCES)
+        chances_repr = pprint.pformat(chances)
         logger.debug(
             f"Event roll {roll} means {rolled_room_result}, room chances now:{os.linesep}{chances_repr}"
         )
         return rolled_room_result
 
     @staticmethod
-    def reset_probabilities():
+    def reset_probabilities(ctx: CCG.Context):
         logger.debug("Reset event probabilities")
-        EventHelper.CHANCES[RoomResult.MONSTER] = 0.1
-        EventHelper.CHANCES[RoomResult.SHOP] = 0.03
-        EventHelper.CHANCES[RoomResult.TREASURE] = 0.02
+        ctx.event_chances = dict(EventHelper.CHANCES)
 
 
 class Chest(ABC):
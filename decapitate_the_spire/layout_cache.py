@@ -0,0 +1,265 @@
+import logging
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+
+logger = logging.getLogger("dts")
+
+_MAGIC = b"DTSLAYT"
+_FORMAT_VERSION = 1
+_MT_STATE_LEN = 625
+_MAX_MONSTER_LIST_LEN = 32
+_MAX_ELITE_LIST_LEN = 32
+_MAX_BOSS_LIST_LEN = 8
+_NO_ENCOUNTER = -1
+
+_HEADER_DTYPE = np.dtype(
+    [("magic", "S8"), ("format_version", "<u4"), ("record_size", "<u4")]
+)
+_RNG_STATE_DTYPE = np.dtype([("key", "<u4", (_MT_STATE_LEN,)), ("gauss_next", "<f8")])
+_RECORD_DTYPE = np.dtype(
+    [
+        ("dungeon", "S32"),
+        ("seed", "<i8"),
+        ("engine_version", "<u4"),
+        ("room_type", "i1", (dg.MAP_HEIGHT, dg.MAP_WIDTH)),
+        ("edges", "u1", (dg.MAP_HEIGHT, dg.MAP_WIDTH)),
+        ("parents", "u1", (dg.MAP_HEIGHT, dg.MAP_WIDTH)),
+        ("emerald_key", "i1", (2,)),
+        ("monster_list", "i1", (_MAX_MONSTER_LIST_LEN,)),
+        ("elite_monster_list", "i1", (_MAX_ELITE_LIST_LEN,)),
+        ("boss_list", "i1", (_MAX_BOSS_LIST_LEN,)),
+        ("map_rng_state", _RNG_STATE_DTYPE),
+        ("monster_rng_state", _RNG_STATE_DTYPE),
+        # Must stay last, see _checksum
+        ("checksum", "<u4"),
+    ]
+)
+
+
+class DungeonLayoutCache:
+    """Dungeon layouts on disk, keyed by (dungeon class, seed, ENGINE_VERSION).
+
+    The file is a header followed by fixed size records, read through a memory map. Workers sharing a file append
+    whole records in a single write, and pick up each other's records on a miss. Records from another engine version,
+    or whose checksum doesn't match, are ignored and get regenerated.
+
+    Pass one to Game as layout_cache. It only applies to seeded games.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._records: Optional[np.memmap] = None
+        self._index: Dict[Tuple[bytes, int], int] = {}
+        self._indexed_size = 0
+        # Which file was indexed, since a replaced one can have the same size
+        self._indexed_inode = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__} {self.path} ({len(self._index)} layouts)"
+
+    def __len__(self):
+        self._refresh()
+        return len(self._index)
+
+    def load(
+        self, dungeon_type: Type[dg.Dungeon], seed: int
+    ) -> Optional[dg.DungeonLayout]:
+        key = self._key(dungeon_type, seed)
+        record = self._find(key)
+        if record is None:
+            # Another worker (or a store since we last looked) may have added it.
+            self._refresh()
+            record = self._find(key)
+
+        if record is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self._record_to_layout(record)
+
+    def store(
+        self, dungeon_type: Type[dg.Dungeon], seed: int, layout: dg.DungeonLayout
+    ):
+        record = np.zeros((), dtype=_RECORD_DTYPE)
+        record["dungeon"], record["seed"] = self._key(dungeon_type, seed)
+        record["engine_version"] = dg.ENGINE_VERSION
+        record["room_type"] = layout.map_layout.room_type
+        record["edges"] = layout.map_layout.edges
+        record["parents"] = layout.map_layout.parents
+        record["emerald_key"] = layout.emerald_key
+        record["monster_list"] = self._pack_encounters(
+            layout.monster_list, _MAX_MONSTER_LIST_LEN
+        )
+        record["elite_monster_list"] = self._pack_encounters(
+            layout.elite_monster_list, _MAX_ELITE_LIST_LEN
+        )
+        record["boss_list"] = self._pack_encounters(
+            layout.boss_list, _MAX_BOSS_LIST_LEN
+        )
+        self._pack_rng_state(record["map_rng_state"], layout.map_rng_state)
+        self._pack_rng_state(record["monster_rng_state"], layout.monster_rng_state)
+        record["checksum"] = self._checksum(record)
+
+        self._ensure_header()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, record.tobytes())
+        finally:
+            os.close(fd)
+
+    def _find(self, key: Tuple[bytes, int]):
+        i = self._index.get(key)
+        if i is None or self._records is None:
+            return None
+
+        record = self._records[i]
+        if self._checksum(record) != int(record["checksum"]):
+            logger.warning(f"Ignoring corrupt layout for {key} in {self.path}")
+            return None
+        return record
+
+    @staticmethod
+    def _key(dungeon_type: Type[dg.Dungeon], seed: int) -> Tuple[bytes, int]:
+        assert isinstance(seed, int)
+        return dungeon_type.__name__.encode(), seed
+
+    @staticmethod
+    def _checksum(record: np.ndarray) -> int:
+        return zlib.crc32(record.tobytes()[: -_RECORD_DTYPE["checksum"].itemsize])
+
+    def _ensure_header(self):
+        header = np.zeros((), dtype=_HEADER_DTYPE)
+        header["magic"] = _MAGIC
+        header["format_version"] = _FORMAT_VERSION
+        header["record_size"] = _RECORD_DTYPE.itemsize
+
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            if self._read_header() == header.tobytes():
+                return
+            # Written by an incompatible version of this class. Nothing in it is usable, but other workers may have it
+            # mapped or be appending to it, so put a new file in its place rather than truncating it under them.
+            logger.warning(f"Replacing layout cache with unknown format: {self.path}")
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            try:
+                os.write(fd, header.tobytes())
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, self.path)
+            self._forget()
+            return
+
+        try:
+            os.write(fd, header.tobytes())
+        finally:
+            os.close(fd)
+
+    def _forget(self):
+        self._records = None
+        self._index.clear()
+        self._indexed_size = 0
+        self._indexed_inode = 0
+
+    def _read_header(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read(_HEADER_DTYPE.itemsize)
+
+    def _refresh(self):
+        # Re-map the file if it has grown or been replaced since we last looked, e.g. because another worker stored a
+        # layout.
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        size = stat.st_size
+        if size == self._indexed_size and stat.st_ino == self._indexed_inode:
+            return
+
+        header = np.frombuffer(self._read_header(), dtype=_HEADER_DTYPE)
+        num_records = (size - _HEADER_DTYPE.itemsize) // _RECORD_DTYPE.itemsize
+        if (
+            len(header) != 1
+            or header[0]["magic"] != _MAGIC
+            or header[0]["format_version"] != _FORMAT_VERSION
+            or header[0]["record_size"] != _RECORD_DTYPE.itemsize
+            or num_records <= 0
+        ):
+            # Including when another worker has replaced the file since we mapped it
+            self._forget()
+            return
+        self._records = np.memmap(
+            self.path,
+            dtype=_RECORD_DTYPE,
+            mode="r",
+            offset=_HEADER_DTYPE.itemsize,
+            shape=(num_records,),
+        )
+        self._indexed_size = (
+            _HEADER_DTYPE.itemsize + num_records * _RECORD_DTYPE.itemsize
+        )
+        self._indexed_inode = stat.st_ino
+
+        self._index.clear()
+        current = self._records["engine_version"] == dg.ENGINE_VERSION
+        dungeons = self._records["dungeon"]
+        seeds = self._records["seed"]
+        # Later records win, so a layout stored again after a corrupt one takes over.
+        for i in np.nonzero(current)[0]:
+            self._index[(bytes(dungeons[i]), int(seeds[i]))] = int(i)
+
+    @staticmethod
+    def _pack_encounters(encounters: List[dg.EncounterName], max_len: int):
+        assert len(encounters) <= max_len
+        packed = np.full(max_len, _NO_ENCOUNTER, dtype=np.int8)
+        packed[: len(encounters)] = [e.value for e in encounters]
+        return packed
+
+    @staticmethod
+    def _unpack_encounters(packed: np.ndarray) -> List[dg.EncounterName]:
+        return [dg.EncounterName(v) for v in packed.tolist() if v != _NO_ENCOUNTER]
+
+    @staticmethod
+    def _pack_rng_state(packed: np.ndarray, state: Any):
+        # This is random.Random's getstate format: (version, key + position, gauss_next)
+        version, key, gauss_next = state
+        assert version == 3 and len(key) == _MT_STATE_LEN
+        packed["key"] = key
+        packed["gauss_next"] = np.nan if gauss_next is None else gauss_next
+
+    @staticmethod
+    def _unpack_rng_state(packed: np.ndarray) -> Any:
+        gauss_next = float(packed["gauss_next"])
+        return (
+            3,
+            tuple(packed["key"].tolist()),
+            None if np.isnan(gauss_next) else gauss_next,
+        )
+
+    @classmethod
+    def _record_to_layout(cls, record: np.ndarray) -> dg.DungeonLayout:
+        # Copy out of the memory map so the layout outlives it.
+        map_layout = dg.MapLayout(
+            np.array(record["room_type"]),
+            np.array(record["edges"]),
+            np.array(record["parents"]),
+        )
+        x, y = record["emerald_key"].tolist()
+        return dg.DungeonLayout(
+            map_layout,
+            (x, y),
+            cls._unpack_encounters(record["monster_list"]),
+            cls._unpack_encounters(record["elite_monster_list"]),
+            cls._unpack_encounters(record["boss_list"]),
+            cls._unpack_rng_state(record["map_rng_state"]),
+            cls._unpack_rng_state(record["monster_rng_state"]),
+        )
@@ -0,0 +1,139 @@
+"""A flat, fixed length int16 encoding of what the player can see, for policies that run outside the engine.
+
+    obs = observe(game)
+    hand = obs[FIELDS["hand"]].reshape(dg.MAX_HAND_SIZE, HAND_SLOT_LEN)
+
+Each named field in FIELDS is a slice of the vector. Cards, powers, monsters and relics are numbered by their position
+in the universes in decapitate_the_spire/__init__.py, plus one so that 0 can mean an empty slot. Powers outside the
+universe are left out.
+"""
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+import decapitate_the_spire as dts
+import decapitate_the_spire.game as dg
+
+OBSERVATION_DTYPE = np.dtype(np.int16)
+
+# health, max health, block, energy, gold, floor, in combat, outcome (0 playing, 1 won, 2 lost)
+PLAYER_LEN = 8
+# universe index + 1, health, max health, block, intent + 1, incoming damage, then powers
+MONSTER_SLOT_LEN = 6 + len(dts.SILENT_POWER_UNIVERSE)
+# universe index + 1, times upgraded, cost for turn
+HAND_SLOT_LEN = 3
+
+
+def _fields() -> Dict[str, slice]:
+    lengths = {
+        "player": PLAYER_LEN,
+        "player_powers": len(dts.SILENT_POWER_UNIVERSE),
+        "relics": len(dts.SILENT_RELIC_UNIVERSE),
+        "monsters": dg.MAX_NUM_MONSTERS_IN_GROUP * MONSTER_SLOT_LEN,
+        "hand": dg.MAX_HAND_SIZE * HAND_SLOT_LEN,
+        "draw_pile": len(dts.SILENT_CARD_UNIVERSE),
+        "discard_pile": len(dts.SILENT_CARD_UNIVERSE),
+        "exhaust_pile": len(dts.SILENT_CARD_UNIVERSE),
+    }
+    fields = {}
+    start = 0
+    for name, length in lengths.items():
+        fields[name] = slice(start, start + length)
+        start += length
+    return fields
+
+
+# Monsters and cards come out of their groups untyped, and mypy infers the universe indexes as keyed by ABCMeta, which
+# the type of an untyped value doesn't match
+_MONSTER_INDEX: Dict[Any, int] = dts.MONSTER_TO_UNIVERSE_INDEX
+_CARD_INDEX: Dict[Any, int] = dts.CARD_TYPE_TO_UNIVERSE_INDEX
+
+FIELDS = _fields()
+OBSERVATION_LEN = max(s.stop for s in FIELDS.values())
+MASK_LEN = dg.ACTION_0_LEN * dg.ACTION_1_LEN
+
+
+def _powers(character: dg.Character, out: np.ndarray):
+    for p in character.powers:
+        i = dts.POWER_TYPE_TO_UNIVERSE_INDEX.get(type(p))
+        if i is not None:
+            # Powers without an amount, like Minion, count as 1
+            out[i] += 1 if p.amount is None else p.amount
+
+
+def observe(game: dg.Game, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Encodes game into out (a zeroed vector of OBSERVATION_LEN is made if not given) and returns it."""
+    if out is None:
+        out = np.zeros(OBSERVATION_LEN, OBSERVATION_DTYPE)
+    else:
+        out[:] = 0
+    ctx = game.ctx
+    player = ctx.player
+    room = ctx.d.get_curr_room()
+    monster_group: Optional[dg.MonsterGroup] = getattr(room, "monster_group", None)
+    if getattr(room, "phase", None) != dg.RoomPhase.COMBAT:
+        monster_group = None
+    in_combat = monster_group is not None
+
+    out[FIELDS["player"]] = (
+        player.current_health,
+        player.max_health,
+        player.current_block,
+        player.energy_manager.player_current_energy,
+        player.gold,
+        ctx.d.floor_num,
+        in_combat,
+        0 if game.game_over_and_won is None else 2 - game.game_over_and_won,
+    )
+    _powers(player, out[FIELDS["player_powers"]])
+    relics = out[FIELDS["relics"]]
+    for r in player.relics:
+        i = dts.RELIC_TYPE_TO_UNIVERSE_INDEX.get(type(r))
+        if i is not None:
+            relics[i] = 1
+
+    if monster_group is not None:
+        monsters = out[FIELDS["monsters"]].reshape(-1, MONSTER_SLOT_LEN)
+        damage = monster_group.incoming_damage_forecast().damage
+        for i, m in enumerate(list(monster_group)[: len(monsters)]):
+            if m.is_dead_or_escaped():
+                continue
+            move_info = m.move_info
+            monsters[i, :6] = (
+                _MONSTER_INDEX.get(type(m), -1) + 1,
+                m.current_health,
+                m.max_health,
+                m.current_block,
+                0 if move_info is None else move_info.intent.value + 1,
+                damage[i],
+            )
+            _powers(m, monsters[i, 6:])
+
+    hand = out[FIELDS["hand"]].reshape(-1, HAND_SLOT_LEN)
+    for i, card in enumerate(player.hand):
+        hand[i] = (
+            _CARD_INDEX[type(card)] + 1,
+            card.times_upgraded,
+            card.cost_for_turn,
+        )
+    for name in ("draw_pile", "discard_pile", "exhaust_pile"):
+        out[FIELDS[name]] = getattr(player, name).count_by_card()
+    return out
+
+
+def observe_many(games: Sequence[dg.Game]) -> np.ndarray:
+    """observe for each game, as (len(games), OBSERVATION_LEN)."""
+    observations = np.zeros((len(games), OBSERVATION_LEN), OBSERVATION_DTYPE)
+    for game, out in zip(games, observations):
+        observe(game, out)
+    return observations
+
+
+def mask_many(games: Sequence[dg.Game]) -> np.ndarray:
+    """Game#generate_action_mask for each game, flattened to (len(games), MASK_LEN). All False for games that are
+    over."""
+    masks = np.zeros((len(games), MASK_LEN), bool)
+    for game, out in zip(games, masks):
+        if not game.game_over:
+            out[:] = np.ravel(game.generate_action_mask())
+    return masks
@@ -0,0 +1,163 @@
+"""Games built ahead of time, so that resetting an environment takes a ready game instead of stalling on the map,
+card pools, monster lists and Neow room.
+
+    prefetcher = GamePrefetcher(lambda seed: GameSpec(seed).create_game(), seeds=itertools.count(1000))
+    ...
+    if is_terminal:
+        game = prefetcher.get()
+
+Games come out in seed order whoever built them. By default a helper thread keeps up to size games ready. Building
+is Python and holds the GIL, so the thread gets its time from the stepping thread's waits: on sockets, sleeps, or
+numpy and torch calls that release the GIL. With background=False, call fill at points known to be idle instead.
+A game that isn't ready yet is built by get itself, or waited for if the thread already started it. If building a
+game fails, get raises for that game only, and the games after it come as usual. Once seeds runs out, get raises
+OutOfSeedsError.
+"""
+import itertools
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import decapitate_the_spire.game as dg
+
+
+class OutOfSeedsError(Exception):
+    """GamePrefetcher#get was called after every seed's game was handed out."""
+
+
+class GamePrefetcher:
+    """Keeps up to size games from create_game(seed), for seeds in order, ready for get. hits counts gets that didn't
+    have to build their game."""
+
+    def __init__(
+        self,
+        create_game: Callable[[Optional[int]], dg.Game],
+        seeds: Optional[Iterable[Optional[int]]] = None,
+        size: int = 4,
+        background: bool = True,
+    ):
+        self.create_game = create_game
+        self.size = size
+        self._seeds = iter(itertools.repeat(None) if seeds is None else seeds)
+        self._ready: Dict[int, dg.Game] = {}
+        # Why games that couldn't be built weren't, for get to raise
+        self._failed: Dict[int, Exception] = {}
+        # Games are numbered in the order they're handed out. Numbers below _next_built_number have been claimed by a
+        # builder, and numbers below _next_get_number by get.
+        self._next_built_number = 0
+        self._next_get_number = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._out_of_seeds = False
+        self.hits = 0
+        self.misses = 0
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._thread = threading.Thread(
+                target=self._fill_loop, name="GamePrefetcher", daemon=True
+            )
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def num_ready(self) -> int:
+        return len(self._ready)
+
+    def _claim(self, force: bool = False) -> Optional[Tuple[int, Optional[int]]]:
+        """Claims the next game to build, as (number, seed), if there's room for it (or regardless, if force) and seeds
+        are left. Call holding the condition."""
+        if self._closed or self._out_of_seeds:
+            return None
+        if not force and self._next_built_number - self._next_get_number >= self.size:
+            return None
+        try:
+            seed = next(self._seeds)
+        except StopIteration:
+            self._out_of_seeds = True
+            return None
+        self._next_built_number += 1
+        return self._next_built_number - 1, seed
+
+    def _build(self, number: int, seed: Optional[int]):
+        try:
+            game = self.create_game(seed)
+        except Exception as e:
+            # get raises it when it gets to this game
+            with self._condition:
+                self._failed[number] = e
+                self._condition.notify_all()
+            return
+        with self._condition:
+            self._ready[number] = game
+            self._condition.notify_all()
+
+    def _fill_loop(self):
+        while True:
+            with self._condition:
+                claim = self._claim()
+                while claim is None:
+                    if self._closed or self._out_of_seeds:
+                        return
+                    self._condition.wait()
+                    claim = self._claim()
+            self._build(*claim)
+
+    def fill(self, max_games: Optional[int] = None) -> int:
+        """Builds games in this thread until size are ready (or max_games were built). Returns how many it built."""
+        built = 0
+        while max_games is None or built < max_games:
+            with self._condition:
+                claim = self._claim()
+            if claim is None:
+                break
+            self._build(*claim)
+            built += 1
+        return built
+
+    def get(self) -> dg.Game:
+        """The next game, in seed order. Raises RuntimeError (from create_game's error) if it couldn't be built, and
+        OutOfSeedsError once there are no more."""
+        with self._condition:
+            if self._closed:
+                raise ValueError("Prefetcher is closed")
+            number = self._next_get_number
+            if number == self._next_built_number:
+                # Nobody has started on it, so it's quicker to build it here than to wait for the thread
+                claim = self._claim(force=True)
+                if claim is None:
+                    raise OutOfSeedsError("No seeds left to build games from")
+                _, seed = claim
+                self._next_get_number += 1
+            else:
+                self._next_get_number += 1
+                while number not in self._ready and number not in self._failed:
+                    if self._closed:
+                        raise ValueError("Prefetcher is closed")
+                    self._condition.wait()
+                # There's room for another now
+                self._condition.notify_all()
+                if number in self._failed:
+                    raise RuntimeError(
+                        f"Building game {number} failed"
+                    ) from self._failed.pop(number)
+                self.hits += 1
+                return self._ready.pop(number)
+        self.misses += 1
+        try:
+            return self.create_game(seed)
+        except Exception as e:
+            raise RuntimeError(f"Building game {number} failed") from e
+
+    def close(self):
+        """Stops the helper thread, after the game it's building if any. Ready games are dropped."""
+        with self._condition:
+            self._closed = True
+            self._ready.clear()
+            self._failed.clear()
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
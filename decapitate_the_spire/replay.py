@@ -0,0 +1,441 @@
+"""Replays: a seeded game written down as how to build it and every action taken, a couple of bytes per action.
+
+    writer = ReplayWriter(GameSpec(seed=7), checkpoint_every=50, auto_resolvers=dg.AutoResolvers.combat_only())
+    while not done:
+        _, done, _ = writer.step(choose(writer.game))
+    data = writer.replay.dumps()
+
+    game = replay(Replay.loads(data))
+
+Auto resolved actions are taken from Game#history like any other, so replaying doesn't need the resolvers. Replays
+only reproduce on the engine version that wrote them (see ENGINE_VERSION), and Replay#loads refuses others.
+
+Replays can also carry keyframes, Game#dumps snapshots taken every so many actions or at each new floor, so that
+ReplayReader#seek only has to simulate from the nearest one instead of from the start. Keyframes are pickles (see
+decapitate_the_spire.snapshot), so only seek in replays with keyframes from a trusted source.
+"""
+import bisect
+import mmap
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple, Type, Union
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.layout_cache import DungeonLayoutCache
+
+_MAGIC = b"DTSRPLY"
+# 2 added keyframes
+_FORMAT_VERSION = 2
+# magic, format version, engine version, seed
+_HEADER = struct.Struct("<7sBIq")
+_COUNT = struct.Struct("<I")
+# action index, hash
+_CHECKPOINT = struct.Struct("<IQ")
+# action index, floor, offset from the first keyframe's snapshot, snapshot size
+_KEYFRAME = struct.Struct("<IiQI")
+# First byte of a pair that starts a selection rather than an action. The second byte is the number of flags, and
+# the flags follow packed into pairs, 16 to a pair.
+_SELECTION_MARKER = -128
+
+ReplayAction = Union[dg.ActionCoord, dg.Selection]
+
+
+def _plain_action(action: ReplayAction) -> ReplayAction:
+    # Actions can come as numpy arrays or hold numpy scalars, say straight from a policy's output
+    return tuple(np.asarray(action).tolist())
+
+
+class GameSpec:
+    """How to build a game, by names that can be written down: the player and dungeon classes from game.py (built with
+    just a ctx), relic classes the player starts with, and the seed."""
+
+    def __init__(
+        self,
+        seed: int,
+        player: str = "TheSilent",
+        dungeon: str = "Exordium",
+        relics: Sequence[str] = (),
+    ):
+        self.seed = seed
+        self.player = player
+        self.dungeon = dungeon
+        self.relics = tuple(relics)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.seed}, {self.player}, {self.dungeon}, {list(self.relics)})"
+
+    def __eq__(self, other):
+        return isinstance(other, GameSpec) and vars(self) == vars(other)
+
+    @staticmethod
+    def _class(name: str, base: Type) -> Type:
+        cls = getattr(dg, name, None)
+        if not (isinstance(cls, type) and issubclass(cls, base)):
+            raise ValueError(f"{name} isn't a {base.__name__}")
+        return cls
+
+    def create_game(
+        self,
+        auto_resolvers: Optional[Dict[Type[dg.PlayerRequest], dg.AutoResolver]] = None,
+        layout_cache: Optional[DungeonLayoutCache] = None,
+    ) -> dg.Game:
+        player = self._class(self.player, dg.Player)
+        dungeon = self._class(self.dungeon, dg.Dungeon)
+        relics = [self._class(r, dg.Relic) for r in self.relics]
+        return dg.Game(
+            player,
+            dungeon,
+            (lambda ctx: [r(ctx) for r in relics]) if relics else None,
+            seed=self.seed,
+            layout_cache=layout_cache,
+            auto_resolvers=auto_resolvers,
+        )
+
+
+class Keyframe:
+    """The game after some number of actions, as a Game#dumps snapshot, and the floor it was on."""
+
+    def __init__(self, floor: int, snapshot: Union[bytes, memoryview]):
+        self.floor = floor
+        self.snapshot = snapshot
+
+    def __repr__(self):
+        return f"{type(self).__name__}(floor {self.floor}, {len(self.snapshot)} bytes)"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Keyframe)
+            and self.floor == other.floor
+            and bytes(self.snapshot) == bytes(other.snapshot)
+        )
+
+
+def checkpoint_hash(game: dg.Game) -> int:
+    """64 bit hash of the game's state for checking a replay hasn't diverged: the combat state key (rngs included)
+    plus where in the dungeon the game is and whether it's over."""
+    d = game.ctx.d
+    return game.combat_state_key() ^ dg.CombatStateKey.value(
+        ("checkpoint", d.act_num, d.floor_num, game.game_over_and_won)
+    )
+
+
+class Replay:
+    """A game's spec and every action taken in it (Game#history, invalid ones included), with checkpoint hashes and
+    keyframes by number of actions taken."""
+
+    def __init__(
+        self,
+        spec: GameSpec,
+        actions: Optional[List[ReplayAction]] = None,
+        checkpoints: Optional[Dict[int, int]] = None,
+        engine_version: int = dg.ENGINE_VERSION,
+        keyframes: Optional[Dict[int, Keyframe]] = None,
+    ):
+        self.spec = spec
+        self.actions = actions if actions is not None else []
+        self.checkpoints = checkpoints if checkpoints is not None else {}
+        self.engine_version = engine_version
+        self.keyframes = keyframes if keyframes is not None else {}
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}({self.spec}, {len(self.actions)} actions, {len(self.checkpoints)} checkpoints, "
+            f"{len(self.keyframes)} keyframes)"
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Replay) and vars(self) == vars(other)
+
+    @staticmethod
+    def _pack_actions(actions: Sequence[ReplayAction]) -> bytes:
+        pairs: List[Tuple[int, int]] = []
+        for action in map(_plain_action, actions):
+            if len(action) and isinstance(action[0], bool):
+                pairs.append((_SELECTION_MARKER, len(action)))
+                for start in range(0, len(action), 16):
+                    bits = sum(
+                        1 << i for i, s in enumerate(action[start : start + 16]) if s
+                    )
+                    pairs.append((bits & 0xFF, bits >> 8))
+            else:
+                assert len(action) == 2 and all(-128 <= a < 128 for a in action)
+                pairs.append((action[0], action[1]))
+        # Actions are int8, selection bits uint8
+        return bytes(b & 0xFF for pair in pairs for b in pair)
+
+    @staticmethod
+    def _unpack_actions(
+        data: Union[bytes, memoryview], num_actions: int
+    ) -> Tuple[List[ReplayAction], int]:
+        """The actions, and how many bytes they took."""
+        actions: List[ReplayAction] = []
+        offset = 0
+
+        def signed(b: int) -> int:
+            return b - 256 if b >= 128 else b
+
+        while len(actions) < num_actions:
+            first, second = signed(data[offset]), signed(data[offset + 1])
+            offset += 2
+            if first != _SELECTION_MARKER:
+                actions.append((first, second))
+                continue
+            length = second & 0xFF
+            selection: List[bool] = []
+            while len(selection) < length:
+                bits = data[offset] | data[offset + 1] << 8
+                offset += 2
+                selection.extend(
+                    bool(bits >> i & 1) for i in range(min(16, length - len(selection)))
+                )
+            actions.append(tuple(selection))
+        return actions, offset
+
+    @staticmethod
+    def _pack_string(s: str) -> bytes:
+        encoded = s.encode()
+        return _COUNT.pack(len(encoded)) + encoded
+
+    def dumps(self) -> bytes:
+        keyframes = sorted(self.keyframes.items())
+        index = []
+        offset = 0
+        for i, keyframe in keyframes:
+            index.append(
+                _KEYFRAME.pack(i, keyframe.floor, offset, len(keyframe.snapshot))
+            )
+            offset += len(keyframe.snapshot)
+
+        parts = [
+            _HEADER.pack(_MAGIC, _FORMAT_VERSION, self.engine_version, self.spec.seed),
+            self._pack_string(self.spec.player),
+            self._pack_string(self.spec.dungeon),
+            _COUNT.pack(len(self.spec.relics)),
+            *(self._pack_string(r) for r in self.spec.relics),
+            _COUNT.pack(len(self.actions)),
+            self._pack_actions(self.actions),
+            _COUNT.pack(len(self.checkpoints)),
+            *(_CHECKPOINT.pack(i, h) for i, h in sorted(self.checkpoints.items())),
+            # The index comes first so readers can find any keyframe without going through the rest
+            _COUNT.pack(len(keyframes)),
+            *index,
+            *(keyframe.snapshot for _, keyframe in keyframes),
+        ]
+        return b"".join(parts)
+
+    @classmethod
+    def loads(
+        cls, data: Union[bytes, memoryview], any_engine_version: bool = False
+    ) -> "Replay":
+        """Raises ValueError if data isn't a replay, or is from another engine version (unless any_engine_version,
+        for looking at one that won't replay). Keyframe snapshots are slices of data, not copies, if data is a
+        memoryview."""
+        if len(data) < _HEADER.size:
+            raise ValueError("Not a replay: too short")
+        magic, format_version, engine_version, seed = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a replay: bad magic")
+        if format_version not in (1, _FORMAT_VERSION):
+            raise ValueError(
+                f"Replay format {format_version}, expected {_FORMAT_VERSION}"
+            )
+        if engine_version != dg.ENGINE_VERSION and not any_engine_version:
+            raise ValueError(
+                f"Replay is from engine version {engine_version}, this is {dg.ENGINE_VERSION}"
+            )
+        offset = _HEADER.size
+
+        def read_count() -> int:
+            nonlocal offset
+            (n,) = _COUNT.unpack_from(data, offset)
+            offset += _COUNT.size
+            return n
+
+        def read_string() -> str:
+            nonlocal offset
+            n = read_count()
+            s = bytes(data[offset : offset + n]).decode()
+            offset += n
+            return s
+
+        player = read_string()
+        dungeon = read_string()
+        relics = [read_string() for _ in range(read_count())]
+        num_actions = read_count()
+        actions, size = cls._unpack_actions(data[offset:], num_actions)
+        offset += size
+        checkpoints = {}
+        for _ in range(read_count()):
+            i, h = _CHECKPOINT.unpack_from(data, offset)
+            offset += _CHECKPOINT.size
+            checkpoints[i] = h
+
+        keyframes = {}
+        if format_version >= 2:
+            index = [
+                _KEYFRAME.unpack_from(data, offset + n * _KEYFRAME.size)
+                for n in range(read_count())
+            ]
+            offset += len(index) * _KEYFRAME.size
+            for i, floor, start, size in index:
+                keyframes[i] = Keyframe(
+                    floor, data[offset + start : offset + start + size]
+                )
+
+        return cls(
+            GameSpec(seed, player, dungeon, relics),
+            actions,
+            checkpoints,
+            engine_version,
+            keyframes,
+        )
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str) -> "Replay":
+        with open(path, "rb") as f:
+            return cls.loads(f.read())
+
+
+class ReplayWriter:
+    """Builds a game from spec and records a Replay of it as it's stepped. Step the game through the writer; steps
+    taken on the game directly are picked up (from its history) on the next one.
+
+    With checkpoint_every, the replay gets a checkpoint hash whenever another checkpoint_every actions have been
+    taken (counting auto resolved ones, so checkpoints land after the step that crosses the line). keyframe_every
+    does the same for keyframes, and keyframe_each_floor adds one after the step that reaches a new floor.
+    """
+
+    def __init__(
+        self,
+        spec: GameSpec,
+        checkpoint_every: int = 0,
+        auto_resolvers: Optional[Dict[Type[dg.PlayerRequest], dg.AutoResolver]] = None,
+        layout_cache: Optional[DungeonLayoutCache] = None,
+        keyframe_every: int = 0,
+        keyframe_each_floor: bool = False,
+    ):
+        self.game = spec.create_game(auto_resolvers, layout_cache)
+        self.replay = Replay(spec)
+        self.checkpoint_every = checkpoint_every
+        self.keyframe_every = keyframe_every
+        self.keyframe_each_floor = keyframe_each_floor
+        self._floor = self.game.ctx.d.floor_num
+        self._record()
+
+    def step(self, action: dg.ActionCoord) -> Tuple[float, bool, dict]:
+        result = self.game.step(action)
+        self._record()
+        return result
+
+    def step_selection(self, selection: Sequence[bool]) -> Tuple[float, bool, dict]:
+        result = self.game.step_selection(selection)
+        self._record()
+        return result
+
+    def _record(self):
+        actions = self.replay.actions
+        before = len(actions)
+        actions.extend(
+            _plain_action(action) for action, _ in self.game.history[before:]
+        )
+        n = len(actions)
+
+        def crossed(every: int) -> bool:
+            return every > 0 and n // every > before // every
+
+        if crossed(self.checkpoint_every):
+            self.replay.checkpoints[n] = checkpoint_hash(self.game)
+
+        floor = self.game.ctx.d.floor_num
+        new_floor = floor != self._floor
+        self._floor = floor
+        if crossed(self.keyframe_every) or (self.keyframe_each_floor and new_floor):
+            self.replay.keyframes[n] = Keyframe(floor, self.game.dumps())
+
+
+def replay(
+    r: Replay,
+    verify: bool = True,
+    num_actions: Optional[int] = None,
+    layout_cache: Optional[DungeonLayoutCache] = None,
+) -> dg.Game:
+    """Plays r's actions on a new game from its spec, up to num_actions of them (all by default), and returns the
+    game. With verify, raises ValueError at the first checkpoint that doesn't match. Keyframes aren't used, see
+    ReplayReader#seek."""
+    game = r.spec.create_game(layout_cache=layout_cache)
+    end = len(r.actions) if num_actions is None else num_actions
+    _play(r, game, 0, end, verify)
+    return game
+
+
+def _play(r: Replay, game: dg.Game, start: int, end: int, verify: bool):
+    for i in range(start, end):
+        action = r.actions[i]
+        if action and isinstance(action[0], bool):
+            game.step_selection(tuple(bool(s) for s in action))
+        else:
+            game.step((action[0], action[1]))
+        expected = r.checkpoints.get(i + 1)
+        if verify and expected is not None and checkpoint_hash(game) != expected:
+            raise ValueError(f"Replay diverged by action {i + 1}")
+
+
+class ReplayReader:
+    """Random access into a replay through its keyframes. Keyframe snapshots stay in data (or the memory mapped
+    file, see ReplayReader#open) until a seek needs one. data must be trusted, since keyframes are Game#dumps
+    snapshots."""
+
+    def __init__(
+        self,
+        data: Union[bytes, memoryview, mmap.mmap],
+        layout_cache: Optional[DungeonLayoutCache] = None,
+    ):
+        self.replay = Replay.loads(memoryview(data))
+        self.layout_cache = layout_cache
+        self._keyframe_steps = sorted(self.replay.keyframes)
+
+    @classmethod
+    def open(
+        cls, path: str, layout_cache: Optional[DungeonLayoutCache] = None
+    ) -> "ReplayReader":
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data, layout_cache)
+
+    def __len__(self):
+        return len(self.replay.actions)
+
+    def seek(self, num_actions: int, verify: bool = True) -> dg.Game:
+        """The game after num_actions actions: the nearest keyframe at or before then, played forward. With verify,
+        raises ValueError at the first checkpoint on the way that doesn't match."""
+        if not 0 <= num_actions <= len(self):
+            raise ValueError(f"Can't seek to {num_actions} of {len(self)} actions")
+        k = bisect.bisect_right(self._keyframe_steps, num_actions)
+        if k == 0:
+            return replay(self.replay, verify, num_actions, self.layout_cache)
+
+        start = self._keyframe_steps[k - 1]
+        game = dg.Game.loads(self.replay.keyframes[start].snapshot, self.layout_cache)
+        # Auto resolved actions are in the replay, so playing on mustn't resolve them again
+        game.auto_resolvers = {}
+        _play(self.replay, game, start, num_actions, verify)
+        return game
+
+    def seek_floor(self, floor: int, verify: bool = True) -> dg.Game:
+        """The game at the first keyframe on floor. Raises ValueError if there isn't one."""
+        start = next(
+            (
+                i
+                for i in self._keyframe_steps
+                if self.replay.keyframes[i].floor == floor
+            ),
+            None,
+        )
+        if start is None:
+            raise ValueError(f"No keyframe on floor {floor}")
+        return self.seek(start, verify)
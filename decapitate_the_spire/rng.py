@@ -1,22 +1,157 @@
+import copy
 import random
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    List,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+_T = TypeVar("_T")
+RngSeed = Union[int, str]
 
 
 class Rng:
+    # Subclasses that skip __init__ (like the fixed Rngs in tests) fall back to the module-level generator, which has
+    # the same methods as a random.Random.
+    _random: Any = random
+    _seed: Optional[RngSeed] = None
+
+    def __init__(self, seed: Optional[RngSeed] = None):
+        # Every Rng has its own generator, so that forks, previews and snapshots carry its state with them instead of
+        # sharing the module's. Unseeded ones are seeded from the module's, so random.seed still makes them repeatable.
+        # Snapshots write down the seed and how far along the generator is rather than its whole state.
+        self._seed = random.getrandbits(64) if seed is None else seed
+        self._random = random.Random(self._seed)
+
+    def __deepcopy__(self, memo):
+        # A generator's state is a tuple of 625 ints, which deepcopy would walk one by one. That was most of the cost
+        # of forking a game, so copy generators through their state instead.
+        rng = copy.copy(self)
+        memo[id(self)] = rng
+        for name, value in vars(self).items():
+            if isinstance(value, random.Random):
+                generator = memo.get(id(value))
+                if generator is None:
+                    generator = random.Random()
+                    generator.setstate(value.getstate())
+                    memo[id(value)] = generator
+                setattr(rng, name, generator)
+            else:
+                setattr(rng, name, copy.deepcopy(value, memo))
+        return rng
+
+    def get_state(self) -> Any:
+        return self._random.getstate()
+
+    def set_state(self, state: Any):
+        self._random.setstate(state)
+
     def random_boolean(self, chance: float = None):
         if chance:
             assert 0.0 < chance < 1.0
-            return random.random() < chance
-        return random.choice([True, False])
+            return self._random.random() < chance
+        return self._random.choice([True, False])
 
     def random(self, start: int, inclusive_end: int):
-        return random.randrange(start, inclusive_end + 1)
+        return self._random.randrange(start, inclusive_end + 1)
 
     def random_from_0_to(self, inclusive_end: int):
         return self.random(0, inclusive_end)
 
     def random_float(self):
-        return random.random()
+        return self._random.random()
 
     def random_float_between(self, start: float, end: float):
         # This is probably wrong in the way that doing anything with floats ends up being wrong, but it's source.
-        return start + random.random() * (end - start)
+        return start + self._random.random() * (end - start)
+
+    def shuffle(self, x: MutableSequence[_T]):
+        # This is what random.shuffle(x, random_float) did before Python 3.11 dropped its random argument. Draws go
+        # through random_float so overriding Rngs still control the outcome.
+        for i in reversed(range(1, len(x))):
+            j = int(self.random_float() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+    def random_weighted_choice(self, items: Sequence[_T], weights: Sequence[float]):
+        return self._random.choices(items, weights=weights)[0]
+
+
+class ScriptedRng(Rng):
+    """Answers each roll with the option the script picks for it, recording every roll's options with their
+    probabilities. Rolls past the end of the script take their first option and extend it. See enumerate_outcomes.
+
+    Continuous rolls are made discrete: random_float picks the middle of one of FLOAT_STEPS equal steps of [0, 1).
+    That's exact for checks against multiples of 1 / FLOAT_STEPS, like a chance in percent, and close otherwise.
+    """
+
+    FLOAT_STEPS = 100
+
+    def __init__(self, script: List[int]):
+        super().__init__()
+        self.script = script
+        self.rolls: List[List[Tuple[Any, float]]] = []
+
+    def _roll(self, options: List[Tuple[Any, float]]):
+        i = len(self.rolls)
+        if i == len(self.script):
+            self.script.append(0)
+        self.rolls.append(options)
+        return options[self.script[i]][0]
+
+    def random_boolean(self, chance: Optional[float] = None):
+        p = chance if chance else 0.5
+        return self._roll([(True, p), (False, 1.0 - p)])
+
+    def random(self, start: int, inclusive_end: int):
+        p = 1.0 / (inclusive_end - start + 1)
+        return self._roll([(i, p) for i in range(start, inclusive_end + 1)])
+
+    def random_from_0_to(self, inclusive_end: int):
+        return self.random(0, inclusive_end)
+
+    def random_float(self):
+        p = 1.0 / self.FLOAT_STEPS
+        return self._roll([((i + 0.5) * p, p) for i in range(self.FLOAT_STEPS)])
+
+    def random_float_between(self, start: float, end: float):
+        return start + self.random_float() * (end - start)
+
+    def random_weighted_choice(self, items: Sequence[_T], weights: Sequence[float]):
+        total = sum(weights)
+        return self._roll([(item, w / total) for item, w in zip(items, weights)])
+
+
+def enumerate_outcomes(f: Callable[[Rng], _T]) -> List[Tuple[_T, float]]:
+    """Every way f can come out with the rolls it makes on the Rng it's given, and how likely each way is. f is called
+    once per combination of rolls, so it shouldn't have side effects. Outcomes that are reached more than one way are
+    listed once for each."""
+    return [(result, probability) for result, probability, _ in enumerate_scripts(f)]
+
+
+def enumerate_scripts(f: Callable[[Rng], _T]) -> Iterator[Tuple[_T, float, List[int]]]:
+    """enumerate_outcomes, lazily and with the script for each outcome, so that ScriptedRng(script) gets f to it
+    again."""
+    script: List[int] = []
+    while True:
+        rng = ScriptedRng(script)
+        result = f(rng)
+        probability = 1.0
+        for options, choice in zip(rng.rolls, script):
+            probability *= options[choice][1]
+        yield result, probability, list(script)
+
+        # Advance the script like an odometer over each roll's options, dropping rolls after the one that changed
+        # since they may not happen at all now.
+        del script[len(rng.rolls) :]
+        while script and script[-1] == len(rng.rolls[len(script) - 1]) - 1:
+            script.pop()
+        if not script:
+            return
+        script[-1] += 1
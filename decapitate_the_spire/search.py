@@ -0,0 +1,417 @@
+"""Monte Carlo tree search over combat decisions.
+
+    search = CombatSearch()
+    result = search.search(game, iterations=2000, workers=4)
+    game.step(result.best_action)
+
+The tree is open loop: a node is the sequence of actions that led to it, not a game state. Every simulation forks the
+game, replays actions down the tree on the fork, and rolls out from there, so draws, intents and other chance outcomes
+get averaged over instead of being branched on.
+"""
+import copy
+import logging
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+logger = logging.getLogger("dts")
+
+# Picks the next action for a rollout. Must be picklable (a module level function, say) to search with workers.
+RolloutPolicy = Callable[[dg.Game, Rng], dg.ActionCoord]
+
+
+def random_rollout(game: dg.Game, rng: Rng) -> dg.ActionCoord:
+    return game.sample_legal_action(rng)
+
+
+def eager_rollout(game: dg.Game, rng: Rng) -> dg.ActionCoord:
+    """Like random_rollout, but only ends the turn when nothing else can be done. Random play spends a lot of turns
+    holding cards it could have played, which makes rollouts long and pessimistic."""
+    legal = game.generate_legal_actions()
+    end_turn = dg.ActionGenerator.end_turn()
+    others = [a for a in legal if a != end_turn]
+    if not others:
+        return end_turn
+    return others[rng.random_from_0_to(len(others) - 1)]
+
+
+def is_in_combat(game: dg.Game) -> bool:
+    return (
+        not game.game_over
+        and not game.ctx.player.is_dead
+        and game.ctx.d.get_curr_room().phase == dg.RoomPhase.COMBAT
+    )
+
+
+def combat_value(game: dg.Game) -> float:
+    """Scores a game from the player's point of view, in [0, 1]. Losing is 0, and winning the combat is worth at
+    least 0.5 plus up to 0.5 more for health left. A combat that's still going is worth under 0.5: a quarter each for
+    the fraction of health left and the fraction of the monsters' health that's gone."""
+    player = game.ctx.player
+    if player.is_dead or game.game_over_and_won is False:
+        return 0.0
+    health = player.current_health / player.max_health
+    if not is_in_combat(game):
+        return 0.5 + 0.5 * health
+
+    monsters = game.ctx.d.get_curr_room().monster_group
+    max_health = sum(m.max_health for m in monsters)
+    remaining = sum(m.current_health for m in monsters if not m.is_dead_or_escaped())
+    damage_done = 1.0 - remaining / max_health if max_health else 1.0
+    return 0.25 * (health + damage_done)
+
+
+def _combat_rng_states(game: dg.Game) -> List:
+    return [getattr(game.ctx, name).get_state() for name in dg.COMBAT_RNG_NAMES]
+
+
+class _Node:
+    __slots__ = ("children", "visits", "value_sum")
+
+    def __init__(self):
+        self.children: Dict[dg.ActionCoord, _Node] = {}
+        self.visits = 0
+        self.value_sum = 0.0
+
+
+class SearchResult:
+    """Visit counts and value sums for each action at the root. Results from searches of the same game merge by
+    summing them, which is how root parallel workers are combined."""
+
+    def __init__(
+        self,
+        action_stats: Dict[dg.ActionCoord, Tuple[int, float]],
+        simulations: int,
+        seconds: float,
+    ):
+        self.action_stats = action_stats
+        self.simulations = simulations
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.simulations} simulations, best {self.best_action})"
+
+    @property
+    def best_action(self) -> Optional[dg.ActionCoord]:
+        # Most visited is more robust than best mean, which can come from a handful of lucky rollouts.
+        if not self.action_stats:
+            return None
+        return max(self.action_stats.items(), key=lambda kv: kv[1])[0]
+
+    def mean_value(self, action: dg.ActionCoord) -> float:
+        visits, value_sum = self.action_stats[action]
+        return value_sum / visits if visits else 0.0
+
+    @property
+    def simulations_per_second(self) -> float:
+        return self.simulations / self.seconds if self.seconds else 0.0
+
+    @classmethod
+    def merge(cls, results: List["SearchResult"]) -> "SearchResult":
+        action_stats: Dict[dg.ActionCoord, Tuple[int, float]] = {}
+        for result in results:
+            for action, (visits, value_sum) in result.action_stats.items():
+                total_visits, total_value_sum = action_stats.get(action, (0, 0.0))
+                action_stats[action] = (
+                    total_visits + visits,
+                    total_value_sum + value_sum,
+                )
+        return cls(
+            action_stats,
+            sum(r.simulations for r in results),
+            # Workers run side by side
+            max((r.seconds for r in results), default=0.0),
+        )
+
+
+class CombatSearch:
+    """UCT over the decisions of the current combat: CombatActionRequest, plus anything combat asks for in between,
+    like discards. Simulations stop when the combat does (or the player dies), or after max_rollout_steps, and are
+    scored by value_function.
+
+    With determinize, each simulation runs on Game#determinize, with the draw pile order and every roll to come
+    redrawn. Otherwise simulations all share the game's one future, and the search plans against outcomes the player
+    couldn't know.
+    """
+
+    def __init__(
+        self,
+        rollout_policy: RolloutPolicy = random_rollout,
+        exploration: float = 1.0,
+        max_rollout_steps: int = 200,
+        determinize: bool = True,
+        value_function: Callable[[dg.Game], float] = combat_value,
+        seed: Optional[int] = None,
+    ):
+        self.rollout_policy = rollout_policy
+        self.exploration = exploration
+        self.max_rollout_steps = max_rollout_steps
+        self.determinize = determinize
+        self.value_function = value_function
+        self.seed = seed
+
+    def search(
+        self,
+        game: dg.Game,
+        iterations: Optional[int] = None,
+        seconds: Optional[float] = None,
+        workers: int = 1,
+    ) -> SearchResult:
+        """Searches until iterations simulations have run or seconds have passed, whichever is first. One of them has
+        to be given. The search is anytime: stopping on seconds returns whatever's been found so far.
+
+        With more than one worker, each one searches its own tree in its own process (splitting iterations between
+        them) and the root statistics are merged. Workers are forked with the game already in memory, since games
+        don't generally pickle, so this needs a platform with fork.
+        """
+        if iterations is None and seconds is None:
+            raise ValueError("Need an iteration or time budget")
+        if not is_in_combat(game):
+            raise ValueError("Can only search from within combat")
+
+        seed = self.seed if self.seed is not None else random.getrandbits(32)
+        if workers <= 1:
+            return self._search(game, iterations, seconds, seed)
+
+        per_worker: List[Optional[int]]
+        if iterations is not None:
+            per_worker = [
+                iterations // workers + (1 if i < iterations % workers else 0)
+                for i in range(workers)
+            ]
+        else:
+            per_worker = [None] * workers
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(self, game),
+        ) as executor:
+            futures = [
+                executor.submit(_run_worker, n, seconds, seed + i)
+                for i, n in enumerate(per_worker)
+            ]
+            return SearchResult.merge([f.result() for f in futures])
+
+    def _search(
+        self,
+        game: dg.Game,
+        iterations: Optional[int],
+        seconds: Optional[float],
+        seed: int,
+    ) -> SearchResult:
+        rng = Rng(seed)
+        root = _Node()
+        # Forks take the root's auto resolvers off so that they stop at the end of combat, rather than getting
+        # fast forwarded into whatever's next.
+        base = copy.copy(game)
+        base.auto_resolvers = {}
+
+        start = time.perf_counter()
+        deadline = None if seconds is None else start + seconds
+        simulations = 0
+        while (iterations is None or simulations < iterations) and (
+            deadline is None or time.perf_counter() < deadline
+        ):
+            self._simulate(base, root, rng)
+            simulations += 1
+        elapsed = time.perf_counter() - start
+
+        logger.debug(f"Searched {simulations} simulations in {elapsed:.2f}s")
+        return SearchResult(
+            {a: (n.visits, n.value_sum) for a, n in root.children.items()},
+            simulations,
+            elapsed,
+        )
+
+    def _simulate(self, base: dg.Game, root: _Node, rng: Rng):
+        game = base.determinize(rng) if self.determinize else base.fork()
+
+        node = root
+        path = [root]
+        # Selection: walk down while every legal action here has been tried. Which actions are legal depends on how
+        # chance went on this fork, so only legal children are considered.
+        while is_in_combat(game):
+            legal = game.generate_legal_actions()
+            untried = [a for a in legal if a not in node.children]
+            if untried:
+                # Expansion
+                action = untried[rng.random_from_0_to(len(untried) - 1)]
+                child = node.children[action] = _Node()
+                game.step(action)
+                path.append(child)
+                break
+
+            log_visits = math.log(node.visits)
+            action, node = max(
+                ((a, node.children[a]) for a in legal),
+                key=lambda an: an[1].value_sum / an[1].visits
+                + self.exploration * math.sqrt(log_visits / an[1].visits),
+            )
+            game.step(action)
+            path.append(node)
+
+        # Rollout
+        for _ in range(self.max_rollout_steps):
+            if not is_in_combat(game):
+                break
+            game.step(self.rollout_policy(game, rng))
+
+        value = self.value_function(game)
+        for n in path:
+            n.visits += 1
+            n.value_sum += value
+
+
+class TurnPlan:
+    """The best way found to play out the rest of a turn. actions ends with ending the turn, or with the first action
+    whose outcome is up to chance (like a draw), after which it's time to plan again."""
+
+    def __init__(
+        self, actions: List[dg.ActionCoord], value: float, nodes: int, seconds: float
+    ):
+        self.actions = actions
+        self.value = value
+        self.nodes = nodes
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.actions}, value {self.value:.3f}, {self.nodes} nodes)"
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+
+class TurnPlanner:
+    """Exhaustive search over the rest of the current turn, up to and including ending it.
+
+    Every legal action is tried from every state (potions only with include_potions), and a line is scored by
+    score_function once the turn has ended and the monsters have acted, or once combat is over. Playing the same cards
+    in a different order usually ends up in the same state, so states are memoized by their combat_state_key (hand,
+    piles, energy, powers, monsters, ...) and each is only searched once.
+
+    Actions that draw cards or roll on a combat rng are chance nodes. Their value is the mean over chance_samples
+    outcomes, each on its own Game#determinize. Searching stops at
+    max_nodes, after which remaining states just end the turn.
+    """
+
+    def __init__(
+        self,
+        score_function: Callable[[dg.Game], float] = combat_value,
+        chance_samples: int = 4,
+        include_potions: bool = False,
+        max_nodes: int = 20000,
+        seed: Optional[int] = None,
+    ):
+        self.score_function = score_function
+        self.chance_samples = chance_samples
+        self.include_potions = include_potions
+        self.max_nodes = max_nodes
+        self.seed = seed
+        self._rng: Optional[Rng] = None
+        self._memo: Dict[int, Tuple[float, List[dg.ActionCoord]]] = {}
+        self._nodes = 0
+
+    def plan(self, game: dg.Game) -> TurnPlan:
+        if not is_in_combat(game):
+            raise ValueError("Can only plan from within combat")
+
+        self._rng = Rng(self.seed if self.seed is not None else random.getrandbits(32))
+        self._memo = {}
+        self._nodes = 0
+        # Same as CombatSearch, don't let forks get fast forwarded past the end of combat.
+        base = copy.copy(game)
+        base.auto_resolvers = {}
+
+        start = time.perf_counter()
+        value, actions = self._best(base)
+        elapsed = time.perf_counter() - start
+
+        logger.debug(f"Planned {actions} from {self._nodes} nodes in {elapsed:.2f}s")
+        return TurnPlan(actions, value, self._nodes, elapsed)
+
+    def _best(self, game: dg.Game) -> Tuple[float, List[dg.ActionCoord]]:
+        if not is_in_combat(game):
+            return self.score_function(game), []
+
+        key = game.combat_state_key(include_rng=False)
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        end_turn = dg.ActionGenerator.end_turn()
+        request = game.ctx.action_manager.outstanding_request
+        if self._nodes >= self.max_nodes and isinstance(
+            request, dg.CombatActionRequest
+        ):
+            candidates = [end_turn]
+        else:
+            candidates = game.generate_legal_actions()
+            if not self.include_potions and isinstance(request, dg.CombatActionRequest):
+                potion_start = 1 + dg.MAX_HAND_SIZE
+                candidates = [a for a in candidates if a[0] < potion_start]
+
+        best: Tuple[float, List[dg.ActionCoord]] = (-math.inf, [])
+        for action in candidates:
+            is_end_turn = (
+                isinstance(request, dg.CombatActionRequest) and action == end_turn
+            )
+            value, actions = self._evaluate(game, action, is_end_turn)
+            if value > best[0]:
+                best = (value, actions)
+
+        self._memo[key] = best
+        return best
+
+    def _evaluate(
+        self, game: dg.Game, action: dg.ActionCoord, is_end_turn: bool
+    ) -> Tuple[float, List[dg.ActionCoord]]:
+        child = game.fork()
+        draw_pile_size = len(child.ctx.player.draw_pile)
+        rng_states = _combat_rng_states(child)
+        child.step(action)
+        self._nodes += 1
+        if is_end_turn:
+            return self.score_function(child), [action]
+
+        if (
+            len(child.ctx.player.draw_pile) == draw_pile_size
+            and _combat_rng_states(child) == rng_states
+        ):
+            value, actions = self._best(child)
+            return value, [action] + actions
+
+        # That outcome was the one the game's seed and draw pile order had in store, which the player can't know. Average
+        # over resampled ones instead.
+        assert self._rng is not None
+        values = []
+        for _ in range(self.chance_samples):
+            sample = game.determinize(self._rng)
+            sample.step(action)
+            self._nodes += 1
+            values.append(self._best(sample)[0])
+        return sum(values) / len(values), [action]
+
+
+# What each forked worker searches from, set up by _init_worker
+_worker_search: Optional[Tuple[CombatSearch, dg.Game]] = None
+
+
+def _init_worker(search: CombatSearch, game: dg.Game):
+    global _worker_search
+    _worker_search = (search, game)
+
+
+def _run_worker(
+    iterations: Optional[int], seconds: Optional[float], seed: int
+) -> SearchResult:
+    assert _worker_search is not None
+    search, game = _worker_search
+    return search._search(game, iterations, seconds, seed)
@@ -0,0 +1,456 @@
+"""A pool of games behind a Unix socket, for policies that run in another process (or another Python).
+
+    python -m decapitate_the_spire serve --socket /tmp/dts.sock
+
+    with Client("/tmp/dts.sock") as client:
+        observations, masks = client.reset([0, 1, 2], seeds=[10, 11, 12])
+        rewards, terminals, observations, masks = client.step([0, 1, 2], actions)
+
+Every message is a little-endian uint32 length and then that many bytes. A request is a header (op, flags, count),
+count uint32 game ids, and then the op's arguments for every game as one array: int64 seeds for RESET, int8 action
+pairs for STEP. A response is a header (status, count) and then whole arrays again: float32 rewards and uint8
+terminals for STEP, then int16 observations (see observation.py) if Want.OBSERVATION was set, then action masks
+packed 8 to a byte if Want.MASK was. OBSERVE and MASK set those flags for games without stepping them. A failed request
+gets an ERROR status and a utf-8 message instead. Requests that are malformed or name games that don't exist (or, for
+STEP, are over) are refused before any game changes. If the engine itself fails partway through a STEP, the games
+before the one that failed stay stepped.
+
+With Want.DELTA (and both of the others), observations and masks come instead as one frame per game, in id order.
+A frame is a FrameKind byte. A FULL frame is followed by the observation and packed mask as above. A DELTA frame is
+followed by counts (uint16, uint16, uint8) of observation entries that changed by what fits in an int8, of the other
+changed entries, and of flipped mask bits. Then come the first kind's uint16 indices and int8 differences, the second
+kind's uint16 indices and int16 values, and the flipped bits' uint8 indices. Most steps only nudge a few health,
+block and pile count entries, so a delta is a few dozen bytes against a full frame's 683. Deltas are against the frame the connection last
+sent for that game. The client has applied it by the time its next request arrives, since it waits for each
+response. A game gets a full frame when it's new to the connection or reset, and after every full_frame_every
+deltas, so a client that lost track can resync by reconnecting or waiting.
+
+Ids are chosen by the client. Games are shared by every connection, and requests are handled one at a time.
+"""
+import io
+import logging
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+from enum import IntEnum, IntFlag
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple, Type, Union
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.layout_cache import DungeonLayoutCache
+from decapitate_the_spire.observation import (
+    MASK_LEN,
+    OBSERVATION_LEN,
+    mask_many,
+    observe_many,
+)
+from decapitate_the_spire.replay import GameSpec
+
+logger = logging.getLogger("dts")
+
+# The server's ends of connections are BinaryIO, and the client's is a socket file
+_Stream = Union[BinaryIO, io.BufferedIOBase]
+_LENGTH = struct.Struct("<I")
+# op, flags, number of games
+_REQUEST = struct.Struct("<BBI")
+# status, number of games
+_RESPONSE = struct.Struct("<BI")
+_PACKED_MASK_LEN = (MASK_LEN + 7) // 8
+_FRAME_KIND = struct.Struct("<B")
+# kind, observation entries changed by an int8, other changed observation entries, flipped mask bits
+_DELTA_HEADER = struct.Struct("<BHHB")
+assert MASK_LEN <= 256, "Flipped mask bits are sent as uint8"
+
+
+class Op(IntEnum):
+    RESET = 1
+    STEP = 2
+    OBSERVE = 3
+    MASK = 4
+    CLOSE = 5
+
+
+class Want(IntFlag):
+    NOTHING = 0
+    OBSERVATION = 1
+    MASK = 2
+    DELTA = 4
+
+
+class Status(IntEnum):
+    OK = 0
+    ERROR = 1
+
+
+class FrameKind(IntEnum):
+    FULL = 0
+    DELTA = 1
+
+
+# Bytes of arguments per game
+_ARGUMENT_SIZES = {Op.RESET: 8, Op.STEP: 2}
+
+
+def _read_frame(f: _Stream) -> Optional[bytes]:
+    """The next message, or None if the other end closed between messages."""
+    header = f.read(_LENGTH.size)
+    if not header:
+        return None
+    if len(header) < _LENGTH.size:
+        raise EOFError("Connection closed mid message")
+    (length,) = _LENGTH.unpack(header)
+    payload = f.read(length)
+    if len(payload) < length:
+        raise EOFError("Connection closed mid message")
+    return payload
+
+
+def _write_frame(f: _Stream, payload: bytes):
+    f.write(_LENGTH.pack(len(payload)) + payload)
+    f.flush()
+
+
+class Session:
+    """What a connection was last sent for each game, to encode Want.DELTA frames against."""
+
+    def __init__(self):
+        self.observations: Dict[int, np.ndarray] = {}
+        self.masks: Dict[int, np.ndarray] = {}
+        self.deltas_since_full: Dict[int, int] = {}
+
+    def forget(self, ids: Sequence[int]):
+        for i in ids:
+            self.observations.pop(i, None)
+            self.masks.pop(i, None)
+            self.deltas_since_full.pop(i, None)
+
+
+class GameServer(socketserver.ThreadingUnixStreamServer):
+    """Serves games built from player, dungeon and relics (names from game.py, as in GameSpec) to any number of
+    connections on socket_path. handle does the work of one request, without any socket. full_frame_every is how
+    many delta frames a game gets between full ones.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: str,
+        player: str = "TheSilent",
+        dungeon: str = "Exordium",
+        relics: Sequence[str] = (),
+        auto_resolvers: Optional[Dict[Type[dg.PlayerRequest], dg.AutoResolver]] = None,
+        layout_cache: Optional[DungeonLayoutCache] = None,
+        full_frame_every: int = 64,
+    ):
+        # A socket left by a server that didn't shut down cleanly would fail the bind
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        self.player = player
+        self.dungeon = dungeon
+        self.relics = tuple(relics)
+        self.auto_resolvers = auto_resolvers
+        self.layout_cache = layout_cache
+        self.full_frame_every = full_frame_every
+        self.games: Dict[int, dg.Game] = {}
+        self.lock = threading.Lock()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def create_game(self, seed: int) -> dg.Game:
+        return GameSpec(seed, self.player, self.dungeon, self.relics).create_game(
+            self.auto_resolvers, self.layout_cache
+        )
+
+    def _games(self, ids: np.ndarray) -> List[dg.Game]:
+        missing = [int(i) for i in ids if int(i) not in self.games]
+        if missing:
+            raise ValueError(f"No games with ids {missing}")
+        return [self.games[int(i)] for i in ids]
+
+    def handle(self, request: bytes, session: Optional[Session] = None) -> bytes:
+        """The response to request, an error response if it's bad or handling it fails. session is needed for
+        Want.DELTA."""
+        try:
+            return self._handle(request, session)
+        except Exception as e:
+            logger.exception("Failed handling request")
+            return _RESPONSE.pack(Status.ERROR, 0) + f"{type(e).__name__}: {e}".encode()
+
+    def _handle(self, request: bytes, session: Optional[Session]) -> bytes:
+        op, flags, n = _REQUEST.unpack_from(request)
+        op = Op(op)
+        want = Want(flags)
+        if want & Want.DELTA and session is None:
+            raise ValueError("Deltas need a session")
+        expected = _REQUEST.size + 4 * n + _ARGUMENT_SIZES.get(op, 0) * n
+        if len(request) != expected:
+            raise ValueError(f"{op.name} for {n} games should be {expected} bytes")
+        ids = np.frombuffer(request, "<u4", n, _REQUEST.size)
+        arguments = _REQUEST.size + 4 * n
+        sections = []
+
+        if op == Op.RESET:
+            seeds = np.frombuffer(request, "<i8", n, arguments)
+            games = [self.create_game(int(seed)) for seed in seeds]
+            self.games.update(zip(ids.tolist(), games))
+            if session is not None:
+                session.forget(ids.tolist())
+        elif op == Op.CLOSE:
+            for i in ids.tolist():
+                self.games.pop(i, None)
+            if session is not None:
+                session.forget(ids.tolist())
+            games = []
+            want = Want.NOTHING
+        else:
+            games = self._games(ids)
+            if op == Op.STEP:
+                over = [int(i) for i, g in zip(ids, games) if g.game_over]
+                if over:
+                    raise ValueError(f"Games {over} are over")
+                actions = np.frombuffer(request, np.int8, 2 * n, arguments)
+                rewards = np.empty(n, "<f4")
+                terminals = np.empty(n, np.uint8)
+                for i, (game, (action_0, action_1)) in enumerate(
+                    zip(games, actions.reshape(n, 2).tolist())
+                ):
+                    rewards[i], terminals[i], _ = game.step((action_0, action_1))
+                sections += [rewards.tobytes(), terminals.tobytes()]
+            elif op == Op.OBSERVE:
+                want |= Want.OBSERVATION
+            elif op == Op.MASK:
+                want |= Want.MASK
+
+        # A session was checked for above, when Want.DELTA was
+        if (
+            session is not None
+            and want & Want.DELTA
+            and want & Want.OBSERVATION
+            and want & Want.MASK
+        ):
+            sections.append(self._frames(session, ids.tolist(), games))
+        else:
+            if want & Want.OBSERVATION:
+                sections.append(observe_many(games).astype("<i2", copy=False).tobytes())
+            if want & Want.MASK:
+                sections.append(np.packbits(mask_many(games), axis=1).tobytes())
+        return b"".join([_RESPONSE.pack(Status.OK, n)] + sections)
+
+    def _frames(self, session: Session, ids: List[int], games: List[dg.Game]) -> bytes:
+        observations = observe_many(games).astype("<i2", copy=False)
+        masks = mask_many(games)
+        parts = []
+        # The session only takes these once every frame is made, so that it still matches the client on an error
+        deltas_since_full = {}
+        for game_id, observation, mask in zip(ids, observations, masks):
+            previous = session.observations.get(game_id)
+            deltas = session.deltas_since_full.get(game_id, 0)
+            if previous is None or deltas >= self.full_frame_every:
+                parts += [
+                    _FRAME_KIND.pack(FrameKind.FULL),
+                    observation.tobytes(),
+                    np.packbits(mask).tobytes(),
+                ]
+                deltas_since_full[game_id] = 0
+            else:
+                changed = np.flatnonzero(observation != previous)
+                differences = observation[changed].astype(np.int32) - previous[changed]
+                small = (differences >= -128) & (differences <= 127)
+                flipped = np.flatnonzero(mask != session.masks[game_id])
+                parts += [
+                    _DELTA_HEADER.pack(
+                        FrameKind.DELTA,
+                        np.count_nonzero(small),
+                        np.count_nonzero(~small),
+                        len(flipped),
+                    ),
+                    changed[small].astype("<u2").tobytes(),
+                    differences[small].astype(np.int8).tobytes(),
+                    changed[~small].astype("<u2").tobytes(),
+                    observation[changed[~small]].tobytes(),
+                    flipped.astype(np.uint8).tobytes(),
+                ]
+                deltas_since_full[game_id] = deltas + 1
+        session.deltas_since_full.update(deltas_since_full)
+        session.observations.update(zip(ids, observations))
+        session.masks.update(zip(ids, masks))
+        return b"".join(parts)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: GameServer
+
+    def handle(self):
+        session = Session()
+        while True:
+            request = _read_frame(self.rfile)
+            if request is None:
+                return
+            with self.server.lock:
+                response = self.server.handle(request, session)
+            _write_frame(self.wfile, response)
+
+
+def serve(socket_path: str, **kwargs):
+    """Runs a GameServer until interrupted. kwargs go to GameServer."""
+    with GameServer(socket_path, **kwargs) as server:
+        server.serve_forever()
+
+
+class Client:
+    """Talks to a GameServer. Every call takes a batch of game ids and makes one round trip.
+
+    Observations are int16 (num games, OBSERVATION_LEN). Masks are bool (num games, ACTION_0_LEN, ACTION_1_LEN). The
+    arrays returned are read only views of the response.
+
+    With delta, observations and masks asked for together come as Want.DELTA frames, which the client applies to the
+    last ones it got for each game. The arrays returned are then the client's own copies.
+    """
+
+    def __init__(self, socket_path: str, delta: bool = False):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile("rwb")
+        self.delta = delta
+        self.bytes_received = 0
+        self._observations: Dict[int, np.ndarray] = {}
+        self._masks: Dict[int, np.ndarray] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def _call(
+        self, op: Op, want: Want, ids: Sequence[int], arguments: bytes = b""
+    ) -> "_Response":
+        id_array = np.asarray(ids, "<u4")
+        _write_frame(
+            self._file,
+            _REQUEST.pack(op, want, len(id_array)) + id_array.tobytes() + arguments,
+        )
+        response = _read_frame(self._file)
+        if response is None:
+            raise EOFError("Server closed the connection")
+        self.bytes_received += _LENGTH.size + len(response)
+        status, n = _RESPONSE.unpack_from(response)
+        if status != Status.OK:
+            raise RuntimeError(response[_RESPONSE.size :].decode())
+        return _Response(response, n)
+
+    def reset(
+        self, ids: Sequence[int], seeds: Sequence[int], observe=True, mask=True
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Starts (or restarts) a game for each id. Returns observations and masks, each None if not asked for."""
+        want = self._want(observe, mask)
+        response = self._call(Op.RESET, want, ids, np.asarray(seeds, "<i8").tobytes())
+        return self._observations_and_masks(response, want, ids)
+
+    def step(
+        self, ids: Sequence[int], actions, observe=True, mask=True
+    ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """Steps each game with its action coord. Returns rewards, terminals, and observations and masks after."""
+        want = self._want(observe, mask)
+        response = self._call(
+            Op.STEP, want, ids, np.asarray(actions, np.int8).reshape(-1, 2).tobytes()
+        )
+        rewards = response.take("<f4", ())
+        terminals = response.take(np.uint8, ()).view(bool)
+        return (rewards, terminals) + self._observations_and_masks(response, want, ids)
+
+    def observe(self, ids: Sequence[int]) -> np.ndarray:
+        return self._call(Op.OBSERVE, Want.NOTHING, ids).observations()
+
+    def mask(self, ids: Sequence[int]) -> np.ndarray:
+        return self._call(Op.MASK, Want.NOTHING, ids).masks()
+
+    def close_games(self, ids: Sequence[int]):
+        self._call(Op.CLOSE, Want.NOTHING, ids)
+        for i in ids:
+            self._observations.pop(i, None)
+            self._masks.pop(i, None)
+
+    def _want(self, observe: bool, mask: bool) -> Want:
+        want = Want.NOTHING
+        if observe:
+            want |= Want.OBSERVATION
+        if mask:
+            want |= Want.MASK
+        if self.delta and observe and mask:
+            want |= Want.DELTA
+        return want
+
+    def _observations_and_masks(
+        self, response: "_Response", want: Want, ids: Sequence[int]
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        if not want & Want.DELTA:
+            return (
+                response.observations() if want & Want.OBSERVATION else None,
+                response.masks() if want & Want.MASK else None,
+            )
+
+        observations = np.empty((response.n, OBSERVATION_LEN), np.int16)
+        masks = np.empty((response.n, MASK_LEN), bool)
+        for k, game_id in enumerate(np.asarray(ids).tolist()):
+            (kind,) = response.read(np.uint8, 1)
+            if kind == FrameKind.FULL:
+                observation = response.read("<i2", OBSERVATION_LEN).copy()
+                mask = np.unpackbits(
+                    response.read(np.uint8, _PACKED_MASK_LEN), count=MASK_LEN
+                ).view(bool)
+                self._observations[game_id] = observation
+                self._masks[game_id] = mask
+            else:
+                observation = self._observations[game_id]
+                mask = self._masks[game_id]
+                num_small, num_large = response.read("<u2", 2).tolist()
+                (num_flipped,) = response.read(np.uint8, 1).tolist()
+                small = response.read("<u2", num_small)
+                observation[small] += response.read(np.int8, num_small)
+                large = response.read("<u2", num_large)
+                observation[large] = response.read("<i2", num_large)
+                mask[response.read(np.uint8, num_flipped)] ^= True
+            observations[k] = observation
+            masks[k] = mask
+        return observations, masks.reshape(-1, dg.ACTION_0_LEN, dg.ACTION_1_LEN)
+
+
+class _Response:
+    """Reads a response's arrays in order."""
+
+    def __init__(self, data: bytes, n: int):
+        self.data = data
+        self.n = n
+        self.offset = _RESPONSE.size
+
+    def read(self, dtype, count: int) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        a = np.frombuffer(self.data, dtype, count, self.offset)
+        self.offset += count * dtype.itemsize
+        return a
+
+    def take(self, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        """An array for every game."""
+        return self.read(dtype, self.n * int(np.prod(shape))).reshape(self.n, *shape)
+
+    def observations(self) -> np.ndarray:
+        return self.take("<i2", (OBSERVATION_LEN,))
+
+    def masks(self) -> np.ndarray:
+        packed = self.take(np.uint8, (_PACKED_MASK_LEN,))
+        masks = np.unpackbits(packed, axis=1, count=MASK_LEN).view(bool)
+        return masks.reshape(self.n, dg.ACTION_0_LEN, dg.ACTION_1_LEN)
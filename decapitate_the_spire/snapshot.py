@@ -0,0 +1,274 @@
+"""Compact binary snapshots of object graphs like Game, for shipping states between processes and checkpointing long
+runs. See Game#dumps.
+
+A snapshot is a fixed header (magic, format version and engine version) followed by a pickle. Plain pickle can't
+take a game: card recipes and monster moves hold closures and lambdas, which can't be imported by name. Those are
+pickled here by reference instead, as the function they're defined in and where their code sits in its constants,
+plus their defaults and closure contents; loading finds the code in the installed engine again, so snapshots carry
+no code. Rngs, of which a game has a dozen, are pickled as their seed and how many words they've drawn rather than
+the 2.5 KB state of their generator.
+
+Pickle saves every function by name before looking at any dispatch table, so functions go through
+Pickler#reducer_override. Everything else is in the dispatch table.
+
+WARNING: a snapshot is still a pickle, and unpickling can call anything importable that the data names. Only load
+snapshots from a trusted source, such as processes of your own, never ones that came over a network or from users.
+
+A game is a graph of several hundred engine objects with open ended state (action queues, pending requests, monster
+move tables), so snapshots pickle that graph rather than a fixed per-field layout. That keeps them exact for
+anything the engine can get into, at the cost of being about as fast as a fork rather than many times faster; see
+benchmarks/bench_snapshot.py.
+"""
+import copyreg
+import importlib
+import inspect
+import io
+import itertools
+import pickle
+import random
+import struct
+import types
+from typing import Any, Dict, Optional, Tuple, Union
+
+from decapitate_the_spire.rng import Rng, RngSeed
+
+_MAGIC = b"DTSSNAP"
+_FORMAT_VERSION = 2
+# magic, format version, engine version
+_HEADER = struct.Struct("<7sBI")
+# Mersenne Twister state: 624 words and a position
+_MT_WORDS = 624
+_MT_STATE = struct.Struct(f"<{_MT_WORDS + 1}I")
+# How many blocks of words into its sequence to look for an rng before pickling its whole state instead
+_MAX_RNG_BLOCKS = 64
+# seed -> (block, its words), the block each seed's generator was last found in. Each is a few KB, so only so many.
+_rng_blocks: Dict[RngSeed, Tuple[int, Tuple[int, ...]]] = {}
+_MAX_RNG_SEEDS = 256
+
+# (module, qualname of the function a closure is defined in, indices into co_consts down to its code)
+_CodeRef = Tuple[str, str, Tuple[int, ...]]
+_code_refs: Dict[types.CodeType, _CodeRef] = {}
+_codes: Dict[_CodeRef, types.CodeType] = {}
+
+
+class _EmptyCell:
+    """Stands in for a closure cell that hasn't been assigned yet."""
+
+
+def _outer_code(module: str, qualname: str) -> types.CodeType:
+    f: Any = importlib.import_module(module)
+    for name in qualname.split("."):
+        f = inspect.getattr_static(f, name)
+        if isinstance(f, (staticmethod, classmethod)):
+            f = f.__func__
+        elif isinstance(f, property):
+            f = f.fget
+    return inspect.unwrap(f).__code__
+
+
+def _find_code(
+    code: types.CodeType, target: types.CodeType
+) -> Optional[Tuple[int, ...]]:
+    for i, const in enumerate(code.co_consts):
+        if const is target:
+            return (i,)
+        if isinstance(const, types.CodeType):
+            path = _find_code(const, target)
+            if path is not None:
+                return (i,) + path
+    return None
+
+
+def _code_ref(f: types.FunctionType) -> _CodeRef:
+    ref = _code_refs.get(f.__code__)
+    if ref is None:
+        outer = f.__qualname__.split(".<locals>.")[0]
+        path = None
+        try:
+            path = _find_code(_outer_code(f.__module__, outer), f.__code__)
+        except (AttributeError, ImportError, TypeError):
+            pass
+        if path is None:
+            raise pickle.PicklingError(
+                f"Can't snapshot {f.__module__}.{f.__qualname__}: its code isn't in {outer}"
+            )
+        ref = _code_refs[f.__code__] = (f.__module__, outer, path)
+    return ref
+
+
+def _load_code(ref: _CodeRef) -> types.CodeType:
+    code = _codes.get(ref)
+    if code is None:
+        module, outer, path = ref
+        code = _outer_code(module, outer)
+        for i in path:
+            code = code.co_consts[i]
+        _codes[ref] = code
+    return code
+
+
+def _make_function(
+    ref: _CodeRef,
+    name: str,
+    qualname: str,
+    defaults: Optional[Tuple],
+    kwdefaults: Optional[dict],
+    num_cells: int,
+) -> types.FunctionType:
+    closure = tuple(types.CellType() for _ in range(num_cells)) or None
+    module = importlib.import_module(ref[0])
+    f = types.FunctionType(_load_code(ref), module.__dict__, name, defaults, closure)
+    f.__qualname__ = qualname
+    f.__kwdefaults__ = kwdefaults
+    return f
+
+
+def _set_cells(f: types.FunctionType, cells: Tuple):
+    for cell, value in zip(f.__closure__ or (), cells):
+        if value is not _EmptyCell:
+            cell.cell_contents = value
+
+
+def _reduce_function(f: types.FunctionType):
+    if "<" not in f.__qualname__:
+        # Importable (module level, or a method), so by name like pickle always does
+        return NotImplemented
+
+    cells = []
+    for cell in f.__closure__ or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            cells.append(_EmptyCell)
+    # Cells are filled in as state after the function exists, so closures that refer back to themselves (like
+    # recursive local functions) work.
+    return (
+        _make_function,
+        (
+            _code_ref(f),
+            f.__name__,
+            f.__qualname__,
+            f.__defaults__,
+            f.__kwdefaults__,
+            len(cells),
+        ),
+        tuple(cells),
+        None,
+        None,
+        _set_cells,
+    )
+
+
+def _make_random(state: bytes, gauss_next: Optional[float]) -> random.Random:
+    # Without __init__, which would seed it from the OS only for setstate to overwrite that
+    r = random.Random.__new__(random.Random)
+    r.setstate((3, _MT_STATE.unpack(state), gauss_next))
+    return r
+
+
+def _reduce_random(r: random.Random):
+    version, state, gauss_next = r.getstate()
+    assert version == 3
+    return _make_random, (_MT_STATE.pack(*state), gauss_next)
+
+
+def _block_words(seed: RngSeed, block: int) -> Tuple[int, ...]:
+    """The words of seed's generator once it's made block + 1 blocks of them (so block -1 is straight after
+    seeding)."""
+    start, words = _rng_blocks.get(seed) or (block + 1, ())
+    if start > block:
+        start, words = -1, random.Random(seed).getstate()[1][:_MT_WORDS]
+    if start < block:
+        r = random.Random.__new__(random.Random)
+        r.setstate((3, words + (_MT_WORDS,), None))
+        for _ in range(block - start):
+            r.getrandbits(32 * _MT_WORDS)
+        words = r.getstate()[1][:_MT_WORDS]
+    if len(_rng_blocks) >= _MAX_RNG_SEEDS:
+        _rng_blocks.clear()
+    _rng_blocks[seed] = block, words
+    return words
+
+
+def _words_drawn(seed: RngSeed, state: Tuple[int, ...]) -> Optional[int]:
+    """How many words seed's generator has drawn to get to state, or None if it doesn't within _MAX_RNG_BLOCKS
+    blocks (say the state was set by hand)."""
+    position = state[_MT_WORDS]
+    if not 0 < position <= _MT_WORDS:
+        return None
+    words = state[:_MT_WORDS]
+    # Most likely in the block last seen or a little after, since generators only go forward
+    last = _rng_blocks.get(seed, (-1, ()))[0]
+    for block in itertools.chain(range(last, _MAX_RNG_BLOCKS), range(-1, last)):
+        if _block_words(seed, block) == words and (block >= 0 or position == _MT_WORDS):
+            return block * _MT_WORDS + position
+    return None
+
+
+def _make_rng(seed: RngSeed, words: int) -> Rng:
+    block = (words - 1) // _MT_WORDS
+    rng = Rng.__new__(Rng)
+    rng._seed = seed
+    rng._random = random.Random.__new__(random.Random)
+    rng._random.setstate(
+        (3, _block_words(seed, block) + (words - block * _MT_WORDS,), None)
+    )
+    return rng
+
+
+def _reduce_rng(rng: Rng):
+    version, state, gauss_next = rng._random.getstate()
+    seed = rng._seed
+    words = None
+    if (
+        seed is not None
+        and vars(rng).keys() == {"_seed", "_random"}
+        and gauss_next is None
+    ):
+        words = _words_drawn(seed, state)
+    if words is None:
+        # The whole generator state, through _reduce_random
+        return rng.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+    return _make_rng, (seed, words)
+
+
+_DISPATCH_TABLE = copyreg.dispatch_table.copy()
+_DISPATCH_TABLE[random.Random] = _reduce_random
+_DISPATCH_TABLE[Rng] = _reduce_rng
+
+
+class _Pickler(pickle.Pickler):
+    dispatch_table = _DISPATCH_TABLE
+
+    def reducer_override(self, obj):
+        if type(obj) is types.FunctionType:
+            return _reduce_function(obj)
+        return NotImplemented
+
+
+def dumps(obj: Any, engine_version: int) -> bytes:
+    buffer = io.BytesIO()
+    buffer.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, engine_version))
+    _Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
+
+
+def loads(data: Union[bytes, memoryview], engine_version: int) -> Any:
+    """Raises ValueError if data isn't a snapshot, or was written by another format or engine version.
+
+    WARNING: data must be trusted, since loading can call anything importable that it names. See the module doc.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Not a snapshot: too short")
+    magic, format_version, snapshot_engine_version = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("Not a snapshot: bad magic")
+    if format_version != _FORMAT_VERSION:
+        raise ValueError(
+            f"Snapshot format {format_version}, expected {_FORMAT_VERSION}"
+        )
+    if snapshot_engine_version != engine_version:
+        raise ValueError(
+            f"Snapshot is from engine version {snapshot_engine_version}, this is {engine_version}"
+        )
+    return pickle.loads(memoryview(data)[_HEADER.size :])
@@ -0,0 +1,480 @@
+"""Streaming (observation, mask, action, reward, terminal) logs for offline RL, in sharded .npy columns.
+
+    columns = TrajectoryWriter.default_columns(observation_shape=(64,))
+    with TrajectoryWriter("runs/exordium", columns) as writer:
+        ...
+        writer.append(observation=obs, mask=game.generate_action_mask(), action=action, reward=r, terminal=done)
+
+A trajectory directory holds shard-NNNNN directories with one .npy per column (plus an episode column the writer
+keeps), and manifest.json listing the columns and shards. Steps are collected in fixed size buffers that a
+background thread writes out, so memory stays bounded however long the run.
+
+TrajectoryDataset reads a directory back for training, memory-mapping the shards rather than loading them:
+
+    dataset = TrajectoryDataset("runs/exordium")
+    indices, batch = dataset.sample(256, np.random.default_rng(0))
+"""
+import json
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+
+MANIFEST_NAME = "manifest.json"
+EPISODE_COLUMN = "episode"
+_FORMAT_VERSION = 1
+# Bytes reserved for each .npy header, so it can be rewritten with the final shape in place
+_NPY_HEADER_SIZE = 128
+
+# Column name to (dtype, per step shape)
+ColumnSpec = Dict[str, Tuple[np.dtype, Tuple[int, ...]]]
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    header = repr(
+        {
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": False,
+            "shape": shape,
+        }
+    ).encode("latin1")
+    prefix = np.lib.format.magic(1, 0)
+    padding = _NPY_HEADER_SIZE - len(prefix) - 2 - len(header) - 1
+    assert padding >= 0, f"npy header too long for {shape}"
+    header += b" " * padding + b"\n"
+    return prefix + len(header).to_bytes(2, "little") + header
+
+
+class _ShardColumn:
+    """A .npy file written a chunk at a time, with its header fixed up on close."""
+
+    def __init__(self, path: str, dtype: np.dtype, shape: Tuple[int, ...]):
+        self.dtype = dtype
+        self.shape = shape
+        self.num_steps = 0
+        self.file = open(path, "wb")
+        self.file.write(_npy_header(dtype, (0, *shape)))
+
+    def write(self, rows: np.ndarray):
+        self.file.write(np.ascontiguousarray(rows).data)
+        self.num_steps += len(rows)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(_npy_header(self.dtype, (self.num_steps, *self.shape)))
+        self.file.close()
+
+
+class TrajectoryWriter:
+    """Streams steps into sharded .npy columns under directory. See the module doc.
+
+    Steps are buffered buffer_steps at a time. Full buffers go to a background thread to write, with at most
+    max_pending_buffers waiting (append blocks past that), and a new shard is started once the current one reaches
+    shard_bytes. The manifest is rewritten whenever a shard is finished, so readers only ever see whole shards.
+
+    An episode ends at a step whose terminal column is set, or at end_episode.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        columns: ColumnSpec,
+        shard_bytes: int = 256 * 1024 * 1024,
+        buffer_steps: int = 4096,
+        max_pending_buffers: int = 2,
+    ):
+        if EPISODE_COLUMN in columns:
+            raise ValueError(f"{EPISODE_COLUMN} is a reserved column name")
+        os.makedirs(directory, exist_ok=True)
+        # New shards would collide with the old ones, and the manifest would be replaced
+        if any(
+            name == MANIFEST_NAME or name.startswith("shard-")
+            for name in os.listdir(directory)
+        ):
+            raise FileExistsError(f"{directory} already has a trajectory in it")
+        self.directory = directory
+        self.columns: ColumnSpec = {
+            name: (np.dtype(dtype), tuple(shape))
+            for name, (dtype, shape) in columns.items()
+        }
+        self.columns[EPISODE_COLUMN] = (np.dtype(np.int64), ())
+        self.shard_bytes = shard_bytes
+        self.buffer_steps = buffer_steps
+
+        self.episode = 0
+        self._steps_in_episode = 0
+        self._buffer = self._new_buffer()
+        self._buffered = 0
+        self._shards: List[Dict[str, Any]] = []
+        self._shard: Optional[Dict[str, _ShardColumn]] = None
+        self._shard_bytes_written = 0
+        self._error: Optional[BaseException] = None
+        self._queue: "queue.Queue[Optional[Tuple[Dict[str, np.ndarray], int]]]" = (
+            queue.Queue(max_pending_buffers)
+        )
+        self._thread = threading.Thread(
+            target=self._flush_loop, name="TrajectoryWriter", daemon=True
+        )
+        self._thread.start()
+        self._closed = False
+
+    @staticmethod
+    def default_columns(
+        observation_shape: Tuple[int, ...], observation_dtype=np.float32
+    ) -> ColumnSpec:
+        """observation as given, the raw action mask (Game#generate_action_mask), the action coord as int8s, reward and
+        terminal."""
+        return {
+            "observation": (np.dtype(observation_dtype), tuple(observation_shape)),
+            "mask": (np.dtype(bool), (dg.ACTION_0_LEN, dg.ACTION_1_LEN)),
+            "action": (np.dtype(np.int8), (2,)),
+            "reward": (np.dtype(np.float32), ()),
+            "terminal": (np.dtype(bool), ()),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _new_buffer(self) -> Dict[str, np.ndarray]:
+        return {
+            name: np.empty((self.buffer_steps, *shape), dtype)
+            for name, (dtype, shape) in self.columns.items()
+        }
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError("Trajectory flush failed") from self._error
+
+    def append(self, **values):
+        """Adds a step. values has every column but episode, each convertible to the column's dtype and shape."""
+        self._raise_if_failed()
+        if self._closed:
+            raise ValueError("Writer is closed")
+        missing = self.columns.keys() - values.keys() - {EPISODE_COLUMN}
+        if missing:
+            raise ValueError(f"Missing columns {sorted(missing)}")
+        unknown = values.keys() - (self.columns.keys() - {EPISODE_COLUMN})
+        if unknown:
+            raise ValueError(f"Unknown columns {sorted(unknown)}")
+
+        i = self._buffered
+        for name, value in values.items():
+            self._buffer[name][i] = value
+        self._buffer[EPISODE_COLUMN][i] = self.episode
+        self._buffered += 1
+        self._steps_in_episode += 1
+        if values.get("terminal", False):
+            self.end_episode()
+        if self._buffered == self.buffer_steps:
+            self._hand_off()
+
+    def end_episode(self):
+        """Starts a new episode with the next step, unless the current one has no steps yet."""
+        if self._steps_in_episode:
+            self.episode += 1
+            self._steps_in_episode = 0
+
+    def _hand_off(self):
+        if self._buffered:
+            self._queue.put((self._buffer, self._buffered))
+            self._buffer = self._new_buffer()
+            self._buffered = 0
+
+    def _flush_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    self._close_shard()
+                    if not self._shards:
+                        # So that a run with no steps reads back as an empty dataset
+                        self._write_manifest()
+                    return
+                if self._error is None:
+                    self._write(*item)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, buffer: Dict[str, np.ndarray], num_steps: int):
+        if self._shard is None:
+            name = f"shard-{len(self._shards):05d}"
+            os.makedirs(os.path.join(self.directory, name))
+            self._shard = {
+                column: _ShardColumn(
+                    os.path.join(self.directory, name, f"{column}.npy"), dtype, shape
+                )
+                for column, (dtype, shape) in self.columns.items()
+            }
+            self._shards.append(
+                {
+                    "name": name,
+                    "num_steps": 0,
+                    "first_episode": int(buffer[EPISODE_COLUMN][0]),
+                }
+            )
+        for column, rows in buffer.items():
+            self._shard[column].write(rows[:num_steps])
+            self._shard_bytes_written += rows[:num_steps].nbytes
+        shard = self._shards[-1]
+        shard["num_steps"] += num_steps
+        shard["last_episode"] = int(buffer[EPISODE_COLUMN][num_steps - 1])
+        if self._shard_bytes_written >= self.shard_bytes:
+            self._close_shard()
+
+    def _close_shard(self):
+        if self._shard is None:
+            return
+        for column in self._shard.values():
+            column.close()
+        self._shard = None
+        self._shard_bytes_written = 0
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {
+            "format_version": _FORMAT_VERSION,
+            "columns": {
+                name: {"dtype": np.lib.format.dtype_to_descr(dtype), "shape": shape}
+                for name, (dtype, shape) in self.columns.items()
+            },
+            "shards": self._shards,
+            "num_steps": sum(s["num_steps"] for s in self._shards),
+        }
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def flush(self):
+        """Writes out everything appended so far, and waits for it. The current shard stays open."""
+        self._hand_off()
+        self._queue.join()
+        self._raise_if_failed()
+
+    def close(self):
+        """Writes out the rest, finishes the shard and the manifest. Safe to call more than once."""
+        if self._closed:
+            return
+        self._hand_off()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_if_failed()
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != _FORMAT_VERSION:
+        raise ValueError(
+            f"Trajectory format {manifest['format_version']}, expected {_FORMAT_VERSION}"
+        )
+    return manifest
+
+
+class _SumTree:
+    """Priorities in the leaves of a binary tree of sums, so sampling in proportion to priority takes a walk down
+    instead of a scan. Updates and walks are batched across indices, a level at a time.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.depth = max(size - 1, 1).bit_length()
+        self.leaf_start = 1 << self.depth
+        self.nodes = np.zeros(2 * self.leaf_start)
+        self.nodes[self.leaf_start : self.leaf_start + size] = 1.0
+        level = self.leaf_start // 2
+        while level:
+            self.nodes[level : 2 * level] = (
+                self.nodes[2 * level : 4 * level : 2]
+                + self.nodes[2 * level + 1 : 4 * level : 2]
+            )
+            level //= 2
+
+    @property
+    def total(self) -> float:
+        return self.nodes[1]
+
+    def get(self, indices: np.ndarray) -> np.ndarray:
+        return self.nodes[self.leaf_start + indices]
+
+    def update(self, indices: np.ndarray, priorities: np.ndarray):
+        nodes = self.leaf_start + indices
+        self.nodes[nodes] = priorities
+        # Every leaf is at the same depth, so parents can be fixed up a level at a time
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """Leaf index for each of values, which are in [0, total)."""
+        nodes = np.ones(len(values), np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.nodes[left]
+            right = values >= left_sum
+            values = np.where(right, values - left_sum, values)
+            nodes = left + right
+        # Rounding can walk past the last leaf with a priority
+        return np.minimum(nodes - self.leaf_start, self.size - 1)
+
+
+class TrajectoryDataset:
+    """Random access to a directory written by TrajectoryWriter. Shards are memory-mapped, so only the steps that get
+    sampled are read, and memory use doesn't grow with the size of the directory.
+
+    Steps are indexed globally, in the order they were written. Episodes may span shards. columns limits what is
+    mapped and returned; the episode column is always available.
+    """
+
+    def __init__(self, directory: str, columns: Optional[Sequence[str]] = None):
+        manifest = read_manifest(directory)
+        if columns is None:
+            columns = list(manifest["columns"])
+        unknown = set(columns) - manifest["columns"].keys()
+        if unknown:
+            raise ValueError(f"Unknown columns {sorted(unknown)}")
+        self.directory = directory
+        self.columns: ColumnSpec = {
+            name: (
+                np.dtype(
+                    np.lib.format.descr_to_dtype(manifest["columns"][name]["dtype"])
+                ),
+                tuple(manifest["columns"][name]["shape"]),
+            )
+            for name in dict.fromkeys([*columns, EPISODE_COLUMN])
+        }
+        self._shards: List[Dict[str, np.ndarray]] = [
+            {
+                name: np.load(
+                    os.path.join(directory, shard["name"], f"{name}.npy"), mmap_mode="r"
+                )
+                for name in self.columns
+            }
+            for shard in manifest["shards"]
+        ]
+        sizes = np.array([s["num_steps"] for s in manifest["shards"]], np.int64)
+        self._shard_starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(
+            np.int64
+        )
+        self.num_steps = int(sizes.sum())
+
+        # Episode boundaries, found a shard at a time so at most one episode column is in memory
+        starts = []
+        ids = []
+        previous = None
+        for shard, offset in zip(self._shards, self._shard_starts):
+            episodes = np.asarray(shard[EPISODE_COLUMN])
+            changes = np.flatnonzero(episodes[1:] != episodes[:-1]) + 1
+            if previous is None or episodes[0] != previous:
+                changes = np.concatenate([[0], changes])
+            starts.append(changes + offset)
+            ids.append(episodes[changes])
+            previous = episodes[-1]
+        self._episode_starts = np.concatenate(starts + [[self.num_steps]]).astype(
+            np.int64
+        )
+        self.episode_ids = (
+            np.concatenate(ids).astype(np.int64) if ids else np.empty(0, np.int64)
+        )
+        self._priorities: Optional[_SumTree] = None
+
+    def __len__(self):
+        return self.num_steps
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.episode_ids)
+
+    def episode_steps(self, i: int) -> range:
+        """Global step indices of the i-th episode (not episode id i, though the writer numbers them the same)."""
+        return range(self._episode_starts[i], self._episode_starts[i + 1])
+
+    def episode(self, i: int) -> Dict[str, np.ndarray]:
+        """The i-th episode's columns. These are views into the mapped shard unless the episode spans shards."""
+        steps = self.episode_steps(i)
+        first = self._shard_of(np.array([steps.start]))[0]
+        start = steps.start - self._shard_starts[first]
+        if start + len(steps) <= len(self._shards[first][EPISODE_COLUMN]):
+            return {
+                name: column[start : start + len(steps)]
+                for name, column in self._shards[first].items()
+            }
+        return self.gather(np.arange(steps.start, steps.stop))
+
+    def _shard_of(self, indices: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self._shard_starts, indices, side="right") - 1
+
+    def gather(
+        self, indices: np.ndarray, out: Optional[Dict[str, np.ndarray]] = None
+    ) -> Dict[str, np.ndarray]:
+        """Copies the given steps from the shards into one array per column, or into out, which has room for them."""
+        indices = np.asarray(indices, np.int64)
+        if len(indices) and (indices.min() < 0 or indices.max() >= self.num_steps):
+            raise IndexError(f"Step indices out of range for {self.num_steps} steps")
+        if out is None:
+            out = {
+                name: np.empty((len(indices), *shape), dtype)
+                for name, (dtype, shape) in self.columns.items()
+            }
+        shard_of = self._shard_of(indices)
+        for shard in np.unique(shard_of):
+            rows = np.flatnonzero(shard_of == shard)
+            local = indices[rows] - self._shard_starts[shard]
+            for name, column in self._shards[shard].items():
+                out[name][rows] = column[local]
+        return out
+
+    def _check_not_empty(self):
+        if not self.num_steps:
+            raise ValueError(f"Can't sample from {self.directory}, it has no steps")
+
+    def sample(
+        self,
+        batch_size: int,
+        rng: np.random.Generator,
+        out: Optional[Dict[str, np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Uniformly samples batch_size steps (with replacement). Returns their indices and columns."""
+        self._check_not_empty()
+        indices = rng.integers(self.num_steps, size=batch_size)
+        return indices, self.gather(indices, out)
+
+    def sample_prioritized(
+        self,
+        batch_size: int,
+        rng: np.random.Generator,
+        beta: float = 0.4,
+        out: Optional[Dict[str, np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray], np.ndarray]:
+        """Samples batch_size steps in proportion to their priority (1 until update_priorities), one from each of
+        batch_size equal slices of the total. Also returns importance sampling weights, (N * P(i)) ** -beta scaled so
+        the largest in the batch is 1."""
+        self._check_not_empty()
+        if self._priorities is None:
+            self._priorities = _SumTree(self.num_steps)
+        tree = self._priorities
+        values = (np.arange(batch_size) + rng.random(batch_size)) * (
+            tree.total / batch_size
+        )
+        indices = tree.find(values)
+        weights = (self.num_steps * tree.get(indices) / tree.total) ** -beta
+        return indices, self.gather(indices, out), weights / weights.max()
+
+    def update_priorities(self, indices: np.ndarray, priorities: np.ndarray):
+        """Sets the priorities of the given steps, e.g. to |TD error| ** alpha. Priorities must be positive."""
+        priorities = np.asarray(priorities, np.float64)
+        if not (priorities > 0).all():
+            raise ValueError("Priorities must be positive")
+        if self._priorities is None:
+            self._priorities = _SumTree(self.num_steps)
+        self._priorities.update(np.asarray(indices, np.int64), priorities)
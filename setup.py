@@ -19,7 +19,7 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/jahabrewer/decapitate-the-spire",
     packages=find_packages(),
-    install_requires=[],
+    install_requires=["numpy"],
     classifiers=[
         "Development Status :: 2 - Pre-Alpha",
         "Topic :: Games/Entertainment",
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.async_game import AsyncGame
+from decapitate_the_spire.replay import GameSpec
+from decapitate_the_spire.rng import Rng
+
+
+class TestAsyncGame(unittest.TestCase):
+    @staticmethod
+    def _create_game(seed):
+        return GameSpec(seed).create_game(dg.AutoResolvers.combat_only())
+
+    def test_concurrent_games_play_like_sync_ones(self):
+        num_steps = 40
+        order = []
+
+        async def play(seed):
+            game = AsyncGame(self._create_game(seed))
+            rng = Rng(seed)
+            steps = 0
+            async for decision in game:
+                order.append(seed)
+                await decision.respond(game.game.sample_legal_action(rng))
+                steps += 1
+                if steps == num_steps:
+                    break
+            return game.game
+
+        async def play_all():
+            return await asyncio.gather(*(play(seed) for seed in range(5)))
+
+        games = asyncio.run(play_all())
+
+        for seed, game in enumerate(games):
+            expected = self._create_game(seed)
+            rng = Rng(seed)
+            for _ in range(num_steps):
+                if expected.game_over:
+                    break
+                expected.step(expected.sample_legal_action(rng))
+            self.assertEqual(expected.combat_state_key(), game.combat_state_key())
+        # Each game yields after a step, so they take turns
+        self.assertEqual(list(range(5)) * 2, order[:10])
+
+    def test_decisions(self):
+        async def run():
+            game = AsyncGame(tu.create_game())
+            decision = await game.next_request()
+            self.assertIs(decision, await game.next_request())
+            self.assertIn((0, 5), decision.legal_actions())
+            self.assertTrue(decision.action_mask()[0][5])
+
+            _, is_terminal, _ = await decision.respond((0, 5))
+            self.assertFalse(is_terminal)
+            self.assertTrue(decision.is_answered)
+            with self.assertRaises(ValueError):
+                await decision.respond((0, 5))
+            self.assertIsNot(decision, await game.next_request())
+
+            game.game.game_over_and_won = False
+            self.assertIsNone(await game.next_request())
+
+        asyncio.run(run())
@@ -0,0 +1,106 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+
+
+class TestAutoResolve(unittest.TestCase):
+    @staticmethod
+    def _create_game(**kwargs):
+        def create_player(ctx: dg.CCG.Context):
+            draw_pile = dg.CardGroup.explode_card_group_recipe_manifest(
+                {dg.DebugStrike.recipe(): 10}
+            )
+            return dg.TheSilent(ctx, tu.default_player_max_health, 3, draw_pile)
+
+        return dg.Game(create_player, dg.MiniDungeon, **kwargs)
+
+    def test_combat_only_skips_to_fights(self):
+        game = self._create_game(auto_resolvers=dg.AutoResolvers.combat_only())
+
+        # Neow and the first path were answered during construction
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+        )
+
+        num_steps = 0
+        is_terminal = False
+        while not is_terminal:
+            self.assertIsInstance(
+                game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+            )
+            # DebugStrike kills whatever it targets
+            action = next(
+                a
+                for a in game.generate_legal_actions()
+                if a[1] < dg.MAX_NUM_MONSTERS_IN_GROUP
+            )
+            _, is_terminal, info = tu.throw_if_step_action_was_illegal(
+                game.step(action)
+            )
+            num_steps += 1
+            self.assertLess(num_steps, 20)
+
+        self.assertTrue(info["win"])
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.BossChestRequest
+        )
+
+    def test_user_callable(self):
+        seen = []
+
+        def pick_shop(request: dg.FirstPathChoiceRequest):
+            seen.append(request)
+            return dg.ActionGenerator.pick_first_path_mini_dungeon_shop()
+
+        game = self._create_game(
+            auto_resolvers={
+                dg.SimpleChoiceEventRequest: dg.AutoResolvers.first_legal_action(),
+                dg.FirstPathChoiceRequest: pick_shop,
+            }
+        )
+
+        self.assertEqual(1, len(seen))
+        self.assertIsInstance(game.ctx.d.get_curr_room(), dg.ShopRoom)
+
+    def test_illegal_choice_raises(self):
+        game = self._create_game()
+        game.set_auto_resolver(
+            dg.FirstPathChoiceRequest, lambda request: dg.ActionGenerator.end_turn()
+        )
+        with self.assertRaises(ValueError):
+            game.step(dg.ActionGenerator.pick_neow_reward(True))
+
+    def test_boss_chest_is_left_to_the_caller(self):
+        game = self._create_game()
+        with self.assertRaises(ValueError):
+            game.set_auto_resolver(
+                dg.BossChestRequest, dg.AutoResolvers.first_legal_action()
+            )
+
+    def test_take_rewards(self):
+        game = tu.create_game()
+        request = dg.CombatRewardRequest(
+            game.ctx,
+            [dg.CardRewardItem(game.ctx), dg.GoldRewardItem(game.ctx, 10)],
+        )
+        resolve = dg.AutoResolvers.take_rewards()
+
+        self.assertEqual(
+            dg.ActionGenerator.pick_simple_combat_reward(1), resolve(request)
+        )
+        del request.rewards[1]
+        self.assertEqual(dg.ActionGenerator.end_combat_reward(), resolve(request))
+
+    def test_rest_below(self):
+        game = tu.create_game()
+        player = game.ctx.player
+        request = dg.CampfireRequest(
+            game.ctx, [dg.RestOption(game.ctx), dg.SmithOption(game.ctx)]
+        )
+        resolve = dg.AutoResolvers.rest_below(0.5)
+
+        player.current_health = player.max_health // 2 - 1
+        self.assertEqual(dg.ActionGenerator.play_card(0, None), resolve(request))
+        player.current_health = player.max_health
+        self.assertEqual(dg.ActionGenerator.play_card(1, None), resolve(request))
@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.batched_policy import BatchedPolicy, play_games, run_policy
+from decapitate_the_spire.observation import OBSERVATION_LEN
+from decapitate_the_spire.replay import GameSpec
+
+
+def first_legal(masks: np.ndarray) -> np.ndarray:
+    flat = masks.reshape(len(masks), -1).argmax(axis=1)
+    return np.stack(np.divmod(flat, dg.ACTION_1_LEN), axis=1)
+
+
+class TestBatchedPolicy(unittest.TestCase):
+    @staticmethod
+    def _create_games(num_games):
+        return [
+            GameSpec(seed).create_game(dg.AutoResolvers.combat_only())
+            for seed in range(num_games)
+        ]
+
+    def test_batches(self):
+        batch_sizes = []
+
+        def policy(observations, masks):
+            self.assertEqual((len(masks), OBSERVATION_LEN), observations.shape)
+            batch_sizes.append(len(masks))
+            return first_legal(masks)
+
+        games = self._create_games(10)
+        rewards = run_policy(games, policy, batch_size=4, timeout=None, max_steps=20)
+
+        self.assertEqual(10, len(rewards))
+        self.assertTrue(all(size <= 4 for size in batch_sizes))
+        num_steps = 0
+        for seed, game in enumerate(games):
+            expected = self._create_games(seed + 1)[seed]
+            total_reward = 0.0
+            # Ending the turn every time, some die before 20 steps
+            for _ in range(20):
+                mask = np.array(expected.generate_action_mask())[None]
+                reward, is_terminal, _ = expected.step(tuple(first_legal(mask)[0]))
+                total_reward += reward
+                num_steps += 1
+                if is_terminal:
+                    break
+            self.assertEqual(expected.combat_state_key(), game.combat_state_key())
+            self.assertEqual(total_reward, rewards[seed])
+        self.assertEqual(num_steps, sum(batch_sizes))
+        self.assertLess(len(batch_sizes), num_steps / 3)
+
+    def test_async_policy_with_fewer_games_than_batch(self):
+        async def policy(observations, masks):
+            await asyncio.sleep(0)
+            return first_legal(masks)
+
+        async def run():
+            batched = BatchedPolicy(policy, batch_size=64, timeout=None)
+            await play_games(self._create_games(3), batched, max_steps=5)
+            return batched
+
+        batched = asyncio.run(run())
+        # Every game was waiting on each batch, so none had to wait for a timeout
+        self.assertEqual((5, 15), (batched.num_batches, batched.num_decisions))
+        self.assertEqual(0, batched.num_players)
+
+    def test_timeout(self):
+        async def run():
+            batched = BatchedPolicy(
+                lambda observations, masks: first_legal(masks),
+                batch_size=8,
+                timeout=0.01,
+            )
+            batched.join(2)
+            game = self._create_games(1)[0]
+            action = await asyncio.wait_for(batched.act(game), 1)
+            self.assertTrue(game.is_action_valid(action))
+
+        asyncio.run(run())
+
+    def test_policy_errors_reach_the_games(self):
+        def policy(observations, masks):
+            raise RuntimeError("out of memory")
+
+        with self.assertRaisesRegex(RuntimeError, "out of memory"):
+            run_policy(self._create_games(2), policy)
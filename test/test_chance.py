@@ -0,0 +1,172 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import ScriptedRng, enumerate_outcomes
+
+
+class TestChance(unittest.TestCase):
+    @staticmethod
+    def _create_seeded_game(seed=0):
+        def create_player(ctx: dg.CCG.Context):
+            draw_pile = dg.CardGroup.explode_card_group_recipe_manifest(
+                {dg.Strike.recipe(): 5, dg.Defend.recipe(): 5}
+            )
+            return dg.TheSilent(ctx, 80, 3, draw_pile)
+
+        def create_dungeon(ctx: dg.CCG.Context):
+            return dg.SimpleDungeon(ctx, lambda c: dg.MonsterGroup(c, [dg.JawWorm(c)]))
+
+        game = dg.Game(create_player, create_dungeon, seed=seed)
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.pick_first_path(0))
+        )
+        return game
+
+    def test_reporting_does_not_change_outcomes(self):
+        games = [self._create_seeded_game(), self._create_seeded_game()]
+        events = []
+        games[1].ctx.chance_handler = events.append
+
+        for game in games:
+            for _ in range(3):
+                tu.throw_if_step_action_was_illegal(
+                    game.step(dg.ActionGenerator.end_turn())
+                )
+
+        self.assertEqual(games[0].combat_state_key(), games[1].combat_state_key())
+        kinds = {e.kind for e in events}
+        self.assertIn(dg.ChanceKind.SHUFFLE, kinds)
+        self.assertIn(dg.ChanceKind.MONSTER_MOVE, kinds)
+        for e in events:
+            self.assertIsNotNone(e.outcome)
+            self.assertGreater(e.probability, 0.0)
+
+    def test_force_shuffle(self):
+        game = tu.create_game()
+        discard_pile = game.ctx.player.discard_pile
+        cards = [dg.Strike(game.ctx), dg.Defend(game.ctx), dg.Strike(game.ctx)]
+        for c in cards:
+            discard_pile.add_to_top(c)
+        events = []
+
+        def reverse(event: dg.ChanceEvent):
+            events.append(event)
+            return reversed(range(len(event.outcomes)))
+
+        game.ctx.chance_handler = reverse
+        discard_pile.shuffle()
+
+        self.assertEqual(list(reversed(cards)), list(discard_pile))
+        self.assertEqual((2, 1, 0), events[0].outcome)
+        # 3 orders, since swapping the Strikes doesn't count
+        self.assertAlmostEqual(1 / 3, events[0].probability)
+
+    def test_monster_move_distribution(self):
+        game = self._create_seeded_game()
+        jaw_worm = game.ctx.d.get_curr_room().monster_group[0]
+        # Chomp was rolled at the start of combat, and nothing's been used yet
+        self.assertEqual(dg.MoveName.CHOMP, jaw_worm.next_move_name)
+        distribution = jaw_worm.move_distribution()
+        self.assertAlmostEqual(0.25, distribution[dg.MoveName.CHOMP])
+        self.assertAlmostEqual(0.3, distribution[dg.MoveName.THRASH])
+        self.assertAlmostEqual(0.45, distribution[dg.MoveName.BELLOW])
+
+        tu.throw_if_step_action_was_illegal(game.step(dg.ActionGenerator.end_turn()))
+        self.assertTrue(jaw_worm.last_move(dg.MoveName.CHOMP))
+        distribution = jaw_worm.move_distribution()
+
+        # Chomp can't follow itself: under 25 it's bellow or thrash, 25 to 54 thrash, and bellow otherwise
+        self.assertEqual(2, len(distribution))
+        self.assertAlmostEqual(0.25 * 0.4375 + 0.3, distribution[dg.MoveName.THRASH])
+        self.assertAlmostEqual(0.25 * 0.5625 + 0.45, distribution[dg.MoveName.BELLOW])
+
+    def test_force_monster_move(self):
+        game = self._create_seeded_game()
+        jaw_worm = game.ctx.d.get_curr_room().monster_group[0]
+        ai_rng_state = game.ctx.ai_rng.get_state()
+
+        def force_thrash(event: dg.ChanceEvent):
+            if event.kind == dg.ChanceKind.MONSTER_MOVE:
+                return event.outcomes.index(dg.MoveName.THRASH)
+
+        game.ctx.chance_handler = force_thrash
+        jaw_worm.roll_move()
+
+        self.assertEqual(dg.MoveName.THRASH, jaw_worm.next_move_name)
+        self.assertEqual(ai_rng_state, game.ctx.ai_rng.get_state())
+
+    def test_forced_move_is_taken_like_a_rolled_one(self):
+        games = [tu.create_game(monster=dg.GremlinWizard) for _ in range(2)]
+        wizards = [game.ctx.d.get_curr_room().monster_group[0] for game in games]
+        for wizard in wizards:
+            wizard.current_charge = 3
+        games[1].ctx.chance_handler = lambda event: event.outcomes.index(
+            dg.MoveName.ULTIMATE_BLAST
+        )
+
+        for wizard in wizards:
+            wizard.roll_move()
+
+        # Rolling for the blast spends the charge, so forcing it has to as well
+        for wizard in wizards:
+            self.assertEqual(dg.MoveName.ULTIMATE_BLAST, wizard.next_move_name)
+            self.assertEqual(0, wizard.current_charge)
+        rolled, forced = (
+            (w.move_history, w.move_overrides_index, w._is_first_move) for w in wizards
+        )
+        self.assertEqual(rolled, forced)
+
+    def test_force_random_card(self):
+        game = tu.create_game()
+        hand = game.ctx.player.hand
+        events = []
+
+        def pick_third(event: dg.ChanceEvent):
+            events.append(event)
+            return 2
+
+        game.ctx.chance_handler = pick_third
+        card = hand.get_random_card(game.ctx.card_random_rng)
+
+        self.assertIs(hand[2], card)
+        self.assertEqual(dg.ChanceKind.RANDOM_CARD, events[0].kind)
+        self.assertAlmostEqual(1 / len(hand), events[0].probability)
+
+    def test_force_random_monster(self):
+        game = tu.create_game(
+            monster_group=lambda ctx: dg.MonsterGroup(
+                ctx, [dg.SimpleMonster(ctx, 20, 1, 1) for _ in range(3)]
+            )
+        )
+        monsters = game.ctx.d.get_curr_room().monster_group
+        game.ctx.chance_handler = lambda event: 1
+
+        dg.GainBlockRandomMonsterAction(game.ctx, 7, monsters[0]).act()
+
+        # The source can't pick itself, so the second choice is the third monster
+        self.assertEqual([0, 0, 7], [m.current_block for m in monsters])
+
+    def test_forcing_out_of_range_raises(self):
+        game = tu.create_game()
+        game.ctx.chance_handler = lambda event: len(event.outcomes)
+        with self.assertRaises(ValueError):
+            game.ctx.player.hand.get_random_card(game.ctx.card_random_rng)
+        game.ctx.chance_handler = lambda event: [0] * len(event.outcomes)
+        with self.assertRaises(ValueError):
+            game.ctx.player.hand.shuffle()
+
+    def test_enumerate_outcomes(self):
+        outcomes = enumerate_outcomes(
+            lambda rng: rng.random_from_0_to(1) or rng.random_boolean(0.25)
+        )
+        self.assertEqual([(True, 0.125), (False, 0.375), (1, 0.5)], outcomes)
+
+    def test_enumerate_continuous_outcomes(self):
+        outcomes = enumerate_outcomes(lambda rng: rng.random_float() < 0.3)
+        self.assertEqual(ScriptedRng.FLOAT_STEPS, len(outcomes))
+        self.assertAlmostEqual(
+            0.3, sum(probability for hit, probability in outcomes if hit)
+        )
+        outcomes = enumerate_outcomes(lambda rng: rng.random_float_between(2.0, 4.0))
+        self.assertTrue(all(2.0 <= value < 4.0 for value, _ in outcomes))
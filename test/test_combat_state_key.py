@@ -0,0 +1,118 @@
+import copy
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+
+
+class TestCombatStateKey(unittest.TestCase):
+    @staticmethod
+    def _create_game():
+        return tu.create_game(
+            initial_draw_pile_manifest={dg.Strike.recipe(): 5, dg.Defend.recipe(): 5}
+        )
+
+    @staticmethod
+    def _play(game: dg.Game, card_type, target_index):
+        tu.throw_if_step_action_was_illegal(
+            game.step(
+                dg.ActionGenerator.play_first_card_of_type(
+                    game.ctx.player.hand, card_type, target_index
+                )
+            )
+        )
+
+    def test_play_order_does_not_matter(self):
+        game = self._create_game()
+        # Make sure there's one of each to play
+        game.ctx.player.hand.move_to_discard_pile(game.ctx.player.hand[0])
+        game.ctx.player.hand.add_to_top(dg.Strike(game.ctx))
+        game.ctx.player.hand.add_to_top(dg.Defend(game.ctx))
+        other = copy.deepcopy(game)
+
+        self._play(game, dg.Strike, 0)
+        self._play(game, dg.Defend, None)
+        self._play(other, dg.Defend, None)
+        self._play(other, dg.Strike, 0)
+
+        self.assertEqual(
+            game.combat_state_key(include_rng=False),
+            other.combat_state_key(include_rng=False),
+        )
+
+    def test_hidden_order_and_instances_do_not_matter(self):
+        game = self._create_game()
+        key = game.combat_state_key()
+
+        player = game.ctx.player
+        player.hand._ordered_cards.reverse()
+        player.draw_pile._ordered_cards.reverse()
+        # Swap in a fresh copy of a card
+        card = player.hand[0]
+        player.hand._ordered_cards[0] = type(card)(game.ctx)
+
+        self.assertEqual(key, game.combat_state_key())
+
+    def test_decision_relevant_changes_do_matter(self):
+        game = self._create_game()
+        key = game.combat_state_key()
+
+        def assert_changes(mutate):
+            other = copy.deepcopy(game)
+            mutate(other)
+            self.assertNotEqual(key, other.combat_state_key())
+
+        assert_changes(lambda g: setattr(g.ctx.player, "current_health", 1))
+        assert_changes(lambda g: setattr(g.ctx.player, "current_block", 3))
+        assert_changes(
+            lambda g: setattr(g.ctx.player.energy_manager, "player_current_energy", 0)
+        )
+        assert_changes(lambda g: g.ctx.player.hand[0].upgrade())
+        assert_changes(
+            lambda g: g.ctx.player.hand.move_to_discard_pile(g.ctx.player.hand[0])
+        )
+        assert_changes(
+            lambda g: setattr(
+                g.ctx.d.get_curr_room().monster_group[0], "current_health", 1
+            )
+        )
+        assert_changes(lambda g: g.ctx.ai_rng.random_float())
+
+    def test_cached_key_follows_direct_edits(self):
+        game = self._create_game()
+        player = game.ctx.player
+        monster = game.ctx.d.get_curr_room().monster_group[0]
+
+        def current_key():
+            key = game.combat_state_key()
+            dg.CombatStateKey.invalidate(game.ctx)
+            self.assertEqual(key, game.combat_state_key())
+            return key
+
+        keys = [current_key()]
+        for edit in [
+            lambda: setattr(player, "current_block", 5),
+            lambda: setattr(player.hand[0], "cost_for_turn", 0),
+            lambda: player.powers.append(dg.StrengthPower(game.ctx, player, 2)),
+            lambda: setattr(player.powers[-1], "amount", 3),
+            lambda: player.draw_pile.move_to_discard_pile(player.draw_pile[0]),
+            lambda: setattr(monster, "escaped", True),
+        ]:
+            edit()
+            keys.append(current_key())
+        self.assertEqual(len(keys), len(set(keys)))
+
+    def test_rng_can_be_left_out(self):
+        game = self._create_game()
+        key = game.combat_state_key(include_rng=False)
+        game.ctx.ai_rng.random_float()
+        self.assertEqual(key, game.combat_state_key(include_rng=False))
+
+    def test_memoized_values_are_bounded(self):
+        value = dg.CombatStateKey.value
+        self.assertEqual(value(("player", 1)), value(("player", 1)))
+        for health in range(dg.CombatStateKey.VALUE_CACHE_SIZE + 10):
+            value(("player", health))
+        self.assertLessEqual(
+            value.cache_info().currsize, dg.CombatStateKey.VALUE_CACHE_SIZE
+        )
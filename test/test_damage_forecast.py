@@ -0,0 +1,67 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+
+
+class TestDamageForecast(unittest.TestCase):
+    @staticmethod
+    def _create_game(num_monsters=1):
+        # SimpleMonsters Tackle for 8 first
+        game = tu.create_game(
+            monster_group=lambda ctx: dg.MonsterGroup(
+                ctx, [dg.SimpleMonster(ctx, 20, 8, 6) for _ in range(num_monsters)]
+            )
+        )
+        return game, game.ctx.d.get_curr_room().monster_group
+
+    def test_forecast(self):
+        game, monsters = self._create_game()
+        forecast = monsters.incoming_damage_forecast()
+
+        self.assertEqual([8], forecast.damage.tolist())
+        self.assertEqual(8, forecast.total)
+        self.assertEqual([0], forecast.per_attack_played.tolist())
+        self.assertIs(forecast, monsters.incoming_damage_forecast())
+
+        game.ctx.player.current_block = 5
+        forecast = monsters.incoming_damage_forecast()
+        self.assertEqual([3], forecast.unblocked.tolist())
+        self.assertEqual(8, forecast.total_before_block)
+
+    def test_weak_and_vulnerable(self):
+        game, monsters = self._create_game()
+        monster = monsters[0]
+        monster.powers.append(dg.WeakPower(game.ctx, monster, 1, False))
+        self.assertEqual(6, monsters.incoming_damage_forecast().total)
+
+        player = game.ctx.player
+        player.powers.append(dg.VulnerablePower(game.ctx, player, 1, True))
+        self.assertEqual(9, monsters.incoming_damage_forecast().total)
+
+    def test_metallicize_and_sharp_hide(self):
+        game, monsters = self._create_game()
+        player = game.ctx.player
+        player.powers.append(dg.MetallicizePower(game.ctx, player, 3))
+        monsters[0].powers.append(dg.SharpHidePower(game.ctx, monsters[0], 4))
+
+        forecast = monsters.incoming_damage_forecast()
+
+        self.assertEqual([5], forecast.unblocked.tolist())
+        self.assertEqual([4], forecast.per_attack_played.tolist())
+
+    def test_block_is_used_up_in_order(self):
+        game, monsters = self._create_game(3)
+        game.ctx.player.current_block = 10
+        monsters[1].is_dying = True
+
+        forecast = monsters.incoming_damage_forecast()
+
+        self.assertEqual([8, 0, 8], forecast.damage.tolist())
+        self.assertEqual([0, 0, 6], forecast.unblocked.tolist())
+
+    def test_non_attacks(self):
+        game, monsters = self._create_game()
+        # Smoke Bomb follows Tackle
+        tu.throw_if_step_action_was_illegal(game.step(dg.ActionGenerator.end_turn()))
+        self.assertEqual(0, monsters.incoming_damage_forecast().total)
@@ -0,0 +1,59 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+
+class TestDeterminize(unittest.TestCase):
+    @staticmethod
+    def _create_game():
+        return tu.create_game(
+            initial_draw_pile_manifest={
+                dg.Strike.recipe(): 5,
+                dg.Defend.recipe(): 5,
+                dg.Neutralize.recipe(): 5,
+                dg.Survivor.recipe(): 5,
+            }
+        )
+
+    @staticmethod
+    def _draw_order(game: dg.Game):
+        return [c.uuid for c in game.ctx.player.draw_pile]
+
+    def test_visible_state_is_kept(self):
+        game = self._create_game()
+        key = game.combat_state_key(include_rng=False)
+        draw_order = self._draw_order(game)
+
+        fork = game.determinize(Rng(0))
+
+        self.assertEqual(key, fork.combat_state_key(include_rng=False))
+        self.assertEqual(sorted(draw_order), sorted(self._draw_order(fork)))
+        # The original is left alone
+        self.assertEqual(draw_order, self._draw_order(game))
+
+    def test_hidden_state_is_resampled(self):
+        game = self._create_game()
+        forks = [game.determinize(Rng(seed)) for seed in range(2)]
+
+        self.assertNotEqual(self._draw_order(forks[0]), self._draw_order(forks[1]))
+        self.assertNotEqual(
+            forks[0].ctx.ai_rng.get_state(), forks[1].ctx.ai_rng.get_state()
+        )
+        self.assertNotEqual(
+            forks[0].ctx.d.common_relic_pool, forks[1].ctx.d.common_relic_pool
+        )
+
+    def test_same_rng_state_gives_same_fork(self):
+        game = self._create_game()
+        forks = [game.determinize(Rng(0)), game.determinize(Rng(0))]
+
+        self.assertEqual(
+            forks[0].combat_state_key(include_rng=True),
+            forks[1].combat_state_key(include_rng=True),
+        )
+        self.assertEqual(
+            [type(c) for c in forks[0].ctx.player.draw_pile],
+            [type(c) for c in forks[1].ctx.player.draw_pile],
+        )
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from typing import Optional
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.layout_cache import DungeonLayoutCache
+
+
+class TestLayoutCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "layouts.bin")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def _game(seed: int, cache: Optional[DungeonLayoutCache] = None):
+        return dg.Game(dg.TheSilent, dg.Exordium, seed=seed, layout_cache=cache)
+
+    def _assert_same_dungeon(self, a: dg.Game, b: dg.Game):
+        da = a.ctx.d
+        db = b.ctx.d
+        la = da.map_layout
+        lb = db.map_layout
+        assert la is not None and lb is not None
+        self.assertTrue(np.array_equal(la.room_type, lb.room_type))
+        self.assertTrue(np.array_equal(la.edges, lb.edges))
+        self.assertTrue(np.array_equal(la.parents, lb.parents))
+        self.assertEqual(
+            [(n.x, n.y) for row in da.mapp for n in row if n.has_emerald_key],
+            [(n.x, n.y) for row in db.mapp for n in row if n.has_emerald_key],
+        )
+        self.assertEqual(da.monster_list, db.monster_list)
+        self.assertEqual(da.elite_monster_list, db.elite_monster_list)
+        self.assertEqual(da.boss_list, db.boss_list)
+        self.assertEqual(a.ctx.map_rng.get_state(), b.ctx.map_rng.get_state())
+        self.assertEqual(a.ctx.monster_rng.get_state(), b.ctx.monster_rng.get_state())
+
+    def test_same_seed_same_dungeon(self):
+        self._assert_same_dungeon(self._game(3), self._game(3))
+
+    def test_hit_matches_generated(self):
+        cache = DungeonLayoutCache(self.path)
+        generated = self._game(11, cache)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, len(cache))
+
+        # A fresh cache object, like another worker would have
+        other_cache = DungeonLayoutCache(self.path)
+        loaded = self._game(11, other_cache)
+        self.assertEqual(1, other_cache.hits)
+        self._assert_same_dungeon(generated, loaded)
+        # Only needed while the dungeon is built
+        self.assertIsNone(loaded.ctx.d.cached_layout)
+
+    def test_seeds_and_dungeons_are_separate(self):
+        cache = DungeonLayoutCache(self.path)
+        self._game(1, cache)
+        self._game(2, cache)
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.load(dg.MiniDungeon, 1))
+        self.assertIsNotNone(cache.load(dg.Exordium, 2))
+
+    def test_unseeded_games_skip_cache(self):
+        cache = DungeonLayoutCache(self.path)
+        dg.Game(dg.TheSilent, dg.Exordium, layout_cache=cache)
+        self.assertEqual(0, len(cache))
+
+    def test_corrupt_record_is_regenerated(self):
+        cache = DungeonLayoutCache(self.path)
+        generated = self._game(5, cache)
+        with open(self.path, "r+b") as f:
+            f.seek(-100, os.SEEK_END)
+            f.write(b"\xff")
+
+        other_cache = DungeonLayoutCache(self.path)
+        regenerated = self._game(5, other_cache)
+        self.assertEqual(0, other_cache.hits)
+        self._assert_same_dungeon(generated, regenerated)
+        # The regenerated record replaces the corrupt one
+        self.assertIsNotNone(DungeonLayoutCache(self.path).load(dg.Exordium, 5))
+
+    def test_other_engine_version_is_stale(self):
+        cache = DungeonLayoutCache(self.path)
+        self._game(5, cache)
+        engine_version = dg.ENGINE_VERSION
+        dg.ENGINE_VERSION += 1
+        try:
+            self.assertIsNone(DungeonLayoutCache(self.path).load(dg.Exordium, 5))
+        finally:
+            dg.ENGINE_VERSION = engine_version
+
+    def test_unknown_format_is_replaced_not_truncated(self):
+        cache = DungeonLayoutCache(self.path)
+        self._game(5, cache)
+        self.assertIsNotNone(cache.load(dg.Exordium, 5))
+        mapped = cache._records
+        with open(self.path, "r+b") as f:
+            f.write(b"OLDFMT")
+
+        other_cache = DungeonLayoutCache(self.path)
+        self._game(6, other_cache)
+
+        # Whoever had the old file mapped can still read it
+        self.assertEqual(1, len(mapped))
+        self.assertEqual(cache._checksum(mapped[0]), int(mapped[0]["checksum"]))
+        self.assertEqual(1, len(cache))
+        self.assertIsNone(cache.load(dg.Exordium, 5))
+        self.assertIsNotNone(cache.load(dg.Exordium, 6))
@@ -0,0 +1,105 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+
+class TestLegalActions(unittest.TestCase):
+    @staticmethod
+    def _mask_actions(game: dg.Game):
+        return [
+            (i, j)
+            for i, action_1_slice in enumerate(game.generate_action_mask())
+            for j, legal in enumerate(action_1_slice)
+            if legal
+        ]
+
+    def _play_randomly(
+        self, game: dg.Game, rng: Rng, max_steps: int = 500, stop_on: tuple = ()
+    ):
+        request_types = set()
+        for _ in range(max_steps):
+            request = game.ctx.action_manager.outstanding_request
+            request_types.add(type(request))
+            # Listing must agree with the mask exactly, order included
+            legal_actions = game.generate_legal_actions()
+            self.assertEqual(self._mask_actions(game), legal_actions)
+            # And checking one action at a time must agree with the listing
+            self.assertEqual(
+                legal_actions,
+                [
+                    (i, j)
+                    for i in range(dg.ACTION_0_LEN)
+                    for j in range(dg.ACTION_1_LEN)
+                    if game.is_action_valid((i, j))
+                ],
+            )
+            if isinstance(request, stop_on):
+                break
+
+            _, is_terminal, _ = tu.throw_if_step_action_was_illegal(
+                game.step(game.sample_legal_action(rng))
+            )
+            if is_terminal:
+                break
+        return request_types
+
+    def test_matches_mask_in_combat(self):
+        rng = Rng(0)
+        for _ in range(20):
+            game = tu.create_game(
+                potions=lambda ctx: [dg.EnergyPotion(ctx), dg.FirePotion(ctx)]
+            )
+            # SimpleDungeon has nowhere to go after the fight
+            self._play_randomly(game, rng, stop_on=dg.CombatRewardRequest)
+
+    def test_matches_mask_through_mini_dungeon(self):
+        rng = Rng(1)
+        request_types = set()
+        for _ in range(20):
+            game = tu.create_game(
+                create_dungeon=dg.MiniDungeon,
+                initial_draw_pile_manifest={dg.DebugStrike.recipe(): 10},
+            )
+            request_types |= self._play_randomly(game, rng)
+
+        self.assertLessEqual(
+            {
+                dg.SimpleChoiceEventRequest,
+                dg.FirstPathChoiceRequest,
+                dg.CombatActionRequest,
+                dg.CombatRewardRequest,
+            },
+            request_types,
+        )
+
+    def test_discard_request(self):
+        game = tu.create_game(
+            initial_draw_pile_manifest={
+                dg.Strike.recipe(): 5,
+                dg.Survivor.recipe(): 5,
+            }
+        )
+        tu.throw_if_step_action_was_illegal(
+            game.step(
+                dg.ActionGenerator.play_first_card_of_type(
+                    game.ctx.player.hand, dg.Survivor, None
+                )
+            )
+        )
+        request = game.ctx.action_manager.outstanding_request
+        self.assertIsInstance(request, dg.DiscardRequest)
+        self.assertEqual(self._mask_actions(game), game.generate_legal_actions())
+
+    def test_grid_select_samples_every_card(self):
+        game = tu.create_game()
+        cards = [dg.Strike(game.ctx) for _ in range(8)]
+        request = dg.GridSelectRequest(game.ctx, cards)
+        rng = Rng(2)
+
+        actions = request.generate_legal_actions()
+        self.assertEqual(len(cards), len(actions))
+        self.assertEqual(
+            {request.sample_legal_action(rng) for _ in range(200)}, set(actions)
+        )
@@ -0,0 +1,123 @@
+import unittest
+from test import test_utils as tu
+
+import numpy as np
+
+import decapitate_the_spire as dts
+import decapitate_the_spire.game as dg
+
+
+class TestMapAnalyzer(unittest.TestCase):
+    weights = {
+        dg.MonsterRoomElite: 2.0,
+        dg.RestRoom: 1.0,
+        dg.EventRoom: 0.5,
+        dg.ShopRoom: -1.0,
+        dg.MonsterRoom: 0.25,
+    }
+
+    @staticmethod
+    def _walk(layout: dg.MapLayout, x: int, y: int):
+        children = [k for k in range(layout.width) if layout.edges[y, x] & (1 << k)]
+        if not children:
+            return [[(x, y)]]
+        return [
+            [(x, y)] + path
+            for k in children
+            for path in TestMapAnalyzer._walk(layout, k, y + 1)
+        ]
+
+    def test_matches_walking_every_path(self):
+        for _ in range(5):
+            game = tu.create_game(create_dungeon=dg.Exordium)
+            layout = game.ctx.d.get_map_layout()
+            analyzer = game.ctx.d.get_map_analyzer(self.weights)
+
+            def counts_of(path):
+                counts = np.zeros(len(dts.MAP_ROOM_UNIVERSE), dtype=np.int64)
+                for x, y in path:
+                    counts[layout.room_type[y, x]] += 1
+                return counts
+
+            for x in np.nonzero(layout.edges[0])[0].tolist():
+                paths = self._walk(layout, x, 0)
+                scores = [counts_of(p) @ analyzer.weights for p in paths]
+
+                best = paths[int(np.argmax(scores))]
+                worst = paths[int(np.argmin(scores))]
+                self.assertAlmostEqual(max(scores), analyzer.best_score[0, x])
+                self.assertAlmostEqual(min(scores), analyzer.worst_score[0, x])
+                self.assertAlmostEqual(np.mean(scores), analyzer.mean_score[0, x])
+                self.assertAlmostEqual(max(scores), counts_of(best) @ analyzer.weights)
+                self.assertAlmostEqual(
+                    analyzer.best_score[0, x],
+                    analyzer.best_room_type_counts[0, x] @ analyzer.weights,
+                )
+                self.assertAlmostEqual(
+                    analyzer.worst_score[0, x],
+                    analyzer.worst_room_type_counts[0, x] @ analyzer.weights,
+                )
+                self.assertEqual(best[1][0], analyzer.best_next_x[0, x])
+                self.assertEqual(worst[1][0], analyzer.worst_next_x[0, x])
+
+    def test_analyzers_are_reused_per_weights(self):
+        game = tu.create_game(create_dungeon=dg.Exordium)
+        d = game.ctx.d
+
+        self.assertIs(d.get_map_analyzer(), d.get_map_analyzer())
+        self.assertIs(
+            d.get_map_analyzer(), d.get_map_analyzer(dg.MapAnalyzer.DEFAULT_WEIGHTS)
+        )
+        self.assertIsNot(d.get_map_analyzer(), d.get_map_analyzer(self.weights))
+        self.assertEqual(
+            (3 + 3 * len(dts.MAP_ROOM_UNIVERSE), dg.MAP_HEIGHT, dg.MAP_WIDTH),
+            d.get_map_analyzer().features.shape,
+        )
+
+    def test_picks_first_path_by_weights(self):
+        game = tu.create_game(create_dungeon=dg.MiniDungeon)
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.pick_neow_reward(True))
+        )
+        request = game.ctx.action_manager.outstanding_request
+        self.assertIsInstance(request, dg.FirstPathChoiceRequest)
+
+        analyzer = game.ctx.d.get_map_analyzer({dg.ShopRoom: 1.0})
+        self.assertEqual(
+            dg.ActionGenerator.pick_first_path_mini_dungeon_shop(),
+            dg.ActionGenerator.pick_analyzed_path(request, analyzer),
+        )
+        analyzer = game.ctx.d.get_map_analyzer({dg.MonsterRoomElite: 1.0})
+        self.assertEqual(
+            dg.ActionGenerator.pick_first_path_mini_dungeon_elite(),
+            dg.ActionGenerator.pick_analyzed_path(request, analyzer),
+        )
+
+    def test_follows_best_path_through_exordium(self):
+        game = tu.create_game(create_dungeon=dg.Exordium)
+        analyzer = game.ctx.d.get_map_analyzer(self.weights)
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.pick_neow_reward(True))
+        )
+
+        request = game.ctx.action_manager.outstanding_request
+        self.assertIsInstance(request, dg.FirstPathChoiceRequest)
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.pick_analyzed_path(request, analyzer))
+        )
+        node = game.ctx.d.curr_map_node
+        self.assertEqual((analyzer.best_first_x, 0), (node.x, node.y))
+
+        # Ask from the first room without fighting through it
+        request = dg.PathChoiceRequest(
+            game.ctx,
+            node.left_successor_edge(),
+            node.center_successor_edge(),
+            node.right_successor_edge(),
+        )
+        action = dg.ActionGenerator.pick_analyzed_path(request, analyzer)
+        self.assertTrue(request.generate_action_mask().to_raw()[action[0]][action[1]])
+        edge = [request.left_edge, request.center_edge, request.right_edge][
+            action[0] - 1
+        ]
+        self.assertEqual(analyzer.best_next_x[node.y, node.x], edge.dst_x)
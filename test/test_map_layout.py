@@ -0,0 +1,135 @@
+import unittest
+from test import test_utils as tu
+
+import numpy as np
+
+import decapitate_the_spire as dts
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.rng import Rng
+
+
+class TestMapLayout(unittest.TestCase):
+    @staticmethod
+    def _generate_legacy(seed: int):
+        ctx = dg.CCG.Context()
+        rng = Rng(seed)
+        mapp = dg.MapGenerator.generate_dungeon(
+            dg.MAP_HEIGHT, dg.MAP_WIDTH, dg.MAP_PATH_DENSITY, rng
+        )
+        return ctx, rng, mapp
+
+    @staticmethod
+    def _node_edges(mapp: dg.Map):
+        return {
+            (n.x, n.y): {(e.dst_x, e.dst_y) for e in n.edges}
+            for row in mapp
+            for n in row
+        }
+
+    @staticmethod
+    def _node_parents(mapp: dg.Map):
+        return {
+            (n.x, n.y): {(p.x, p.y) for p in n.parents} for row in mapp for n in row
+        }
+
+    def test_generates_same_paths_as_map_generator(self):
+        for seed in range(50):
+            _, legacy_rng, legacy_mapp = self._generate_legacy(seed)
+            rng = Rng(seed)
+            layout = dg.MapLayout.generate(
+                dg.MAP_HEIGHT, dg.MAP_WIDTH, dg.MAP_PATH_DENSITY, rng
+            )
+            mapp = layout.to_nodes(dg.CCG.Context())
+
+            self.assertEqual(self._node_edges(legacy_mapp), self._node_edges(mapp))
+            self.assertEqual(self._node_parents(legacy_mapp), self._node_parents(mapp))
+            # Both made the same number of draws
+            self.assertEqual(legacy_rng.random_float(), rng.random_float())
+
+    def test_assigns_same_rooms_as_room_type_assigner(self):
+        game = tu.create_game(create_dungeon=dg.Exordium)
+        for seed in range(50):
+            ctx, legacy_rng, legacy_mapp = self._generate_legacy(seed)
+            rng = Rng(seed)
+            layout = dg.MapLayout.generate(
+                dg.MAP_HEIGHT, dg.MAP_WIDTH, dg.MAP_PATH_DENSITY, rng
+            )
+
+            room_list = game.ctx.d.generate_room_types(layout.count_rooms_to_generate())
+            dg.RoomTypeAssigner.assign_row_as_room_type(
+                ctx, legacy_mapp[-1], dg.RestRoom
+            )
+            dg.RoomTypeAssigner.assign_row_as_room_type(
+                ctx, legacy_mapp[0], dg.MonsterRoom
+            )
+            dg.RoomTypeAssigner.assign_row_as_room_type(
+                ctx, legacy_mapp[8], dg.TreasureRoom
+            )
+            dg.RoomTypeAssigner.distribute_rooms_across_map(
+                ctx, legacy_rng, legacy_mapp, list(room_list)
+            )
+
+            layout.assign_row_room_type(-1, dg.RestRoom)
+            layout.assign_row_room_type(0, dg.MonsterRoom)
+            layout.assign_row_room_type(8, dg.TreasureRoom)
+            layout.distribute_room_types(rng, [type(r) for r in room_list])
+            mapp = layout.to_nodes(ctx)
+
+            for legacy_row, row in zip(legacy_mapp, mapp):
+                for legacy_node, node in zip(legacy_row, row):
+                    self.assertEqual(type(legacy_node.room), type(node.room))
+
+    def test_path_counts_and_reachable_match_walk(self):
+        layout = dg.MapLayout.generate(
+            dg.MAP_HEIGHT, dg.MAP_WIDTH, dg.MAP_PATH_DENSITY, Rng(7)
+        )
+
+        def walk(x, y):
+            children = [k for k in range(layout.width) if layout.edges[y, x] & (1 << k)]
+            if not children:
+                return [[(x, y)]]
+            return [[(x, y)] + path for k in children for path in walk(k, y + 1)]
+
+        for x in range(layout.width):
+            if not layout.edges[0, x]:
+                continue
+            paths = walk(x, 0)
+            self.assertEqual(len(paths), layout.path_counts[0, x])
+            reached = {node for path in paths for node in path}
+            ys, xs = np.nonzero(layout.reachable[0, x])
+            self.assertEqual(reached, set(zip(xs.tolist(), ys.tolist())))
+
+    def test_room_type_counts(self):
+        game = tu.create_game(create_dungeon=dg.Exordium)
+        layout = game.ctx.d.get_map_layout()
+        rest = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[dg.RestRoom]
+        treasure = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[dg.TreasureRoom]
+
+        for x in np.nonzero(layout.edges[0])[0]:
+            # Every path passes through the treasure row and ends on the rest row
+            self.assertLessEqual(1, layout.min_room_type_counts[0, x, treasure])
+            self.assertLessEqual(1, layout.min_room_type_counts[0, x, rest])
+            # One room per row, but the extremes of each type needn't share a path
+            self.assertLessEqual(layout.min_room_type_counts[0, x].sum(), dg.MAP_HEIGHT)
+            self.assertLessEqual(dg.MAP_HEIGHT, layout.max_room_type_counts[0, x].sum())
+            self.assertAlmostEqual(
+                dg.MAP_HEIGHT, layout.mean_room_type_counts[0, x].sum()
+            )
+            self.assertTrue(
+                np.all(
+                    layout.min_room_type_counts[0, x]
+                    <= layout.mean_room_type_counts[0, x] + 1e-9
+                )
+            )
+
+    def test_from_nodes_handles_hand_built_map(self):
+        game = tu.create_game(create_dungeon=dg.MiniDungeon)
+        layout = game.ctx.d.get_map_layout()
+
+        self.assertEqual((dg.MAP_HEIGHT, dg.MAP_WIDTH), layout.room_type.shape)
+        # All six first row rooms lead to the boss room at (0, 3) along a single path
+        self.assertEqual([1] * 6 + [0], layout.path_counts[0].tolist())
+        self.assertEqual(
+            dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[dg.MonsterRoomBoss],
+            layout.room_type[3, 0],
+        )
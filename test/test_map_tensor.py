@@ -0,0 +1,93 @@
+import unittest
+from test import test_utils as tu
+
+import numpy as np
+
+import decapitate_the_spire as dts
+import decapitate_the_spire.game as dg
+
+
+class TestMapTensor(unittest.TestCase):
+    def test_structure_matches_nodes(self):
+        game = tu.create_game(create_dungeon=dg.Exordium)
+        d = game.ctx.d
+        tensor = d.map_tensor()
+        num_room_types = len(dts.MAP_ROOM_UNIVERSE)
+
+        self.assertEqual(
+            (num_room_types + 6, dg.MAP_HEIGHT, dg.MAP_WIDTH), tensor.shape
+        )
+        for row in d.mapp:
+            for node in row:
+                room_channels = tensor[:num_room_types, node.y, node.x]
+                if node.room is not None and node.has_edges():
+                    i = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[type(node.room)]
+                    self.assertEqual(1.0, room_channels[i])
+                    self.assertEqual(1.0, room_channels.sum())
+                left, center, right, boss = tensor[
+                    num_room_types : num_room_types + 4, node.y, node.x
+                ]
+                # The top row's only edges go to the boss
+                to_boss = node.y == len(d.mapp) - 1 and node.has_edges()
+                self.assertEqual(to_boss, bool(boss))
+                if to_boss:
+                    self.assertFalse(left or center or right)
+                    continue
+                self.assertEqual(bool(node.left_successor_edge()), bool(left))
+                self.assertEqual(bool(node.center_successor_edge()), bool(center))
+                self.assertEqual(bool(node.right_successor_edge()), bool(right))
+
+    def test_only_position_channels_follow_current_node(self):
+        game = tu.create_game(create_dungeon=dg.Exordium)
+        d = game.ctx.d
+        layout = d.get_map_layout()
+        tensor = d.map_tensor()
+        structure = tensor[:-2].copy()
+
+        # Neow room, before the first path choice
+        self.assertFalse(tensor[-2].any())
+        first_row = np.nonzero(layout.edges[0])[0]
+        self.assertTrue(np.all(tensor[-1][0, first_row] == 1.0))
+        self.assertEqual(np.count_nonzero(layout.on_map), np.count_nonzero(tensor[-1]))
+
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.pick_neow_reward(True))
+        )
+        x = int(first_row[0])
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.pick_first_path(x))
+        )
+
+        self.assertIs(tensor, d.map_tensor())
+        np.testing.assert_array_equal(structure, tensor[:-2])
+        self.assertEqual(1.0, tensor[-2][0, x])
+        self.assertEqual(1.0, tensor[-2].sum())
+        np.testing.assert_array_equal(layout.reachable[0, x], tensor[-1] == 1.0)
+
+    def test_hand_built_map(self):
+        game = tu.create_game(create_dungeon=dg.MiniDungeon)
+        tensor = game.ctx.d.map_tensor()
+
+        # Six first row rooms, then a single path up to the boss room at (0, 3)
+        self.assertEqual(6, np.count_nonzero(tensor[-1][0]))
+        self.assertEqual(9, np.count_nonzero(tensor[-1]))
+        self.assertEqual(1.0, tensor[-1][3, 0])
+        boss = dts.MAP_ROOM_TYPE_TO_UNIVERSE_INDEX[dg.MonsterRoomBoss]
+        self.assertEqual(1.0, tensor[boss, 3, 0])
+
+    def test_forks_share_layout_but_not_tensor(self):
+        game = tu.create_game(create_dungeon=dg.Exordium)
+        d = game.ctx.d
+        tensor = d.map_tensor()
+        fork = game.fork()
+
+        self.assertIs(d.map_layout, fork.ctx.d.map_layout)
+        self.assertIsNone(fork.ctx.d._map_tensor)
+        fork_tensor = fork.ctx.d.map_tensor()
+        self.assertIsNot(tensor, fork_tensor)
+        np.testing.assert_array_equal(tensor, fork_tensor)
+
+        restored = dg.Game.loads(game.dumps())
+        restored_layout = restored.ctx.d.get_map_layout()
+        self.assertNotIn("reachable", vars(restored_layout))
+        np.testing.assert_array_equal(tensor, restored.ctx.d.map_tensor())
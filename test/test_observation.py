@@ -0,0 +1,55 @@
+import unittest
+from test import test_utils as tu
+
+import numpy as np
+
+import decapitate_the_spire as dts
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.observation import (
+    FIELDS,
+    HAND_SLOT_LEN,
+    MONSTER_SLOT_LEN,
+    OBSERVATION_LEN,
+    observe,
+)
+
+
+class TestObservation(unittest.TestCase):
+    def test_combat(self):
+        game = tu.create_game()
+        obs = observe(game)
+        self.assertEqual((OBSERVATION_LEN,), obs.shape)
+
+        health, max_health, block, energy, _, _, in_combat, outcome = obs[
+            FIELDS["player"]
+        ]
+        self.assertEqual(
+            (52, 52, 0, 3, 1, 0),
+            (health, max_health, block, energy, in_combat, outcome),
+        )
+        monsters = obs[FIELDS["monsters"]].reshape(-1, MONSTER_SLOT_LEN)
+        np.testing.assert_array_equal(
+            [dts.MONSTER_TO_UNIVERSE_INDEX[dg.SimpleMonster] + 1, 20, 20, 0, 1, 8],
+            monsters[0, :6],
+        )
+        self.assertFalse(monsters[1:].any())
+
+        hand = obs[FIELDS["hand"]].reshape(-1, HAND_SLOT_LEN)
+        player = game.ctx.player
+        self.assertEqual(len(player.hand), np.count_nonzero(hand[:, 0]))
+        self.assertEqual(
+            dts.CARD_TYPE_TO_UNIVERSE_INDEX[type(player.hand[0])] + 1, hand[0, 0]
+        )
+        self.assertEqual(12, len(player.hand) + obs[FIELDS["draw_pile"]].sum())
+
+    def test_powers_and_out(self):
+        game = tu.create_game()
+        player = game.ctx.player
+        player.powers.append(dg.StrengthPower(game.ctx, player, 2))
+        out = np.full(OBSERVATION_LEN, 99, np.int16)
+
+        observe(game, out)
+
+        strength = dts.POWER_TYPE_TO_UNIVERSE_INDEX[dg.StrengthPower]
+        self.assertEqual(2, out[FIELDS["player_powers"]][strength])
+        self.assertFalse(out[FIELDS["exhaust_pile"]].any())
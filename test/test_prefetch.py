@@ -0,0 +1,70 @@
+import itertools
+import threading
+import unittest
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.prefetch import GamePrefetcher, OutOfSeedsError
+from decapitate_the_spire.replay import GameSpec
+
+
+class TestGamePrefetcher(unittest.TestCase):
+    @staticmethod
+    def _create_game(seed):
+        return GameSpec(seed).create_game(dg.AutoResolvers.combat_only())
+
+    def _assert_seeds(self, seeds, games):
+        for seed, game in zip(seeds, games):
+            self.assertEqual(
+                self._create_game(seed).combat_state_key(), game.combat_state_key()
+            )
+
+    def test_background(self):
+        built = threading.Semaphore(0)
+
+        def create_game(seed):
+            game = self._create_game(seed)
+            built.release()
+            return game
+
+        with GamePrefetcher(create_game, itertools.count(100), size=3) as prefetcher:
+            for _ in range(3):
+                built.acquire(timeout=10)
+            games = [prefetcher.get() for _ in range(8)]
+            self.assertGreaterEqual(prefetcher.hits, 3)
+            self.assertEqual(8, prefetcher.hits + prefetcher.misses)
+        self._assert_seeds(range(100, 108), games)
+        with self.assertRaises(ValueError):
+            prefetcher.get()
+
+    def test_fill(self):
+        prefetcher = GamePrefetcher(
+            self._create_game, itertools.count(5), size=2, background=False
+        )
+        self.assertEqual(2, prefetcher.fill())
+        self.assertEqual(0, prefetcher.fill())
+        games = [prefetcher.get()]
+        self.assertEqual(1, prefetcher.fill(max_games=5))
+        games += [prefetcher.get() for _ in range(3)]
+        self.assertEqual((3, 1), (prefetcher.hits, prefetcher.misses))
+        self._assert_seeds(range(5, 9), games)
+        prefetcher.close()
+
+    def test_errors(self):
+        failing = threading.Event()
+
+        def create_game(seed):
+            if seed == 2:
+                failing.set()
+                raise ValueError("bad seed")
+            return self._create_game(seed)
+
+        with GamePrefetcher(create_game, range(5), size=4) as prefetcher:
+            failing.wait(timeout=10)
+            games = [prefetcher.get(), prefetcher.get()]
+            with self.assertRaisesRegex(RuntimeError, "game 2"):
+                prefetcher.get()
+            # Only that game is lost, and the thread keeps building
+            games += [prefetcher.get(), prefetcher.get()]
+            with self.assertRaises(OutOfSeedsError):
+                prefetcher.get()
+        self._assert_seeds([0, 1, 3, 4], games)
@@ -0,0 +1,80 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+
+
+class TestPreview(unittest.TestCase):
+    @staticmethod
+    def _create_game(hand):
+        game = tu.create_game(initial_draw_pile_manifest={dg.Defend.recipe(): 10})
+        game.ctx.player.hand._ordered_cards = [card(game.ctx) for card in hand]
+        return game
+
+    def test_preview_play(self):
+        game = self._create_game([dg.Strike, dg.Neutralize, dg.Defend])
+
+        self.assertEqual(
+            dg.Preview(dg.CharacterDelta(0, 0, {}), [dg.CharacterDelta(-6, 0, {})]),
+            game.preview_play(0, 0),
+        )
+        neutralize = game.preview_play(1, 0)
+        self.assertEqual(
+            dg.CharacterDelta(-3, 0, {"WeakPower": 1}), neutralize.monsters[0]
+        )
+        self.assertEqual(3, neutralize.damage_dealt)
+        defend = game.preview_play(2)
+        self.assertEqual(dg.CharacterDelta(0, 5, {}), defend.player)
+        # Blocking 5 of the Tackle's 8
+        self.assertEqual(-5, defend.incoming_damage)
+        self.assertTrue(defend.monsters[0].is_empty)
+
+    def test_preview_end_turn(self):
+        game = self._create_game([dg.Defend])
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.play_card(0, None))
+        )
+
+        preview = game.preview_end_turn()
+
+        # The Defend soaks 5 of the Tackle's 8, then block is gone at the start of the next turn
+        self.assertEqual(dg.CharacterDelta(-3, -5, {}), preview.player)
+        tu.throw_if_step_action_was_illegal(game.step(dg.ActionGenerator.end_turn()))
+        self.assertEqual(
+            tu.default_player_max_health - 3, game.ctx.player.current_health
+        )
+
+    def test_preview_leaves_game_alone(self):
+        game = self._create_game([dg.Strike, dg.Survivor])
+        history_length = len(game.history)
+        key = game.combat_state_key()
+
+        game.preview_play(0, 0)
+        # Survivor stops at asking for a discard
+        game.preview_play(1)
+        game.preview_end_turn()
+
+        self.assertEqual(key, game.combat_state_key())
+        self.assertEqual(0, len(game.ctx.action_manager.actions))
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+        )
+        self.assertEqual(history_length, len(game.history))
+
+    def test_preview_leaves_unseeded_rolls_alone(self):
+        game = self._create_game([dg.Strike])
+        self.assertIsNone(game.ctx.seed)
+        untouched = game.fork()
+
+        game.preview_end_turn()
+
+        for name in dg.COMBAT_RNG_NAMES:
+            self.assertEqual(
+                [getattr(untouched.ctx, name).random(0, 99) for _ in range(10)],
+                [getattr(game.ctx, name).random(0, 99) for _ in range(10)],
+            )
+
+    def test_illegal_preview_raises(self):
+        game = self._create_game([dg.Strike])
+        with self.assertRaises(ValueError):
+            game.preview_play(1, 0)
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.replay import (
+    GameSpec,
+    Replay,
+    ReplayReader,
+    ReplayWriter,
+    checkpoint_hash,
+    replay,
+)
+from decapitate_the_spire.rng import Rng
+
+
+class TestReplay(unittest.TestCase):
+    @staticmethod
+    def _record(seed=0, num_steps=150, checkpoint_every=20, **kwargs):
+        writer = ReplayWriter(
+            # Gambling Chip asks for discards at the start of every combat
+            GameSpec(seed, relics=["GamblingChip"]),
+            checkpoint_every,
+            dg.AutoResolvers.combat_only(),
+            **kwargs,
+        )
+        rng = Rng(seed)
+        for _ in range(num_steps):
+            game = writer.game
+            if isinstance(
+                game.ctx.action_manager.outstanding_request, dg.DiscardRequest
+            ):
+                hand = game.ctx.player.hand
+                _, is_terminal, _ = writer.step_selection(
+                    [True] + [False] * (len(hand) - 1)
+                )
+            else:
+                _, is_terminal, _ = writer.step(game.sample_legal_action(rng))
+            if is_terminal:
+                break
+        return writer
+
+    def test_replay_reproduces_the_game(self):
+        writer = self._record()
+        data = writer.replay.dumps()
+        r = Replay.loads(data)
+
+        self.assertEqual(writer.replay, r)
+        self.assertGreater(len(r.checkpoints), 0)
+        self.assertTrue(any(isinstance(a[0], bool) for a in r.actions))
+        # Two bytes an action (four for selecting from a hand), plus a dozen a checkpoint and the header
+        self.assertLess(len(data), 4 * len(r.actions) + 12 * len(r.checkpoints) + 64)
+        game = replay(r)
+        self.assertEqual(checkpoint_hash(writer.game), checkpoint_hash(game))
+        self.assertEqual(len(writer.game.history), len(game.history))
+
+    def test_divergence_is_caught(self):
+        r = Replay.loads(self._record().replay.dumps())
+        first = min(r.checkpoints)
+        r.checkpoints[first] ^= 1
+
+        with self.assertRaises(ValueError):
+            replay(r)
+        replay(r, verify=False)
+        self.assertIsInstance(replay(r, num_actions=first - 1), dg.Game)
+
+    def test_selections(self):
+        actions = [(0, 5), (True, False) * 10, (3, -1), (False,)]
+        r = Replay(GameSpec(1), actions)
+        self.assertEqual(actions, Replay.loads(r.dumps()).actions)
+
+    def test_numpy_actions(self):
+        writer = ReplayWriter(
+            GameSpec(3), auto_resolvers=dg.AutoResolvers.combat_only()
+        )
+        rng = Rng(3)
+        for _ in range(20):
+            game = writer.game
+            action = np.array(game.sample_legal_action(rng), dtype=np.int64)
+            _, is_terminal, _ = writer.step(action)
+            if is_terminal:
+                break
+        r = Replay.loads(writer.replay.dumps())
+
+        self.assertEqual(writer.replay, r)
+        self.assertEqual(checkpoint_hash(writer.game), checkpoint_hash(replay(r)))
+        selections = [np.array([True, False, True]), (np.bool_(False),) * 2]
+        self.assertEqual(
+            [(True, False, True), (False, False)],
+            Replay.loads(Replay(GameSpec(1), selections).dumps()).actions,
+        )
+
+    def test_rejects_other_engine_versions(self):
+        data = Replay(GameSpec(1), engine_version=dg.ENGINE_VERSION + 1).dumps()
+        with self.assertRaises(ValueError):
+            Replay.loads(data)
+        self.assertEqual(
+            dg.ENGINE_VERSION + 1,
+            Replay.loads(data, any_engine_version=True).engine_version,
+        )
+        with self.assertRaises(ValueError):
+            GameSpec(1, player="Strike").create_game()
+
+    def test_seek(self):
+        writer = self._record(keyframe_every=25, keyframe_each_floor=True)
+        r = writer.replay
+        floors = {k.floor for k in r.keyframes.values()}
+        self.assertGreater(len(r.keyframes), len(floors))
+        reader = ReplayReader(r.dumps())
+
+        for n in (0, 10, 25, 26, 60, len(reader)):
+            self.assertEqual(
+                checkpoint_hash(replay(r, num_actions=n)),
+                checkpoint_hash(reader.seek(n)),
+            )
+        for floor in floors:
+            self.assertEqual(floor, reader.seek_floor(floor).ctx.d.floor_num)
+        with self.assertRaises(ValueError):
+            reader.seek(len(reader) + 1)
+
+    def test_open(self):
+        r = self._record(keyframe_every=30).replay
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "game.dtsr")
+            r.save(path)
+            reader = ReplayReader.open(path)
+            self.assertEqual(r, reader.replay)
+            self.assertEqual(
+                checkpoint_hash(replay(r)), checkpoint_hash(reader.seek(len(reader)))
+            )
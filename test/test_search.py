@@ -0,0 +1,157 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.search import (
+    CombatSearch,
+    SearchResult,
+    TurnPlanner,
+    eager_rollout,
+)
+
+
+class TestSearch(unittest.TestCase):
+    def test_finds_lethal(self):
+        game = tu.create_game(
+            monster_hp=6,
+            initial_draw_pile_manifest={dg.Strike.recipe(): 3, dg.Defend.recipe(): 3},
+        )
+        # Leave one Strike in hand to find
+        game.ctx.player.hand._ordered_cards = [
+            dg.Defend(game.ctx),
+            dg.Strike(game.ctx),
+            dg.Defend(game.ctx),
+        ]
+
+        result = CombatSearch(seed=0).search(game, iterations=60)
+
+        self.assertEqual(dg.ActionGenerator.play_card(1, 0), result.best_action)
+        self.assertAlmostEqual(1.0, result.mean_value(result.best_action))
+
+    def test_iteration_budget(self):
+        game = tu.create_game()
+        result = CombatSearch(rollout_policy=eager_rollout, seed=0).search(
+            game, iterations=25
+        )
+        self.assertEqual(25, result.simulations)
+        self.assertEqual(25, sum(v for v, _ in result.action_stats.values()))
+        self.assertIn(result.best_action, game.generate_legal_actions())
+
+    def test_time_budget(self):
+        game = tu.create_game()
+        result = CombatSearch(seed=0).search(game, seconds=0.2)
+        self.assertGreater(result.simulations, 0)
+        self.assertLess(result.seconds, 1.0)
+
+    def test_workers_are_merged(self):
+        game = tu.create_game()
+        result = CombatSearch(seed=0).search(game, iterations=11, workers=2)
+        self.assertEqual(11, result.simulations)
+        self.assertEqual(11, sum(v for v, _ in result.action_stats.values()))
+
+    def test_search_leaves_game_alone(self):
+        game = tu.create_game()
+        key = game.combat_state_key()
+        CombatSearch(seed=0).search(game, iterations=10)
+        self.assertEqual(key, game.combat_state_key())
+
+    def test_needs_budget_and_combat(self):
+        search = CombatSearch()
+        with self.assertRaises(ValueError):
+            search.search(tu.create_game())
+        game = dg.Game(lambda ctx: dg.TheSilent(ctx), dg.MiniDungeon)
+        with self.assertRaises(ValueError):
+            search.search(game, iterations=1)
+
+    def test_merge(self):
+        merged = SearchResult.merge(
+            [
+                SearchResult({(0, 5): (3, 1.5), (1, 0): (1, 1.0)}, 4, 2.0),
+                SearchResult({(1, 0): (4, 2.0)}, 4, 3.0),
+            ]
+        )
+        self.assertEqual({(0, 5): (3, 1.5), (1, 0): (5, 3.0)}, merged.action_stats)
+        self.assertEqual(8, merged.simulations)
+        self.assertEqual(3.0, merged.seconds)
+        self.assertEqual((1, 0), merged.best_action)
+
+    def test_fork_leaves_game_alone(self):
+        # AcidSlimeS alternates between attacking and applying Weak
+        game = tu.create_game(
+            monster=dg.AcidSlimeS, initial_draw_pile_manifest={dg.Defend.recipe(): 10}
+        )
+        fork = game.fork()
+        for _ in range(6):
+            tu.throw_if_step_action_was_illegal(
+                fork.step(dg.ActionGenerator.end_turn())
+            )
+            if any(isinstance(p, dg.WeakPower) for p in fork.ctx.player.powers):
+                break
+        else:
+            self.fail("Never got licked")
+        # Weak wears off at the end of the round after it's applied
+        for _ in range(2):
+            fork.step(dg.ActionGenerator.end_turn())
+
+        self.assertEqual([], game.ctx.player.powers)
+        self.assertEqual(0, len(game.ctx.action_manager.actions))
+
+    def test_fork_leaves_unseeded_rolls_alone(self):
+        game = tu.create_game(initial_draw_pile_manifest={dg.Defend.recipe(): 10})
+        self.assertIsNone(game.ctx.seed)
+        states = {
+            name: getattr(game.ctx, name).get_state() for name in dg.COMBAT_RNG_NAMES
+        }
+
+        fork = game.fork()
+        for _ in range(3):
+            tu.throw_if_step_action_was_illegal(
+                fork.step(dg.ActionGenerator.end_turn())
+            )
+
+        for name, state in states.items():
+            self.assertEqual(state, getattr(game.ctx, name).get_state())
+
+
+class TestTurnPlanner(unittest.TestCase):
+    @staticmethod
+    def _create_game(hand, monster_hp=tu.default_monster_max_health):
+        game = tu.create_game(
+            monster_hp=monster_hp,
+            initial_draw_pile_manifest={dg.Strike.recipe(): 10},
+        )
+        game.ctx.player.hand._ordered_cards = [card(game.ctx) for card in hand]
+        return game
+
+    def test_orderings_are_merged(self):
+        # 3 energy is enough to play all three in any order
+        game = self._create_game([dg.Defend, dg.Strike, dg.Neutralize], 100)
+
+        plan = TurnPlanner(seed=0).plan(game)
+
+        # Each of the 8 subsets of played cards is searched once: 12 plays and 8 end turns. Without merging, the 15
+        # orderings would take 31.
+        self.assertEqual(20, plan.nodes)
+        self.assertEqual(4, len(plan.actions))
+        self.assertEqual(dg.ActionGenerator.end_turn(), plan.actions[-1])
+
+    def test_finds_lethal(self):
+        game = self._create_game([dg.Defend, dg.Strike], 6)
+        plan = TurnPlanner(seed=0).plan(game)
+
+        self.assertAlmostEqual(1.0, plan.value)
+        # Combat's over after the Strike, so there's no turn to end
+        self.assertNotIn(dg.ActionGenerator.end_turn(), plan.actions)
+        _, _, _, num_applied = game.step_many(plan.actions)
+        self.assertEqual(len(plan.actions), num_applied)
+        self.assertTrue(game.ctx.d.get_curr_room().monster_group[0].is_dead)
+
+    def test_stops_at_draws(self):
+        game = self._create_game([dg.Backflip], 100)
+        key = game.combat_state_key(include_rng=False)
+
+        plan = TurnPlanner(seed=0, chance_samples=3).plan(game)
+
+        self.assertEqual([dg.ActionGenerator.play_card(0, None)], plan.actions)
+        self.assertGreater(plan.nodes_per_second, 0)
+        self.assertEqual(key, game.combat_state_key(include_rng=False))
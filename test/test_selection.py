@@ -0,0 +1,94 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+
+
+class TestSelection(unittest.TestCase):
+    @staticmethod
+    def _create_gambling_chip_game():
+        return tu.create_game(relics=lambda ctx: [dg.GamblingChip(ctx)])
+
+    def test_discard_any_number_at_once(self):
+        game = self._create_gambling_chip_game()
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.DiscardRequest
+        )
+        hand = game.ctx.player.hand
+        hand_size = len(hand)
+        discarded_uuids = [hand[1].uuid, hand[3].uuid]
+
+        tu.throw_if_step_action_was_illegal(
+            game.step_selection([i in (1, 3) for i in range(len(hand))])
+        )
+
+        # Same outcome as test_gambling_chip_pick_two, in one step
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+        )
+        self.assertEqual(hand_size - 2, len(game.ctx.player.hand))
+        discard_uuids = [c.uuid for c in game.ctx.player.discard_pile]
+        for uuid in discarded_uuids:
+            self.assertIn(uuid, discard_uuids)
+
+    def test_discard_none_when_allowed(self):
+        game = self._create_gambling_chip_game()
+        hand_size = len(game.ctx.player.hand)
+
+        # Padded out to a full hand
+        tu.throw_if_step_action_was_illegal(
+            game.step_selection([False] * dg.MAX_HAND_SIZE)
+        )
+
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+        )
+        self.assertEqual(hand_size, len(game.ctx.player.hand))
+
+    def test_discard_exact_number(self):
+        game = tu.create_game(initial_draw_pile_manifest={dg.Survivor.recipe(): 10})
+        tu.throw_if_step_action_was_illegal(
+            game.step(dg.ActionGenerator.play_card(0, None))
+        )
+        request = game.ctx.action_manager.outstanding_request
+        self.assertIsInstance(request, dg.DiscardRequest)
+        hand_size = len(game.ctx.player.hand)
+        discarded_uuid = game.ctx.player.hand[0].uuid
+
+        for selection in (
+            [False] * hand_size,
+            [True, True] + [False] * (hand_size - 2),
+            # Neither the hand nor a full hand long
+            [True],
+            # Past the end of the hand
+            [False] * hand_size + [True],
+        ):
+            tu.throw_if_step_action_was_legal(game.step_selection(selection))
+            self.assertIs(request, game.ctx.action_manager.outstanding_request)
+
+        tu.throw_if_step_action_was_illegal(
+            game.step_selection([True] + [False] * (hand_size - 1))
+        )
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+        )
+        self.assertEqual(hand_size - 1, len(game.ctx.player.hand))
+        self.assertIn(discarded_uuid, [c.uuid for c in game.ctx.player.discard_pile])
+
+    def test_not_accepted_by_other_requests(self):
+        game = tu.create_game()
+        tu.throw_if_step_action_was_legal(game.step_selection([True]))
+
+    def test_grid_select_picks_one(self):
+        game = tu.create_game()
+        cards = [dg.Strike(game.ctx) for _ in range(3)]
+        request = dg.GridSelectRequest(game.ctx, cards)
+
+        self.assertFalse(request.is_selection_valid((False, False, False)))
+        self.assertFalse(request.is_selection_valid((True, True, False)))
+        self.assertTrue(request.is_selection_valid((False, True, False)))
+
+        game.ctx.action_manager.outstanding_request = None
+        game.ctx.action_manager.outstanding_request = request
+        request.handle_selection((False, True, False))
+        self.assertEqual([False, True, False], [c.upgraded for c in cards])
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire.observation import observe
+from decapitate_the_spire.replay import GameSpec
+from decapitate_the_spire.rng import Rng
+from decapitate_the_spire.server import Client, FrameKind, GameServer, Session
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self._tmp.name, "dts.sock")
+        self.server = GameServer(
+            self.socket_path, auto_resolvers=dg.AutoResolvers.combat_only()
+        )
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.start()
+        self.client = Client(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self._thread.join()
+        self.server.server_close()
+        self._tmp.cleanup()
+
+    def test_matches_local_games(self):
+        ids = [3, 1, 4]
+        seeds = [10, 11, 12]
+        games = [
+            GameSpec(seed).create_game(dg.AutoResolvers.combat_only()) for seed in seeds
+        ]
+        observations, masks = self.client.reset(ids, seeds)
+        rng = Rng(0)
+
+        for _ in range(30):
+            for i, game in enumerate(games):
+                np.testing.assert_array_equal(observe(game), observations[i])
+                np.testing.assert_array_equal(game.generate_action_mask(), masks[i])
+            actions = [g.sample_legal_action(rng) for g in games]
+            expected = [g.step(a) for g, a in zip(games, actions)]
+            rewards, terminals, observations, masks = self.client.step(ids, actions)
+            np.testing.assert_array_equal([e[0] for e in expected], rewards)
+            np.testing.assert_array_equal([e[1] for e in expected], terminals)
+            if terminals.any():
+                break
+
+        np.testing.assert_array_equal(observations, self.client.observe(ids))
+        np.testing.assert_array_equal(masks, self.client.mask(ids))
+        rewards, _, no_observations, no_masks = self.client.step(
+            ids[:1], [actions[0]], observe=False, mask=False
+        )
+        self.assertEqual((1,), rewards.shape)
+        self.assertIsNone(no_observations)
+        self.assertIsNone(no_masks)
+
+    def test_errors(self):
+        self.client.reset([0], [0])
+        with self.assertRaisesRegex(RuntimeError, "No games with ids \\[1\\]"):
+            self.client.step([0, 1], [(0, 5), (0, 5)])
+        self.client.close_games([0])
+        with self.assertRaises(RuntimeError):
+            self.client.observe([0])
+        with self.assertRaises(RuntimeError):
+            self.client.reset([0], [0, 1])
+        self.assertIn(b"should be", self.server.handle(b"\x02\x00\x01\x00\x00\x00"))
+        self.assertIn(b"Op", self.server.handle(b"\x09\x00\x00\x00\x00\x00"))
+
+    def test_engine_errors_keep_the_connection(self):
+        self.client.reset([0, 1], [0, 1])
+
+        def fail(action):
+            raise AssertionError("engine bug")
+
+        self.server.games[1].step = fail
+        with self.assertLogs("dts"), self.assertRaisesRegex(
+            RuntimeError, "AssertionError: engine bug"
+        ):
+            self.client.step([0, 1], [(0, 5), (0, 5)])
+        self.assertEqual(
+            (2, dg.ACTION_0_LEN, dg.ACTION_1_LEN), self.client.mask([0, 1]).shape
+        )
+
+    def test_delta_matches_full(self):
+        self.server.full_frame_every = 5
+        ids = [7, 8]
+        with Client(self.socket_path, delta=True) as delta:
+            expected = self.client.reset(ids, [20, 21])
+            actual = delta.observe(ids), delta.mask(ids)
+            for e, a in zip(expected, actual):
+                np.testing.assert_array_equal(e, a)
+
+            rng = np.random.default_rng(0)
+            delta_bytes = delta.bytes_received
+            for num_steps in range(1, 41):
+                masks = self.client.mask(ids)
+                flat = [np.flatnonzero(m.ravel()) for m in masks]
+                actions = [np.divmod(rng.choice(f), masks.shape[2]) for f in flat]
+                # Step through one client, then ask the other for the same games
+                _, terminals, observations, masks = delta.step(ids, actions)
+                np.testing.assert_array_equal(self.client.observe(ids), observations)
+                np.testing.assert_array_equal(self.client.mask(ids), masks)
+                if terminals.any():
+                    break
+            # Reply header and rewards and terminals, then a full frame for each game
+            full_frame_bytes = 9 + 5 * len(ids) + len(ids) * 683
+            delta_bytes = (delta.bytes_received - delta_bytes) / num_steps
+            self.assertLess(delta_bytes, full_frame_bytes / 3)
+
+            delta.close_games(ids)
+            observations, _ = delta.reset(ids, [20, 21])
+            np.testing.assert_array_equal(expected[0], observations)
+
+    def test_full_frames(self):
+        session = Session()
+        self.server.full_frame_every = 2
+        request = b"\x03\x07\x01\x00\x00\x00\x05\x00\x00\x00"
+        self.assertIn(b"session", self.server.handle(request))
+        self.client.reset([5], [0])
+        kinds = [self.server.handle(request, session)[5] for _ in range(7)]
+        self.assertEqual(
+            [FrameKind.FULL, FrameKind.DELTA, FrameKind.DELTA] * 2 + [FrameKind.FULL],
+            kinds,
+        )
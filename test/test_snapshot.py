@@ -0,0 +1,113 @@
+import unittest
+
+import decapitate_the_spire.game as dg
+from decapitate_the_spire import snapshot
+from decapitate_the_spire.rng import Rng
+
+
+class TestSnapshot(unittest.TestCase):
+    @staticmethod
+    def _create_game(seed=0):
+        game = dg.Game(
+            lambda ctx: dg.TheSilent(ctx),
+            dg.Exordium,
+            seed=seed,
+            auto_resolvers=dg.AutoResolvers.combat_only(),
+        )
+        rng = Rng(0 if seed is None else seed)
+        for _ in range(5):
+            game.step(game.sample_legal_action(rng))
+        return game
+
+    def test_round_trip_plays_out_the_same(self):
+        game = self._create_game()
+        restored = dg.Game.loads(game.dumps())
+
+        self.assertEqual(game.combat_state_key(), restored.combat_state_key())
+        self.assertEqual(len(game.history), len(restored.history))
+        rng = Rng(1)
+        for _ in range(100):
+            action = game.sample_legal_action(rng)
+            self.assertEqual(game.step(action), restored.step(action))
+            self.assertEqual(game.combat_state_key(), restored.combat_state_key())
+            if game.game_over_and_won is not None:
+                break
+
+    def test_round_trip_of_unseeded_game(self):
+        game = self._create_game(seed=None)
+        restored = dg.Game.loads(game.dumps())
+
+        rng = Rng(1)
+        for _ in range(100):
+            action = game.sample_legal_action(rng)
+            self.assertEqual(game.step(action), restored.step(action))
+            self.assertEqual(game.combat_state_key(), restored.combat_state_key())
+            if game.game_over_and_won is not None:
+                break
+
+    def test_event_chances_are_per_game(self):
+        game = self._create_game()
+        other = self._create_game()
+        for _ in range(3):
+            dg.EventHelper.roll(game.ctx)
+
+        self.assertEqual(dg.EventHelper.CHANCES, other.ctx.event_chances)
+        self.assertNotEqual(game.ctx.event_chances, other.ctx.event_chances)
+        restored = dg.Game.loads(game.dumps())
+        self.assertEqual(game.ctx.event_chances, restored.ctx.event_chances)
+
+    def test_process_local_state_is_left_out(self):
+        game = self._create_game()
+        handler = [].append
+        game.ctx.chance_handler = handler
+
+        restored = dg.Game.loads(game.dumps())
+
+        self.assertIsNone(restored.ctx.chance_handler)
+        self.assertIs(handler, game.ctx.chance_handler)
+
+    def test_closures(self):
+        def factorial_with_offset(offset):
+            def f(n):
+                return offset if n == 0 else n * f(n - 1)
+
+            return f
+
+        f = snapshot.loads(snapshot.dumps(factorial_with_offset(2), 1), 1)
+        self.assertEqual(240, f(5))
+        g = snapshot.loads(snapshot.dumps(lambda x=3: x + 1, 1), 1)
+        self.assertEqual(4, g())
+
+    def test_closures_are_pickled_by_reference(self):
+        data = self._create_game().dumps()
+        self.assertNotIn(b"marshal", data)
+        self.assertIn(b"AutoResolvers.take_rewards", data)
+
+    def test_rngs(self):
+        seeded = Rng("seed")
+        unseeded = Rng()
+        far_along = Rng(3)
+        for _ in range(2000):
+            far_along.random_float()
+        by_hand = Rng(4)
+        by_hand.set_state(Rng(5).get_state())
+
+        for rng, max_size in [
+            (seeded, 128),
+            (unseeded, 128),
+            (far_along, 128),
+            (by_hand, 3000),
+        ]:
+            rng.random_float()
+            data = snapshot.dumps(rng, 1)
+            self.assertLess(len(data), max_size)
+            restored = snapshot.loads(data, 1)
+            self.assertEqual(rng.get_state(), restored.get_state())
+            self.assertEqual(rng.random_float(), restored.random_float())
+
+    def test_rejects_other_versions(self):
+        data = self._create_game().dumps()
+        with self.assertRaises(ValueError):
+            snapshot.loads(data, dg.ENGINE_VERSION + 1)
+        with self.assertRaises(ValueError):
+            dg.Game.loads(b"not a snapshot")
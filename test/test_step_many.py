@@ -0,0 +1,63 @@
+import unittest
+from test import test_utils as tu
+
+import decapitate_the_spire.game as dg
+
+
+class TestStepMany(unittest.TestCase):
+    def test_applies_every_action(self):
+        game = tu.create_game(initial_draw_pile_manifest={dg.Strike.recipe(): 6})
+        actions = [dg.ActionGenerator.play_card(0, 0)] * 2
+
+        reward, is_terminal, info, num_applied = game.step_many(actions)
+
+        self.assertEqual((0.0, False, {}, 2), (reward, is_terminal, info, num_applied))
+        self.assertEqual(
+            tu.default_monster_max_health - 12,
+            game.ctx.d.get_curr_room().monster_group[0].current_health,
+        )
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.CombatActionRequest
+        )
+
+    def test_stops_at_illegal_action(self):
+        game = tu.create_game(initial_draw_pile_manifest={dg.Strike.recipe(): 6})
+        strike = dg.ActionGenerator.play_card(0, 0)
+        # No potions to use
+        actions = [strike, dg.ActionGenerator.use_potion(0, None), strike]
+
+        reward, is_terminal, info, num_applied = game.step_many(actions)
+
+        self.assertEqual(1, num_applied)
+        self.assertFalse(is_terminal)
+        self.assertTrue(info["illegal"])
+        self.assertAlmostEqual(-0.001, reward)
+        self.assertEqual(
+            tu.default_monster_max_health - 6,
+            game.ctx.d.get_curr_room().monster_group[0].current_health,
+        )
+
+    def test_stops_when_request_type_changes(self):
+        game = tu.create_game(initial_draw_pile_manifest={dg.Survivor.recipe(): 10})
+        survivor = dg.ActionGenerator.play_card(0, None)
+
+        _, _, _, num_applied = game.step_many([survivor, survivor])
+
+        # Survivor asks for a discard, which the second action wasn't planned for
+        self.assertEqual(1, num_applied)
+        self.assertIsInstance(
+            game.ctx.action_manager.outstanding_request, dg.DiscardRequest
+        )
+
+    def test_stops_at_terminal_state(self):
+        game = tu.create_game(
+            player_hp=1, initial_draw_pile_manifest={dg.Defend.recipe(): 10}
+        )
+        actions = [dg.ActionGenerator.end_turn()] * 5
+
+        reward, is_terminal, info, num_applied = game.step_many(actions)
+
+        self.assertEqual(1, num_applied)
+        self.assertTrue(is_terminal)
+        self.assertFalse(info["win"])
+        self.assertEqual(-1.0, reward)
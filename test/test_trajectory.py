@@ -0,0 +1,193 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from decapitate_the_spire.trajectory import (
+    EPISODE_COLUMN,
+    TrajectoryDataset,
+    TrajectoryWriter,
+    read_manifest,
+)
+
+COLUMNS = TrajectoryWriter.default_columns(observation_shape=(3,))
+
+
+def _step(i, terminal=False):
+    mask = np.zeros(COLUMNS["mask"][1], bool)
+    mask[0, 0] = True
+    return dict(
+        observation=[i, i + 1, i + 2],
+        mask=mask,
+        action=(i % 7, -1),
+        reward=i / 2,
+        terminal=terminal,
+    )
+
+
+class TestTrajectoryWriter(unittest.TestCase):
+    def test_shards_and_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Each step is about 150 bytes, so a shard fills after two buffers
+            with TrajectoryWriter(
+                tmp, COLUMNS, shard_bytes=1500, buffer_steps=8
+            ) as writer:
+                for i in range(100):
+                    writer.append(**_step(i, terminal=i % 30 == 29))
+                writer.flush()
+                self.assertGreater(len(read_manifest(tmp)["shards"]), 0)
+
+            manifest = read_manifest(tmp)
+            self.assertEqual(100, manifest["num_steps"])
+            self.assertEqual(7, len(manifest["shards"]))
+            self.assertEqual(
+                [16] * 6 + [4], [s["num_steps"] for s in manifest["shards"]]
+            )
+            self.assertEqual(3, manifest["shards"][-1]["last_episode"])
+
+            columns = {
+                name: np.concatenate(
+                    [
+                        np.load(
+                            os.path.join(tmp, s["name"], f"{name}.npy"), mmap_mode="r"
+                        )
+                        for s in manifest["shards"]
+                    ]
+                )
+                for name in manifest["columns"]
+            }
+            np.testing.assert_array_equal(np.arange(100) // 30, columns[EPISODE_COLUMN])
+            self.assertEqual((100, 3), columns["observation"].shape)
+            self.assertEqual(np.float32, columns["observation"].dtype)
+            self.assertEqual(np.float32(41.5), columns["reward"][83])
+            np.testing.assert_array_equal([6, -1], columns["action"][13])
+            self.assertTrue(columns["mask"][:, 0, 0].all())
+            self.assertFalse(columns["mask"][:, 1:].any())
+            self.assertEqual(4, columns["terminal"].sum() + 1)
+
+    def test_end_episode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = TrajectoryWriter(tmp, COLUMNS, buffer_steps=4)
+            writer.end_episode()
+            writer.append(**_step(0))
+            writer.append(**_step(1, terminal=True))
+            writer.end_episode()
+            writer.append(**_step(2))
+            writer.end_episode()
+            writer.append(**_step(3))
+            writer.close()
+            writer.close()
+
+            shard = read_manifest(tmp)["shards"][0]
+            episodes = np.load(os.path.join(tmp, shard["name"], "episode.npy"))
+            np.testing.assert_array_equal([0, 0, 1, 2], episodes)
+            episode = TrajectoryDataset(tmp).episode(0)
+            self.assertIsInstance(episode["reward"], np.memmap)
+            np.testing.assert_array_equal([0, 0.5], episode["reward"])
+            with self.assertRaises(ValueError):
+                writer.append(**_step(4))
+
+    def test_bad_columns(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                TrajectoryWriter(tmp, {EPISODE_COLUMN: (np.int64, ())})
+            with TrajectoryWriter(tmp, COLUMNS) as writer:
+                with self.assertRaises(ValueError):
+                    writer.append(observation=[0, 0, 0])
+                with self.assertRaisesRegex(ValueError, "value"):
+                    writer.append(**_step(0), value=1.0)
+                with self.assertRaisesRegex(ValueError, EPISODE_COLUMN):
+                    writer.append(**_step(0), episode=3)
+                writer.append(**_step(0))
+            self.assertEqual(1, read_manifest(tmp)["shards"][0]["num_steps"])
+
+    def test_empty(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            TrajectoryWriter(tmp, COLUMNS).close()
+            dataset = TrajectoryDataset(tmp)
+            self.assertEqual(0, len(dataset))
+            self.assertEqual(0, len(dataset.episode_ids))
+            rng = np.random.default_rng(0)
+            with self.assertRaisesRegex(ValueError, "no steps"):
+                dataset.sample(1, rng)
+            with self.assertRaisesRegex(ValueError, "no steps"):
+                dataset.sample_prioritized(1, rng)
+
+    def test_existing_trajectory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with TrajectoryWriter(tmp, COLUMNS) as writer:
+                writer.append(**_step(0))
+            manifest = read_manifest(tmp)
+            with self.assertRaises(FileExistsError):
+                TrajectoryWriter(tmp, COLUMNS)
+            self.assertEqual(manifest, read_manifest(tmp))
+
+
+class TestTrajectoryDataset(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+        # Episodes of 30 steps in shards of 16, so episodes span shards
+        with TrajectoryWriter(
+            self.directory, COLUMNS, shard_bytes=1500, buffer_steps=8
+        ) as writer:
+            for i in range(100):
+                writer.append(**_step(i, terminal=i % 30 == 29))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_index(self):
+        dataset = TrajectoryDataset(self.directory)
+        self.assertEqual(100, len(dataset))
+        self.assertEqual(4, dataset.num_episodes)
+        np.testing.assert_array_equal([0, 1, 2, 3], dataset.episode_ids)
+        self.assertEqual(range(30, 60), dataset.episode_steps(1))
+        self.assertEqual(range(90, 100), dataset.episode_steps(3))
+
+        episode = dataset.episode(1)
+        np.testing.assert_array_equal(np.arange(30, 60) / 2, episode["reward"])
+        self.assertTrue(episode["terminal"][-1])
+        # Spans the last two shards, so is copied out of them
+        last = dataset.episode(3)["observation"]
+        self.assertNotIsInstance(last, np.memmap)
+        np.testing.assert_array_equal(np.arange(90, 100), last[:, 0])
+
+    def test_gather(self):
+        dataset = TrajectoryDataset(self.directory, columns=["observation"])
+        self.assertEqual({"observation", EPISODE_COLUMN}, dataset.columns.keys())
+        indices = np.array([99, 0, 17, 17, 45])
+        batch = dataset.gather(indices)
+        np.testing.assert_array_equal(indices, batch["observation"][:, 0])
+        np.testing.assert_array_equal(indices // 30, batch[EPISODE_COLUMN])
+        with self.assertRaises(IndexError):
+            dataset.gather([100])
+        with self.assertRaises(ValueError):
+            TrajectoryDataset(self.directory, columns=["value"])
+
+    def test_sample(self):
+        dataset = TrajectoryDataset(self.directory)
+        rng = np.random.default_rng(0)
+        out = dataset.gather(np.zeros(64, np.int64))
+        indices, batch = dataset.sample(64, rng, out=out)
+        self.assertIs(out, batch)
+        np.testing.assert_array_equal(indices / 2, batch["reward"])
+        self.assertGreater(len(set(indices)), 32)
+
+    def test_sample_prioritized(self):
+        dataset = TrajectoryDataset(self.directory)
+        rng = np.random.default_rng(0)
+        indices, batch, weights = dataset.sample_prioritized(50, rng)
+        np.testing.assert_array_equal(indices, batch["observation"][:, 0])
+        np.testing.assert_array_equal(np.ones(50), weights)
+
+        # Half of all priority on step 7
+        dataset.update_priorities([7, 7], [1.0, 99.0])
+        indices, _, weights = dataset.sample_prioritized(1000, rng)
+        self.assertAlmostEqual(0.5, np.mean(indices == 7), delta=0.01)
+        self.assertTrue((indices < 100).all())
+        self.assertEqual(1.0, weights.max())
+        self.assertLess(weights[indices == 7][0], weights[indices != 7][0])
+        with self.assertRaises(ValueError):
+            dataset.update_priorities([0], [0.0])